@@ -0,0 +1,92 @@
+"""Peak memory of the AST: node objects versus the flat node arena.
+
+Each mode runs in its own process so ru_maxrss is a clean peak:
+
+    objects   parse to a tree of (slotted) node objects, then generate code
+    arena     parse into NodeArena, then generate code statement by statement
+
+Peak RSS is sampled after parsing (the AST is complete and alive) and
+again after code generation, minus the RSS of an idle interpreter that
+has imported the compiler.
+
+Usage:
+    python3 benchmarks/bench_ast_memory.py [--statements N]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r"""
+import json, resource, sys, time
+sys.path.insert(0, {qklib!r})
+import quack_parser
+from quack_code_generator import QuackCodeGenerator
+
+def peak_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+mode, path = sys.argv[1], sys.argv[2]
+quack_parser.parse_to_arena('a: Int = 1;')     # build both parsers up front
+quack_parser.parse_code('a: Int = 1;')
+with open(path) as f:
+    text = f.read()
+base = peak_kb()
+start = time.perf_counter()
+if mode == 'arena':
+    ast = quack_parser.parse_to_arena(text)
+else:
+    ast = quack_parser.parse_with_symbols(text, {{}})
+parsed = peak_kb()
+parse_time = time.perf_counter() - start
+codegen = QuackCodeGenerator()
+if mode == 'arena':
+    ast.generate(codegen)
+else:
+    codegen.generate(ast)
+print(json.dumps({{'base': base, 'parsed': parsed, 'total': peak_kb(), 'parse_time': parse_time,
+                  'arena_bytes': ast.nbytes() if mode == 'arena' else None}}))
+"""
+
+
+def build_source(statements):
+    lines = [f'v{i}: Int = {i};' for i in range(50)]
+    for i in range(50, statements):
+        shape = i % 10
+        if shape == 0:
+            lines.append(f'if (v{i % 50} < {i}) {{ v{i % 50}: Int = v{i % 50} + 1; }} else {{ v1: Int = 2; }}')
+        elif shape == 1:
+            lines.append(f'while (v{i % 50} < {i % 7}) {{ v{i % 50}: Int = v{i % 50} + 1; }}')
+        else:
+            lines.append(f'v{i % 50}: Int = v{(i + 1) % 50} * {i} + v{(i + 2) % 50} - {i % 13};')
+    return '\n'.join(lines) + '\n'
+
+
+def main():
+    cli_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    cli_parser.add_argument('--statements', type=int, default=200_000)
+    args = cli_parser.parse_args()
+
+    path = os.path.join(ROOT, 'OBJ', f'bench_ast_{args.statements}.qk')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as out:
+        out.write(build_source(args.statements))
+
+    child = CHILD.format(qklib=os.path.join(ROOT, 'qklib'))
+    print(f'{"mode":<8} {"parse s":>8} {"AST peak MB":>12} {"total peak MB":>14} {"arena MB":>9}')
+    for mode in ('objects', 'arena'):
+        result = subprocess.run([sys.executable, '-c', child, mode, path],
+                                check=True, capture_output=True, text=True)
+        r = json.loads(result.stdout)
+        arena = f"{r['arena_bytes'] / 2**20:9.1f}" if r['arena_bytes'] else f'{"-":>9}'
+        print(f"{mode:<8} {r['parse_time']:>8.2f} {(r['parsed'] - r['base']) / 1024:>12.1f} "
+              f"{(r['total'] - r['base']) / 1024:>14.1f} {arena}")
+    os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
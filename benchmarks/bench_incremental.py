@@ -0,0 +1,86 @@
+"""Rebuild time after a one-statement edit: full versus incremental compile.
+
+Generates a program of --statements top-level statements (with a few
+function definitions), then times, in one process:
+
+    full         parse + type check + codegen of the whole file
+    cold         incremental compile into an empty unit cache
+    warm         incremental compile of the same file (all hits)
+    edited       incremental compile after changing one statement
+
+Usage:
+    python3 benchmarks/bench_incremental.py [--statements N]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'qklib'))
+
+from quack_cache import CompileCache, compile_incremental  # noqa: E402
+from quack_code_generator import QuackCodeGenerator  # noqa: E402
+from quack_parser import parse_with_symbols  # noqa: E402
+
+
+def build_source(statements, edit=0):
+    lines = [f'x{i}: Int = {i};' for i in range(300)]
+    for i in range(300, statements):
+        if i % 1000 == 0:
+            lines.append(f'def f{i}(): Int {{ return {i}; }}')
+        elif i % 200 == 0:
+            lines.append(f'while (x0 < {i}) {{ x0: Int = x0 + 1; }}')
+        else:
+            lines.append(f'x{i % 300}: Int = x{(i - 1) % 300} + {i};')
+    # The edited version changes a single statement in the middle
+    mid = statements // 2 + 1
+    if mid % 200:
+        lines[mid] = f'x{mid % 300}: Int = x{(mid - 1) % 300} - {edit};'
+    return '\n'.join(lines)
+
+
+def timed(label, fn):
+    start = time.perf_counter()
+    result = fn()
+    print(f'{label:<8} {time.perf_counter() - start:10.4f} s', end='')
+    return result
+
+
+def main():
+    cli_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    cli_parser.add_argument('--statements', type=int, default=20_000)
+    args = cli_parser.parse_args()
+
+    original = build_source(args.statements)
+    edited = build_source(args.statements, edit=1)
+
+    def full():
+        codegen = QuackCodeGenerator()
+        codegen.generate(parse_with_symbols(original, {}))
+        return codegen.get_code()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = os.path.join(tmp, 'units.sqlite')
+
+        def incremental(text):
+            cache = CompileCache(db)
+            try:
+                return compile_incremental(text, cache, parse_with_symbols).get_code(), cache
+            finally:
+                cache.close()
+
+        expected = timed('full', full)
+        print()
+        for label, text in (('cold', original), ('warm', original), ('edited', edited)):
+            code, cache = timed(label, lambda: incremental(text))
+            stats = cache.stats()
+            print(f"   {stats['hits']:>7} hits {stats['misses']:>7} misses {stats['bytes']:>12,} bytes")
+            if text is original and code != expected:
+                raise SystemExit('incremental output differs from a full compile')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""Build time of the SSA IR (quack_ir.py) against program size.
+
+For each size, gen_program.py writes a seeded program, which is parsed
+and optimized once; then, timed separately (best of --repeat):
+
+    cfg         basic blocks from the AST (build_program)
+    ssa         dominators, frontiers, phi placement, renaming and phi
+                cleanup for every function (to_ssa)
+    lower       back to VM instructions (lower_program)
+
+The table shows microseconds per statement, which stays flat while the
+build is linear.  The garbage collector is off while a phase is timed,
+as in timeit: its full collections walk the whole heap, AST included,
+and would otherwise make every phase look quadratic.  Exits 1 if the
+per-statement time of cfg + ssa at the largest size is more than
+--max-growth times that at the smallest.
+--check also runs each program compiled through the IR and straight
+from the AST for --steps instructions and exits 1 if their output
+differs.
+
+Usage:
+    python3 benchmarks/bench_ir.py [--sizes 1000 4000 16000 64000] [--shape mixed] [--check]
+"""
+
+import argparse
+import contextlib
+import gc
+import io
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'qklib'))
+
+from gen_program import SHAPES, generate  # noqa: E402
+from quack_ir import build_program, lower_program, to_ssa, verify  # noqa: E402
+from quack_optimizer import DEFAULT_LEVEL, optimize  # noqa: E402
+from quack_parser import compile_ir, compile_tree, parse_with_symbols  # noqa: E402
+from vm import VM, assemble  # noqa: E402
+
+
+def timed(thunk):
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        result = thunk()
+        return time.perf_counter() - start, result
+    finally:
+        gc.enable()
+
+
+def to_ssa_all(program):
+    for function in program.functions:
+        to_ssa(function)
+    return program
+
+
+def output(codegen, steps):
+    vm = VM(assemble(codegen.get_code()))
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        try:
+            vm.run(steps)
+        except Exception as e:
+            print(f'{type(e).__name__}: {e}')
+    return out.getvalue()
+
+
+def main():
+    cli_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    cli_parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 4000, 16000, 64000],
+                            help='statements per generated program')
+    cli_parser.add_argument('--shape', choices=SHAPES, default='mixed')
+    cli_parser.add_argument('--seed', type=int, default=0)
+    cli_parser.add_argument('--repeat', type=int, default=3, help='runs per phase; the best is kept')
+    cli_parser.add_argument('--max-growth', type=float, default=2.0,
+                            help='allowed growth of the per-statement build time')
+    cli_parser.add_argument('--check', action='store_true',
+                            help='verify the SSA form and compare program output with the AST path')
+    cli_parser.add_argument('--steps', type=int, default=1_000_000,
+                            help='VM instruction budget of --check')
+    args = cli_parser.parse_args()
+
+    print(f'{"statements":>10} {"blocks":>8} {"phis":>7} {"cfg us":>8} {"ssa us":>8}'
+          f' {"lower us":>9}   (per statement)')
+    per_statement = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            path = os.path.join(tmp, 'generated.qk')
+            statements = generate(path, size, args.shape, args.seed)
+            with open(path) as f:
+                source = f.read()
+            tree, _ = optimize(parse_with_symbols(source, {}), DEFAULT_LEVEL)
+            best = {}
+            for _ in range(args.repeat):
+                seconds = {}
+                seconds['cfg'], program = timed(lambda: build_program(tree))
+                seconds['ssa'], _ = timed(lambda: to_ssa_all(program))
+                seconds['lower'], _ = timed(lambda: lower_program(program))
+                for phase, value in seconds.items():
+                    best[phase] = min(best.get(phase, value), value)
+            stats = program.stats()
+            micro = {phase: value / statements * 1e6 for phase, value in best.items()}
+            per_statement.append(micro['cfg'] + micro['ssa'])
+            print(f'{statements:>10} {stats["blocks"]:>8} {stats["phis"]:>7} {micro["cfg"]:>8.2f}'
+                  f' {micro["ssa"]:>8.2f} {micro["lower"]:>9.2f}')
+            if args.check:
+                for function in program.functions:
+                    verify(function)
+                through_ir, _ = compile_ir(parse_with_symbols(source, {}))
+                from_ast, _ = compile_tree(parse_with_symbols(source, {}))
+                if output(through_ir, args.steps) != output(from_ast, args.steps):
+                    sys.exit(f'{size} statements: output through the IR differs')
+
+    growth = per_statement[-1] / per_statement[0]
+    print(f'cfg + ssa per statement: {growth:.2f}x from {args.sizes[0]} to {args.sizes[-1]} statements')
+    if growth > args.max_growth:
+        sys.exit(f'build time grows faster than the program (more than {args.max_growth}x)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+"""Program load time: text assembly versus the mmap'd .qko object file.
+
+Builds a straight-line program of --statements assignments, compiles it
+once, writes both formats to a temporary directory and times vm.load
+on each.  Text assembly has to be tokenized and assembled on every
+load; the object file only has its header and tables decoded.
+
+Usage:
+    python3 benchmarks/bench_load.py [--statements N] [--repeat R]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'qklib'))
+
+from quack_code_generator import QuackCodeGenerator  # noqa: E402
+from quack_parser import parse_code  # noqa: E402
+from vm import VM, load, save_object, assemble  # noqa: E402
+
+
+def build_source(statements):
+    lines = ['x0: Int = 1;']
+    for i in range(1, statements):
+        lines.append(f'x{i % 500}: Int = x{(i - 1) % 500} + {i};')
+    return '\n'.join(lines)
+
+
+def best_time(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    cli_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    cli_parser.add_argument('--statements', type=int, default=100_000)
+    cli_parser.add_argument('--repeat', type=int, default=5)
+    args = cli_parser.parse_args()
+
+    codegen = QuackCodeGenerator()
+    codegen.generate(parse_code(build_source(args.statements)))
+    asm = codegen.get_code()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        asm_path = os.path.join(tmp, 'prog.asm')
+        qko_path = os.path.join(tmp, 'prog.qko')
+        with open(asm_path, 'w') as out:
+            out.write(asm)
+        save_object(assemble(asm), qko_path)
+
+        print(f'{"format":<8} {"bytes":>12} {"load seconds":>14} {"instructions":>14}')
+        for name, path in (('asm', asm_path), ('qko', qko_path)):
+            elapsed, program = best_time(lambda: load(path), args.repeat)
+            print(f'{name:<8} {os.path.getsize(path):>12,} {elapsed:>14.5f} {len(program):>14,}')
+            vm = VM(program)
+            vm.run()
+            del vm, program
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+"""VM instructions with and without the loop optimizations of quack_loops.py.
+
+Every program is compiled at -O2 three ways: straight from the AST, through
+the SSA IR without the loop passes, and through the IR with them
+(invariant code motion and strength reduction).  The table shows static
+instruction counts and the instructions the VM dispatched running each
+version to completion, and the loops' hoisted and reduced expressions.
+The built-in programs are counted loops with invariant expressions, a
+stride computed from i * 4 three times per iteration, two nested loops
+and loops that never run, whose invariant code must not run either
+(a division by zero stays in the loop); --generated adds seeded programs of gen_program.py's nested shape
+(--trip iterations per loop).  Exits 1 if the versions print different
+output.
+
+Usage:
+    python3 benchmarks/bench_loops.py [--n N] [--generated 3] [--trip 4] [file.qk ...]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'qklib'))
+
+from gen_program import generate  # noqa: E402
+from quack_loops import format_report  # noqa: E402
+from quack_optimizer import count_instructions  # noqa: E402
+from quack_parser import compile_ir, compile_tree, parse_with_symbols  # noqa: E402
+from vm import VM, assemble  # noqa: E402
+
+INVARIANT = """
+i: Int = 0;
+a: Int = 7;
+b: Int = 3;
+x: Int = 0;
+total: Int = 0;
+s: String = "row";
+t: String = "";
+while (i < {n}) {{
+    x: Int = a * b + 4 - a;
+    t: String = s + "-" + s;
+    total: Int = total + x + i;
+    i: Int = i + 1;
+}}
+print(total);
+print(t);
+"""
+
+STRIDE = """
+i: Int = 0;
+lo: Int = 0;
+hi: Int = 0;
+mid: Int = 0;
+total: Int = 0;
+while (i < {n}) {{
+    lo: Int = i * 4;
+    mid: Int = i * 4 + 1;
+    hi: Int = i * 4 + 3;
+    total: Int = total + lo + mid + hi;
+    i: Int = i + 1;
+}}
+print(total);
+"""
+
+NESTED = """
+i: Int = 0;
+j: Int = 0;
+n: Int = 100;
+row: Int = 0;
+s: Int = 0;
+while (i < {outer}) {{
+    j: Int = 0;
+    while (j < n) {{
+        row: Int = i * n + 17;
+        s: Int = s + row + j;
+        j: Int = j + 1;
+    }}
+    i: Int = i + 1;
+}}
+print(s);
+"""
+
+ZERO_TRIP = """
+n: Int = {n};
+d: Int = n - {n};
+k: Int = 0;
+i: Int = 0;
+c: Bool = n < 0;
+s: String = n.string();
+t: String = "";
+q: Int = 0;
+while (c) {{
+    q: Int = n / d;
+    t: String = s + "-" + s;
+    k: Int = n * 3 + 1;
+    c: Bool = false;
+}}
+while (i < d) {{
+    k: Int = i * 4 + k;
+    i: Int = i + 1;
+}}
+print(q);
+print(t);
+print(k);
+"""
+
+
+def run(codegen):
+    """(instructions in the code, instructions dispatched, output)"""
+    code = codegen.get_code()
+    vm = VM(assemble(code))
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        try:
+            vm.run()
+        except Exception as e:
+            print(f'{type(e).__name__}: {e}')
+    return count_instructions(code), vm.steps, out.getvalue()
+
+
+def main():
+    cli_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    cli_parser.add_argument('files', nargs='*', help='terminating Quack programs')
+    cli_parser.add_argument('--n', type=int, default=100_000,
+                            help='iterations of the built-in loops (default 100,000)')
+    cli_parser.add_argument('--generated', type=int, default=3, metavar='N',
+                            help='also run N seeded programs of the nested shape')
+    cli_parser.add_argument('--statements', type=int, default=2000,
+                            help='statements per generated program')
+    cli_parser.add_argument('--trip', type=int, default=4,
+                            help='iterations of each loop in generated programs')
+    cli_parser.add_argument('--report', action='store_true',
+                            help='also print the loop report of every program')
+    args = cli_parser.parse_args()
+
+    programs = [(f'invariant (n={args.n})', INVARIANT.format(n=args.n)),
+                (f'stride (n={args.n})', STRIDE.format(n=args.n)),
+                (f'nested ({args.n // 100}x100)', NESTED.format(outer=args.n // 100)),
+                ('zero-trip', ZERO_TRIP.format(n=args.n))]
+    with tempfile.TemporaryDirectory() as tmp:
+        for seed in range(args.generated):
+            path = os.path.join(tmp, 'generated.qk')
+            generate(path, args.statements, 'nested', seed, trip=args.trip)
+            with open(path) as f:
+                programs.append((f'generated nested seed {seed}', f.read()))
+    for path in args.files:
+        with open(path) as source:
+            programs.append((os.path.relpath(path, ROOT), source.read()))
+
+    print(f'{"program":<28} {"static":>7} {"loops":>7} {"ast":>12} {"ir":>12} {"loops":>12}'
+          f' {"saved":>7} {"hoisted":>8} {"reduced":>8}')
+    mismatches = 0
+    for name, text in programs:
+        from_ast = run(compile_tree(parse_with_symbols(text, {}), 2)[0])
+        plain = run(compile_ir(parse_with_symbols(text, {}), 2, loops=False)[0])
+        codegen, stats = compile_ir(parse_with_symbols(text, {}), 2)
+        optimized = run(codegen)
+        reports = stats['loop_report']
+        hoisted = sum(report['moved'] for report in reports)
+        reduced = sum(len(report['reduced']) for report in reports)
+        print(f'{name:<28} {plain[0]:>7} {optimized[0]:>7} {from_ast[1]:>12,} {plain[1]:>12,}'
+              f' {optimized[1]:>12,} {100 * (1 - optimized[1] / plain[1]):>6.1f}%'
+              f' {hoisted:>8} {reduced:>8}')
+        if not from_ast[2] == plain[2] == optimized[2]:
+            mismatches += 1
+            print(f'{name}: output differs between the three versions', file=sys.stderr)
+        if args.report:
+            for line in format_report(reports):
+                print(f'  {line}')
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
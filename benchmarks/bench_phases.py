@@ -0,0 +1,198 @@
+"""Per-phase time and peak memory of the compiler and VM on generated programs.
+
+For each shape and size, gen_program.py writes a seeded program and the
+pipeline runs one phase at a time:
+
+    read        read the source file
+    parse       LALR parse into a lark tree (no transformer)
+    typecheck   QuackTransformer over that tree (builds the AST, infers types)
+    optimize    AST folding and, at -O2, dead code elimination
+    codegen     QuackCodeGenerator
+    lower       peephole, slot allocation and superinstruction fusion
+    emit        get_code (text assembly)
+    assemble    text assembly to a VM Program
+    vm          run under --steps instructions
+
+Times are the best of --repeat runs; peak memory is the tracemalloc peak
+during the phase, measured in a separate run (tracing slows everything
+down).  --json writes the results; --baseline compares against an
+earlier file and exits 1 if any phase got slower (or larger) by more
+than --threshold.  1M statements need several GB for the whole-file
+compile (see quack_parser.py --stream).
+
+Usage:
+    python3 benchmarks/bench_phases.py --sizes 1000 10000 100000 --json out.json
+    python3 benchmarks/bench_phases.py --repeat 3 --baseline base.json --threshold 0.15
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'qklib'))
+
+from gen_program import SHAPES, generate  # noqa: E402
+from quack_code_generator import QuackCodeGenerator  # noqa: E402
+from quack_optimizer import DEFAULT_LEVEL, optimize  # noqa: E402
+from quack_parser import build_parser, optimize_code  # noqa: E402
+from quack_transformer import QuackTransformer  # noqa: E402
+from vm import VM, assemble  # noqa: E402
+
+PHASES = ['read', 'parse', 'typecheck', 'optimize', 'codegen', 'lower', 'emit', 'assemble', 'vm']
+
+
+def pipeline(path, parser, level, steps):
+    """(phase, thunk) pairs; each thunk runs its phase on the previous result"""
+    state = {}
+
+    def read():
+        with open(path) as source:
+            state['text'] = source.read()
+
+    def parse():
+        state['tree'] = parser.parse(state.pop('text'))
+
+    def typecheck():
+        state['ast'] = QuackTransformer().transform(state.pop('tree'))
+
+    def optimize_ast():
+        state['ast'], _ = optimize(state['ast'], level)
+
+    def codegen():
+        state['codegen'] = QuackCodeGenerator()
+        state['codegen'].generate(state.pop('ast'))
+
+    def lower():
+        optimize_code(state['codegen'], level)
+
+    def emit():
+        state['code'] = state.pop('codegen').get_code()
+
+    def assemble_code():
+        state['program'] = assemble(state.pop('code'))
+
+    def run():
+        vm = VM(state.pop('program'))
+        with contextlib.redirect_stdout(io.StringIO()):
+            vm.run(steps)
+        state['steps'] = vm.steps
+
+    return list(zip(PHASES, [read, parse, typecheck, optimize_ast, codegen, lower,
+                             emit, assemble_code, run]))
+
+
+def time_phases(path, parser, level, steps):
+    times = {}
+    for phase, thunk in pipeline(path, parser, level, steps):
+        start = time.perf_counter()
+        thunk()
+        times[phase] = time.perf_counter() - start
+    return times
+
+
+def memory_phases(path, parser, level, steps):
+    peaks = {}
+    tracemalloc.start()
+    try:
+        for phase, thunk in pipeline(path, parser, level, steps):
+            tracemalloc.reset_peak()
+            thunk()
+            peaks[phase] = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+
+def commit_id():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold, min_seconds):
+    """Lines describing every phase that regressed against baseline"""
+    before = {(r['shape'], r['statements'], r['phase']): r for r in baseline['results']}
+    regressions = []
+    for r in results:
+        old = before.get((r['shape'], r['statements'], r['phase']))
+        if old is None:
+            continue
+        name = f"{r['shape']}/{r['statements']}/{r['phase']}"
+        if (r['seconds'] - old['seconds'] > min_seconds
+                and r['seconds'] > old['seconds'] * (1 + threshold)):
+            regressions.append(f"{name}: {old['seconds']:.4f}s -> {r['seconds']:.4f}s")
+        if (r.get('peak_bytes') and old.get('peak_bytes')
+                and r['peak_bytes'] > old['peak_bytes'] * (1 + threshold)):
+            regressions.append(f"{name}: peak {old['peak_bytes']:,} -> {r['peak_bytes']:,} bytes")
+    return regressions
+
+
+def main():
+    cli_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    cli_parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000],
+                            help='statements per generated program (default 1000 10000)')
+    cli_parser.add_argument('--shapes', nargs='+', choices=SHAPES, default=SHAPES)
+    cli_parser.add_argument('--seed', type=int, default=0)
+    cli_parser.add_argument('-O', dest='opt_level', type=int, default=DEFAULT_LEVEL)
+    cli_parser.add_argument('--steps', type=int, default=5_000_000,
+                            help='VM instruction budget per program')
+    cli_parser.add_argument('--repeat', type=int, default=1, help='timed runs; the best is kept')
+    cli_parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc run')
+    cli_parser.add_argument('--json', help='write the results to this file')
+    cli_parser.add_argument('--baseline', help='results file of an earlier run to compare against')
+    cli_parser.add_argument('--threshold', type=float, default=0.20,
+                            help='relative slowdown reported as a regression (default 0.20)')
+    cli_parser.add_argument('--min-seconds', type=float, default=0.005,
+                            help='ignore slowdowns smaller than this, as timer noise')
+    args = cli_parser.parse_args()
+
+    parser = build_parser(None)
+    results = []
+    print(f'{"shape":<8} {"statements":>10} ' + ' '.join(f'{p:>9}' for p in PHASES) + '  peak MB')
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'generated.qk')
+        for shape in args.shapes:
+            for size in args.sizes:
+                generate(path, size, shape, args.seed)
+                times = {}
+                for _ in range(args.repeat):
+                    for phase, seconds in time_phases(path, parser, args.opt_level, args.steps).items():
+                        times[phase] = min(seconds, times.get(phase, seconds))
+                peaks = {} if args.no_memory else memory_phases(path, parser, args.opt_level, args.steps)
+                for phase in PHASES:
+                    results.append({'shape': shape, 'statements': size, 'phase': phase,
+                                    'seconds': times[phase], 'peak_bytes': peaks.get(phase)})
+                peak = max(peaks.values(), default=0) / 2**20
+                print(f'{shape:<8} {size:>10,} ' + ' '.join(f'{times[p]:>9.4f}' for p in PHASES)
+                      + f'  {peak:7.1f}')
+
+    report = {'commit': commit_id(), 'python': platform.python_version(), 'seed': args.seed,
+              'opt_level': args.opt_level, 'steps': args.steps, 'time': time.time(),
+              'results': results}
+    if args.json:
+        with open(args.json, 'w') as out:
+            json.dump(report, out, indent=1)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, args.min_seconds)
+        for line in regressions:
+            print(f'REGRESSION {line}')
+        if regressions:
+            sys.exit(1)
+        print(f"no regressions against {args.baseline} ({baseline.get('commit')})")
+
+
+if __name__ == '__main__':
+    main()
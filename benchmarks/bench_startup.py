@@ -0,0 +1,83 @@
+"""Compiler startup: cold versus warm LALR parser-table cache.
+
+Runs quack_parser.py as a fresh process on one sample, first against an
+empty cache directory each time (cold: grammar analysed and tables
+built) and then against a populated one (warm: tables unpickled).
+Also reports in-process parser construction time for both cases, which
+isolates the part the cache removes from interpreter and import cost.
+
+Usage:
+    python3 benchmarks/bench_startup.py [--runs N] [sample.qk]
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COMPILER = os.path.join(ROOT, 'qklib', 'quack_parser.py')
+DEFAULT_SAMPLE = os.path.join(ROOT, 'samples', 'BasicFunction', 'test1_Int.qk')
+
+BUILD_SNIPPET = """
+import time
+import quack_parser
+from quack_transformer import QuackTransformer
+start = time.perf_counter()
+quack_parser.build_parser(QuackTransformer())
+print(time.perf_counter() - start)
+"""
+
+
+def run_compile(sample, cache_dir, output):
+    env = dict(os.environ, QUACK_CACHE_DIR=cache_dir)
+    start = time.perf_counter()
+    subprocess.run([sys.executable, COMPILER, sample, '-o', output], env=env, check=True)
+    return time.perf_counter() - start
+
+
+def build_time(cache_dir, cached=True):
+    # Importing quack_parser builds the parser once already, so the cold
+    # case has to switch the cache off rather than just empty it
+    env = dict(os.environ, QUACK_CACHE_DIR=cache_dir, QUACK_PARSER_CACHE='1' if cached else '0')
+    result = subprocess.run([sys.executable, '-c', BUILD_SNIPPET], env=env, check=True,
+                            cwd=os.path.join(ROOT, 'qklib'), capture_output=True, text=True)
+    return float(result.stdout)
+
+
+def summarize(label, times):
+    times = sorted(times)
+    print(f'{label:<28} min {times[0] * 1000:8.2f} ms   median {times[len(times) // 2] * 1000:8.2f} ms')
+
+
+def main():
+    cli_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    cli_parser.add_argument('sample', nargs='?', default=DEFAULT_SAMPLE)
+    cli_parser.add_argument('--runs', type=int, default=10)
+    args = cli_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, 'out.asm')
+        cache_dir = os.path.join(tmp, 'cache')
+
+        cold, cold_build = [], []
+        for _ in range(args.runs):
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            cold.append(run_compile(args.sample, cache_dir, output))
+            cold_build.append(build_time(cache_dir, cached=False))
+
+        run_compile(args.sample, cache_dir, output)
+        warm = [run_compile(args.sample, cache_dir, output) for _ in range(args.runs)]
+        warm_build = [build_time(cache_dir) for _ in range(args.runs)]
+
+    summarize('cold compile (process)', cold)
+    summarize('warm compile (process)', warm)
+    summarize('cold parser construction', cold_build)
+    summarize('warm parser construction', warm_build)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Peak memory of whole-file vs streaming compilation as the input grows.
+
+Generates programs of increasing length (the same few statement shapes
+over a fixed set of variables, with an occasional def), compiles each
+one both ways into a temporary file and reports the tracemalloc peak.
+The whole-file peak grows with the input; the streaming one should not.
+
+Usage:
+    python3 benchmarks/bench_stream.py [--sizes 1000 3000 10000] [--vars 50]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'qklib'))
+
+from quack_parser import compile_tree, parse_with_symbols, write_output  # noqa: E402
+from quack_stream import compile_stream  # noqa: E402
+
+
+def generate(path, statements, names):
+    with open(path, 'w') as out:
+        for i in range(names):
+            out.write(f'v{i}: Int = {i};\n')
+        for i in range(statements):
+            a, b = f'v{i % names}', f'v{(i * 7 + 3) % names}'
+            if i % 500 == 0:
+                out.write(f'def f{i}(): Int {{\n    return {a} * 2;\n}}\n')
+            elif i % 3 == 0:
+                out.write(f'if ({a} < {b}) {{\n    {a}: Int = {a} + 1;\n}}\n')
+            else:
+                out.write(f'{a}: Int = {b} * 3 + {i};\n')
+        out.write('print(v0);\n')
+
+
+def whole_file(source, output):
+    with open(source) as f:
+        codegen, _ = compile_tree(parse_with_symbols(f.read(), {}))
+    write_output(codegen.get_code(), output)
+
+
+def streaming(source, output):
+    with open(output, 'w') as out:
+        compile_stream(source, out, parse_with_symbols)
+
+
+def measure(compile_file, source, output):
+    tracemalloc.start()
+    start = time.perf_counter()
+    compile_file(source, output)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, elapsed
+
+
+def main():
+    cli_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    cli_parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 3000, 10000],
+                            help='statements per generated program')
+    cli_parser.add_argument('--vars', type=int, default=50, help='distinct variables')
+    args = cli_parser.parse_args()
+
+    print(f'{"statements":>10} {"source":>10} {"whole peak":>12} {"stream peak":>12}'
+          f' {"whole s":>8} {"stream s":>8}')
+    with tempfile.TemporaryDirectory() as tmp:
+        source, output = os.path.join(tmp, 'big.qk'), os.path.join(tmp, 'big.asm')
+        for size in args.sizes:
+            generate(source, size, args.vars)
+            whole_peak, whole_time = measure(whole_file, source, output)
+            stream_peak, stream_time = measure(streaming, source, output)
+            print(f'{size:>10,} {os.path.getsize(source) // 1024:>8,}KB'
+                  f' {whole_peak // 1024:>10,}KB {stream_peak // 1024:>10,}KB'
+                  f' {whole_time:>8.2f} {stream_time:>8.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+"""Dispatch count and wall time with and without superinstructions.
+
+Each program is compiled twice at -O1: once with every peephole rule and
+once without the fusion rules (inc_local, load_load_add, cmp_jump).  Both
+versions run to completion and the instructions dispatched and the best
+wall time are compared.
+
+Usage:
+    python3 benchmarks/bench_superinstructions.py [--n N] [--repeat R] [file.qk ...]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'qklib'))
+
+from quack_parser import compile_tree, parse_with_symbols  # noqa: E402
+from quack_peephole import FUSION_RULES, RULES, PeepholeOptimizer  # noqa: E402
+from vm import VM, assemble  # noqa: E402
+
+COUNTING_LOOP = """
+i: Int = 0;
+total: Int = 0;
+while (i < {n}) {{
+    total: Int = i * 2 + total;
+    i: Int = i + 1;
+}}
+print(total);
+"""
+
+NESTED_LOOPS = """
+i: Int = 0;
+s: Int = 0;
+while (i < {outer}) {{
+    j: Int = 0;
+    while (j < 100) {{
+        s: Int = s + j;
+        j: Int = j + 1;
+    }}
+    i: Int = i + 1;
+}}
+print(s);
+"""
+
+
+def compile_program(text, rules):
+    codegen, _ = compile_tree(parse_with_symbols(text, {}), 1, PeepholeOptimizer(rules))
+    return assemble(codegen.get_code())
+
+
+def run(program, repeat):
+    best = None
+    for _ in range(repeat):
+        vm = VM(program)
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            vm.run()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return vm.steps, best
+
+
+def main():
+    cli_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    cli_parser.add_argument('files', nargs='*', help='terminating Quack programs')
+    cli_parser.add_argument('--n', type=int, default=200_000,
+                            help='iterations of the built-in loops (default 200,000)')
+    cli_parser.add_argument('--repeat', type=int, default=3,
+                            help='runs per version; the best time is reported')
+    args = cli_parser.parse_args()
+
+    programs = [(f'counting loop (n={args.n})', COUNTING_LOOP.format(n=args.n)),
+                (f'nested loops ({args.n // 100}x100)', NESTED_LOOPS.format(outer=args.n // 100))]
+    for path in args.files:
+        with open(path) as source:
+            programs.append((os.path.relpath(path, ROOT), source.read()))
+
+    plain_rules = [rule for rule in RULES if rule not in FUSION_RULES]
+    print(f'{"program":<32} {"dispatches":>12} {"fused":>12} {"saved":>7}'
+          f' {"seconds":>9} {"fused":>9} {"speedup":>8}')
+    for name, text in programs:
+        plain_steps, plain_time = run(compile_program(text, plain_rules), args.repeat)
+        fused_steps, fused_time = run(compile_program(text, RULES), args.repeat)
+        print(f'{name:<32} {plain_steps:>12,} {fused_steps:>12,}'
+              f' {100 * (1 - fused_steps / plain_steps):>6.1f}%'
+              f' {plain_time:>9.4f} {fused_time:>9.4f} {plain_time / fused_time:>7.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""Interpreter vs tiered execution (vm.py --tier) on loop-heavy programs.
+
+Each program is compiled once and run both ways; the outputs must
+match.  The tiered time includes translating and compiling the hot
+regions, so short programs show the cost of tiering up as well.
+
+    count     a counting loop summing its index
+    nested    two nested loops with Int arithmetic and a comparison
+    calls     a loop calling two small functions (user calls between
+              compiled methods)
+    strings   a loop concatenating strings and printing every so often
+    generated gen_program.py --shape nested with a higher trip count
+
+Usage:
+    python3 benchmarks/bench_tier.py [--scale 1] [--threshold 50] [--repeat 3]
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'qklib'))
+
+from gen_program import generate  # noqa: E402
+from quack_parser import compile_tree, parse_with_symbols  # noqa: E402
+from quack_tier import DEFAULT_THRESHOLD, TieredVM  # noqa: E402
+from vm import VM, assemble  # noqa: E402
+
+PROGRAMS = {
+    'count': '''
+i: Int = 0;
+total: Int = 0;
+while (i < {n}) {{
+    total: Int = total + i;
+    i: Int = i + 1;
+}}
+print(total);
+''',
+    'nested': '''
+i: Int = 0;
+hits: Int = 0;
+while (i < {m}) {{
+    j: Int = 0;
+    while (j < 100) {{
+        d: Int = i * j - hits;
+        if (d < j) {{
+            hits: Int = hits + 1;
+        }}
+        j: Int = j + 1;
+    }}
+    i: Int = i + 1;
+}}
+print(hits);
+''',
+    'calls': '''
+p0: Int = 0;
+p1: Int = 0;
+def sq(p0: Int, p1: Int): Int {{
+    return p0 * p1;
+}}
+def twice(p0: Int, p1: Int): Int {{
+    u: Int = sq(p0, p0);
+    v: Int = sq(p1, p1);
+    return u + v;
+}}
+i: Int = 0;
+t: Int = 0;
+while (i < {k}) {{
+    w: Int = twice(i, i + 1);
+    t: Int = w - t;
+    i: Int = i + 1;
+}}
+print(t);
+''',
+    'strings': '''
+i: Int = 0;
+j: Int = 0;
+s: String = "";
+while (i < {k}) {{
+    s: String = "ab";
+    s: String = s + "cd" + s;
+    j: Int = j + 1;
+    if (j == 1000) {{
+        print(s);
+        j: Int = 0;
+    }}
+    i: Int = i + 1;
+}}
+''',
+}
+
+
+def compile_source(text):
+    codegen, _ = compile_tree(parse_with_symbols(text, {}))
+    return codegen.get_code()
+
+
+def run(code, make_vm):
+    vm = make_vm(assemble(code))
+    out = io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(out):
+        vm.run()
+    return time.perf_counter() - start, out.getvalue(), vm
+
+
+def main():
+    cli_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    cli_parser.add_argument('--scale', type=float, default=1.0, help='multiply every trip count')
+    cli_parser.add_argument('--threshold', type=int, default=DEFAULT_THRESHOLD)
+    cli_parser.add_argument('--repeat', type=int, default=3, help='runs per mode; the best is kept')
+    args = cli_parser.parse_args()
+
+    sizes = {'n': int(200_000 * args.scale), 'm': int(2_000 * args.scale),
+             'k': int(50_000 * args.scale)}
+    sources = {name: template.format(**sizes) for name, template in PROGRAMS.items()}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'generated.qk')
+        generate(path, 2000, 'nested', seed=0, trip=int(8 * args.scale) or 1)
+        with open(path) as f:
+            sources['generated'] = f.read()
+
+    print(f'{"program":<10} {"interp s":>9} {"tiered s":>9} {"speedup":>8} {"compiled":>9}'
+          f' {"fallback":>9}')
+    for name, source in sources.items():
+        code = compile_source(source)
+        interp = tiered = None
+        for _ in range(args.repeat):
+            seconds, expected, _ = run(code, VM)
+            interp = min(interp or seconds, seconds)
+            seconds, output, vm = run(code, lambda program: TieredVM(program, args.threshold))
+            tiered = min(tiered or seconds, seconds)
+            if output != expected:
+                sys.exit(f'{name}: tiered output differs from the interpreter')
+        print(f'{name:<10} {interp:>9.4f} {tiered:>9.4f} {interp / tiered:>7.1f}x'
+              f' {len(vm.compiled):>9} {len(vm.failed):>9}')
+
+
+if __name__ == '__main__':
+    main()
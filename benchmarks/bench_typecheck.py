@@ -0,0 +1,87 @@
+"""Type-checking cost on long left-nested expression chains.
+
+Parses (and therefore type-checks, since QuackTransformer runs inline
+with the LALR parser) `x: Int = a + a - a + ...` with 1k to 100k terms.
+The same inputs are run through a transformer that re-infers subtree
+types recursively, as get_type did before types were memoized on the
+nodes, for comparison.  The slope column is the fitted exponent between
+consecutive sizes: ~1 is linear, ~2 quadratic.
+
+Usage:
+    python3 benchmarks/bench_typecheck.py [--sizes 1000,10000,100000] [--budget 20]
+"""
+
+import argparse
+import math
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'qklib'))
+
+from quack_ast import Add, Div, Mul, Sub  # noqa: E402
+from quack_parser import build_parser  # noqa: E402
+from quack_transformer import QuackTransformer  # noqa: E402
+
+
+class RecursiveTransformer(QuackTransformer):
+    """get_type without memoization: every query walks the whole subtree"""
+    def get_type(self, node):
+        if isinstance(node, (Add, Sub, Mul, Div)):
+            left_type = self.get_type(node.left)
+            right_type = self.get_type(node.right)
+            return left_type if left_type == right_type else 'Obj'
+        return self.infer_type(node)
+
+
+def chain(terms):
+    ops = ['+', '-']
+    body = ' '.join(f'{ops[i % 2]} a' for i in range(1, terms))
+    return f'a: Int = 1;\nx: Int = a {body};\n'
+
+
+def measure(parser, transformer, source):
+    transformer.symbols = {}
+    start = time.perf_counter()
+    parser.parse(source)
+    return time.perf_counter() - start
+
+
+def main():
+    cli_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    cli_parser.add_argument('--sizes', default='1000,2000,5000,10000,20000,50000,100000')
+    cli_parser.add_argument('--budget', type=float, default=20.0,
+                            help='skip larger recursive runs once one takes this many seconds')
+    args = cli_parser.parse_args()
+    sizes = [int(n) for n in args.sizes.split(',')]
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 4 * max(sizes) + 1000))
+
+    memo_transformer = QuackTransformer()
+    memo_parser = build_parser(memo_transformer)
+    rec_transformer = RecursiveTransformer()
+    rec_parser = build_parser(rec_transformer)
+
+    print(f'{"terms":>8} {"memoized s":>11} {"slope":>6} {"recursive s":>12} {"slope":>6}')
+    prev = None
+    skip_recursive = False
+    for n in sizes:
+        source = chain(n)
+        memo = measure(memo_parser, memo_transformer, source)
+        rec = None
+        if not skip_recursive:
+            rec = measure(rec_parser, rec_transformer, source)
+            skip_recursive = rec > args.budget
+
+        def slope(t, t_prev):
+            if prev is None or t is None or t_prev is None:
+                return '-'
+            return f'{math.log(t / t_prev) / math.log(n / prev[0]):.2f}'
+
+        print(f'{n:>8} {memo:>11.4f} {slope(memo, prev and prev[1]):>6} '
+              f'{rec if rec is not None else float("nan"):>12.4f} {slope(rec, prev and prev[2]):>6}')
+        prev = (n, memo, rec)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""Throughput benchmark for qklib/vm.py.
+
+Compiles each program, assembles it once, then runs it under an
+instruction budget and reports instructions per second.  Some samples
+(test6_While.qk) never terminate, so the budget is what bounds them.
+
+Usage:
+    python3 benchmarks/bench_vm.py [--steps N] [--repeat R] [file.qk ...]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'qklib'))
+
+from quack_code_generator import QuackCodeGenerator  # noqa: E402
+from quack_parser import parse_code  # noqa: E402
+from vm import VM, assemble  # noqa: E402
+
+DEFAULT_SAMPLES = [
+    os.path.join(ROOT, 'samples', 'BasicFunction', 'test6_While.qk'),
+]
+
+# A terminating loop with arithmetic and a comparison in the condition
+COUNTING_LOOP = """
+i: Int = 0;
+total: Int = 0;
+while (i < {n}) {{
+    total: Int = total + i * 2;
+    i: Int = i + 1;
+}}
+"""
+
+
+def compile_source(text):
+    codegen = QuackCodeGenerator()
+    codegen.generate(parse_code(text))
+    return codegen.get_code()
+
+
+def bench(name, asm, steps, repeat):
+    program = assemble(asm)
+    best = None
+    executed = 0
+    for _ in range(repeat):
+        vm = VM(program)
+        start = time.perf_counter()
+        executed = vm.run(steps)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    rate = executed / best if best else float('inf')
+    print(f'{name:<40} {executed:>12,} {best:>10.4f} {rate:>16,.0f}')
+
+
+def main():
+    cli_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    cli_parser.add_argument('files', nargs='*', help='Quack programs to run')
+    cli_parser.add_argument('--steps', type=int, default=1_000_000,
+                            help='instruction budget per run (default 1,000,000)')
+    cli_parser.add_argument('--repeat', type=int, default=3,
+                            help='runs per program; the best time is reported')
+    cli_parser.add_argument('--loop', type=int, default=100_000,
+                            help='iterations of the built-in counting loop')
+    args = cli_parser.parse_args()
+
+    print(f'{"program":<40} {"instructions":>12} {"seconds":>10} {"instr/s":>16}')
+    for path in args.files or DEFAULT_SAMPLES:
+        with open(path) as source:
+            asm = compile_source(source.read())
+        bench(os.path.relpath(path, ROOT), asm, args.steps, args.repeat)
+    bench(f'counting loop (n={args.loop})', compile_source(COUNTING_LOOP.format(n=args.loop)),
+          args.steps, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
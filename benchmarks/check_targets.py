@@ -0,0 +1,173 @@
+"""Differential check: the Python backend against the VM on the same programs.
+
+Every .qk file under samples/ (and, with --generated, seeded programs
+from gen_program.py) is compiled for both targets at each -O level,
+with a print of every variable of the main program appended, so the
+targets are compared on the final values they compute and not only on
+what the program itself prints (the samples print nothing).
+The assembly runs on the VM for at most --steps instructions and the
+Python module runs in a subprocess for at most --timeout seconds.  The
+two must print the same lines, end with the same value in every
+variable and agree on whether the program failed;
+when either one was cut short (a program that never halts), the lines
+printed before the cut must agree.  Programs the front end rejects are
+skipped, and so are programs only one target can compile.  Exits 1 on
+any mismatch.
+
+Usage:
+    python3 benchmarks/check_targets.py [paths ...] [--generated 3] [-O 0 1 2]
+"""
+
+import argparse
+import contextlib
+import glob
+import io
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'qklib'))
+
+from gen_program import SHAPES, generate  # noqa: E402
+from quack_parser import compile_python, compile_tree, parse_with_symbols  # noqa: E402
+from quack_pygen import body_names  # noqa: E402
+from vm import VM, assemble  # noqa: E402
+
+
+def error_text(e):
+    return f'{type(e).__name__}: {str(e).splitlines()[0] if str(e) else ""}'
+
+
+def with_final_values(source):
+    """(source with a print of each variable of the main program appended,
+    the variables in that order); the source as it is if it does not parse
+    """
+    try:
+        names = body_names(parse_with_symbols(source, {}).statements)
+    except Exception:
+        return source, []
+    return source + ''.join(f'\nprint({name});' for name in names) + '\n', names
+
+
+def run_vm(source, level, steps):
+    """(lines printed, failed, cut short), or a str if the program does not compile"""
+    try:
+        codegen, _ = compile_tree(parse_with_symbols(source, {}), level)
+        program = assemble(codegen.get_code())
+    except Exception as e:
+        return error_text(e)
+    vm = VM(program)
+    out = io.StringIO()
+    failed = False
+    with contextlib.redirect_stdout(out):
+        try:
+            vm.run(steps)
+        except Exception:
+            failed = True
+    return out.getvalue().splitlines(), failed, vm.running and not failed
+
+
+def run_python(source, level, timeout, tmp):
+    try:
+        module, _ = compile_python(parse_with_symbols(source, {}), level)
+    except Exception as e:
+        return error_text(e)
+    path = os.path.join(tmp, 'program.py')
+    with open(path, 'w') as f:
+        f.write(module)
+    try:
+        result = subprocess.run([sys.executable, '-u', path], capture_output=True, text=True,
+                                timeout=timeout)
+    except subprocess.TimeoutExpired as e:
+        output = e.stdout.decode() if isinstance(e.stdout, bytes) else (e.stdout or '')
+        lines = output.splitlines()
+        if not output.endswith('\n'):
+            lines = lines[:-1]      # cut in the middle of a line
+        return lines, False, True
+    return result.stdout.splitlines(), result.returncode != 0, False
+
+
+def compare(vm_result, py_result, names=()):
+    """None if the two runs agree, else what differs; the last len(names)
+    lines of a finished run are the final values of names
+    """
+    (vm_lines, vm_failed, vm_cut), (py_lines, py_failed, py_cut) = vm_result, py_result
+    if vm_cut or py_cut:
+        common = min(len(vm_lines), len(py_lines))
+        if vm_lines[:common] != py_lines[:common]:
+            return 'output differs before the run was cut short'
+        if not vm_cut and len(py_lines) > len(vm_lines) or not py_cut and len(vm_lines) > len(py_lines):
+            return 'one target printed more than the other, which finished'
+        return None
+    if vm_lines != py_lines:
+        finals = len(names)
+        if finals and len(vm_lines) == len(py_lines) >= finals and \
+                vm_lines[:-finals] == py_lines[:-finals]:
+            for name, vm_value, py_value in zip(names, vm_lines[-finals:], py_lines[-finals:]):
+                if vm_value != py_value:
+                    return f'final value of {name} differs: vm {vm_value}, py {py_value}'
+        return 'output differs'
+    if vm_failed != py_failed:
+        return f'vm {"failed" if vm_failed else "succeeded"}, py {"failed" if py_failed else "succeeded"}'
+    return None
+
+
+def main():
+    cli_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    cli_parser.add_argument('paths', nargs='*', help='programs to check (default: every sample)')
+    cli_parser.add_argument('-O', dest='levels', type=int, nargs='+', default=[0, 1, 2])
+    cli_parser.add_argument('--generated', type=int, default=0, metavar='N',
+                            help='also check N seeded programs of each generator shape')
+    cli_parser.add_argument('--statements', type=int, default=300,
+                            help='statements per generated program')
+    cli_parser.add_argument('--steps', type=int, default=2_000_000, help='VM instruction budget')
+    cli_parser.add_argument('--timeout', type=float, default=5.0,
+                            help='seconds the Python module may run')
+    args = cli_parser.parse_args()
+
+    paths = args.paths or sorted(glob.glob(os.path.join(ROOT, 'samples', '**', '*.qk'),
+                                           recursive=True))
+    checked = skipped = mismatches = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        programs = []
+        for path in paths:
+            with open(path) as f:
+                programs.append((os.path.relpath(path, ROOT), f.read()))
+        for seed in range(args.generated):
+            for shape in SHAPES:
+                path = os.path.join(tmp, 'generated.qk')
+                generate(path, args.statements, shape, seed)
+                with open(path) as f:
+                    programs.append((f'generated {shape} seed {seed}', f.read()))
+        for name, source in programs:
+            source, names = with_final_values(source)
+            for level in args.levels:
+                vm_result = run_vm(source, level, args.steps)
+                py_result = run_python(source, level, args.timeout, tmp)
+                label = f'{name} -O{level}'
+                if isinstance(vm_result, str) or isinstance(py_result, str):
+                    skipped += 1
+                    if isinstance(vm_result, str) and isinstance(py_result, str):
+                        reason = f'does not compile ({vm_result})'
+                    elif isinstance(vm_result, str):
+                        reason = f'only the py target compiles it (vm: {vm_result})'
+                    else:
+                        reason = f'only the vm target compiles it (py: {py_result})'
+                    print(f'skip      {label}: {reason}')
+                    continue
+                checked += 1
+                problem = compare(vm_result, py_result, names)
+                if problem:
+                    mismatches += 1
+                    print(f'MISMATCH  {label}: {problem}')
+                else:
+                    print(f'ok        {label}' + (' (cut short)' if vm_result[2] or py_result[2] else ''))
+    print(f'{checked} runs compared, {mismatches} mismatches, {skipped} skipped')
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
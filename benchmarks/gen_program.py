@@ -0,0 +1,175 @@
+"""Seeded generator of large, valid Quack programs.
+
+The same seed and options always produce the same program, so results
+from different commits are comparable.  A program is a prelude that
+declares every variable once, followed by statements of one shape (or
+a random mix of all of them):
+
+    expr      long left-nested expression chains (--width terms)
+    nested    if/while nested --depth deep, loops running --trip times
+    defs      many defs, each called from the main program later on
+    strings   wide string concatenations (--width terms)
+    mixed     a seeded mix of the four
+
+Values stay bounded however long the program is: expressions only read
+the prelude's variables (a*, s*) and literals, and results go to
+separate targets (x*, t*).  Nested statements count towards the total.
+
+Usage:
+    python3 benchmarks/gen_program.py -n 100000 --shape mixed --seed 1 -o big.qk
+"""
+
+import argparse
+import random
+import sys
+
+SHAPES = ['expr', 'nested', 'defs', 'strings', 'mixed']
+
+
+class ProgramGenerator:
+    def __init__(self, out, seed=0, width=16, depth=6, trip=2, variables=32):
+        self.out = out
+        self.rng = random.Random(seed)
+        self.width = width
+        self.depth = depth
+        self.trip = trip
+        self.variables = variables
+        self.defs = 0
+        self.emitted = 0
+
+    def write(self, indent, line):
+        self.out.write('    ' * indent + line + '\n')
+
+    def statement(self, indent, line):
+        self.write(indent, line)
+        self.emitted += 1
+
+    def prelude(self):
+        for i in range(self.variables):
+            self.statement(0, f'a{i}: Int = {self.rng.randrange(1, 100)};')
+            self.statement(0, f'x{i}: Int = 0;')
+            self.statement(0, f's{i}: String = "s{i}";')
+            self.statement(0, f't{i}: String = "";')
+        # QuackTransformer resolves the names in a body before it registers
+        # the parameters, so parameter names are declared as globals too
+        self.statement(0, 'p0: Int = 0;')
+        self.statement(0, 'p1: Int = 0;')
+        for d in range(self.depth):
+            self.statement(0, f'c{d}: Int = 0;')
+
+    def int_var(self):
+        return f'a{self.rng.randrange(self.variables)}'
+
+    def param(self):
+        return f'p{self.rng.randrange(2)}'
+
+    def int_expr(self, terms, var):
+        parts = [var()]
+        for _ in range(terms - 1):
+            op = self.rng.choice('++--*')
+            if op == '*':
+                parts.append(f'* {self.rng.randrange(1, 3)}')
+            else:
+                parts.append(f'{op} {var() if self.rng.random() < 0.7 else self.rng.randrange(100)}')
+        return ' '.join(parts)
+
+    def assign(self, indent, var=None):
+        expr = self.int_expr(self.width, var or self.int_var)
+        self.statement(indent, f'x{self.rng.randrange(self.variables)}: Int = {expr};')
+
+    def concat(self, indent):
+        parts = []
+        for _ in range(self.width):
+            if self.rng.random() < 0.6:
+                parts.append(f's{self.rng.randrange(self.variables)}')
+            else:
+                parts.append(f'"{self.rng.choice("abcdefgh") * self.rng.randrange(1, 4)}"')
+        self.statement(indent, f't{self.rng.randrange(self.variables)}: String = {" + ".join(parts)};')
+
+    def nest(self, indent, level):
+        """One if or counted while with the next level inside"""
+        if level == self.depth:
+            self.assign(indent)
+            return
+        if self.rng.random() < 0.5:
+            self.statement(indent, f'if ({self.int_var()} < {self.int_var()}) {{')
+            self.nest(indent + 1, level + 1)
+            self.write(indent, '} else {')
+            self.assign(indent + 1)
+            self.write(indent, '}')
+        else:
+            counter = f'c{level}'
+            self.statement(indent, f'{counter}: Int = 0;')
+            self.statement(indent, f'while ({counter} < {self.trip}) {{')
+            self.nest(indent + 1, level + 1)
+            self.statement(indent + 1, f'{counter}: Int = {counter} + 1;')
+            self.write(indent, '}')
+
+    def define(self):
+        # A body has its own frame: it only sees its parameters and locals
+        self.statement(0, f'def g{self.defs}(p0: Int, p1: Int): Int {{')
+        self.assign(1, self.param)
+        self.statement(1, f'return p0 + p1 - {self.rng.randrange(100)};')
+        self.write(0, '}')
+        self.defs += 1
+
+    def call(self, indent):
+        g = self.rng.randrange(self.defs)
+        self.statement(indent, f'x{self.rng.randrange(self.variables)}: Int = '
+                               f'g{g}({self.int_var()}, {self.int_var()});')
+
+    def one(self, shape):
+        if shape == 'mixed':
+            shape = self.rng.choice(SHAPES[:-1])
+        if shape == 'expr':
+            self.assign(0)
+        elif shape == 'nested':
+            self.nest(0, 0)
+        elif shape == 'defs':
+            if self.defs and self.rng.random() < 0.5:
+                self.call(0)
+            else:
+                self.define()
+        elif shape == 'strings':
+            self.concat(0)
+        if self.rng.random() < 0.01:
+            self.statement(0, f'print(x{self.rng.randrange(self.variables)});')
+
+    def program(self, statements, shape):
+        """Write a program of about statements statements (at least the prelude)"""
+        if shape not in SHAPES:
+            raise ValueError(f"unknown shape {shape}")
+        self.prelude()
+        while self.emitted < statements:
+            self.one(shape)
+        return self.emitted
+
+
+def generate(path, statements, shape='mixed', seed=0, **options):
+    """Write a generated program to path; returns the number of statements"""
+    with open(path, 'w') as out:
+        return ProgramGenerator(out, seed, **options).program(statements, shape)
+
+
+def main():
+    cli_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    cli_parser.add_argument('-n', '--statements', type=int, default=1000)
+    cli_parser.add_argument('--shape', choices=SHAPES, default='mixed')
+    cli_parser.add_argument('--seed', type=int, default=0)
+    cli_parser.add_argument('--width', type=int, default=16,
+                            help='terms per expression or concatenation')
+    cli_parser.add_argument('--depth', type=int, default=6, help='if/while nesting depth')
+    cli_parser.add_argument('--trip', type=int, default=2, help='iterations of each nested loop')
+    cli_parser.add_argument('-o', '--output', help='output file (default: stdout)')
+    args = cli_parser.parse_args()
+    out = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        ProgramGenerator(out, args.seed, args.width, args.depth, args.trip).program(
+            args.statements, args.shape)
+    finally:
+        if args.output:
+            out.close()
+
+
+if __name__ == '__main__':
+    main()
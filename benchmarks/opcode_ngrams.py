@@ -0,0 +1,139 @@
+"""Count instruction n-grams over a corpus of Quack programs.
+
+Each program is compiled (at -O1 by default) and its instructions are
+reduced to their mnemonics, so `load 3; const 1; iadd` and
+`load 0; const 1; iadd` count as the same trigram.  Static counts look
+at the code as written; with --dynamic each program is also run on the
+VM (under a step budget) and every executed n-gram is counted, which is
+what decides whether a superinstruction pays off.  Sequences never span
+a label or a jump target.
+
+Usage:
+    python3 benchmarks/opcode_ngrams.py 'samples/**/*.qk' -n 2 3 4 --dynamic --no-fuse
+"""
+
+import argparse
+import glob
+import os
+import sys
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'qklib'))
+
+from quack_parser import compile_tree, parse_with_symbols  # noqa: E402
+from quack_peephole import FUSION_RULES, RULES, PeepholeOptimizer  # noqa: E402
+from vm import JUMPS, OPNAMES, VM, assemble  # noqa: E402
+
+# The counting loop from bench_vm.py, so the corpus always has a hot loop
+COUNTING_LOOP = """
+i: Int = 0;
+total: Int = 0;
+while (i < 1000) {
+    total: Int = i * 2 + total;
+    i: Int = i + 1;
+}
+print(total);
+"""
+
+
+def compile_program(text, level, rules):
+    codegen, _ = compile_tree(parse_with_symbols(text, {}), level, PeepholeOptimizer(rules))
+    return assemble(codegen.get_code())
+
+
+def block_starts(program):
+    """Offsets where straight-line sequences start (jump targets)"""
+    starts = set(program.labels.values())
+    starts.update(entry for _, entry, _ in program.methods)
+    for pc, op in enumerate(program.ops):
+        if op in JUMPS:
+            starts.add(program.args[pc])
+    return starts
+
+
+def static_ngrams(program, sizes, counts):
+    starts = block_starts(program)
+    names = [OPNAMES[op] for op in program.ops]
+    for n in sizes:
+        for pc in range(len(names) - n + 1):
+            if any(pc + k in starts for k in range(1, n)):
+                continue
+            counts[n][tuple(names[pc:pc + n])] += 1
+
+
+def dynamic_ngrams(program, sizes, counts, steps):
+    """Run program and count the n-grams of consecutively executed instructions"""
+    vm = VM(program)
+    ops = program.ops
+    longest = max(sizes)
+    window = []
+    executed = 0
+    while vm.running and executed < steps:
+        pc = vm.pc
+        if window and pc != window[-1][0] + 1:
+            window.clear()      # a taken jump or a call: the sequence is broken
+        window.append((pc, OPNAMES[ops[pc]]))
+        if len(window) > longest:
+            del window[0]
+        for n in sizes:
+            if len(window) >= n:
+                counts[n][tuple(name for _, name in window[-n:])] += 1
+        vm.pc = pc + 1
+        vm.dispatch[ops[pc]](program.args[pc])
+        executed += 1
+
+
+def main():
+    cli_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    cli_parser.add_argument('inputs', nargs='*', help='Quack programs or glob patterns')
+    cli_parser.add_argument('-n', type=int, nargs='+', default=[2, 3, 4], dest='sizes',
+                            help='n-gram lengths (default 2 3 4)')
+    cli_parser.add_argument('-O', dest='opt_level', type=int, default=1,
+                            help='optimization level to compile at (default 1)')
+    cli_parser.add_argument('--no-fuse', action='store_true',
+                            help='leave out superinstructions, to see the sequences they replace')
+    cli_parser.add_argument('--dynamic', action='store_true',
+                            help='count executed n-grams instead of static ones')
+    cli_parser.add_argument('--steps', type=int, default=1_000_000,
+                            help='instruction budget per program with --dynamic')
+    cli_parser.add_argument('--top', type=int, default=15, help='n-grams shown per length')
+    args = cli_parser.parse_args()
+
+    sources = []
+    for pattern in args.inputs:
+        sources.extend(sorted(glob.glob(pattern, recursive=True)))
+    texts = [('counting loop', COUNTING_LOOP)]
+    for path in sources:
+        with open(path) as f:
+            texts.append((path, f.read()))
+
+    rules = [rule for rule in RULES if not (args.no_fuse and rule in FUSION_RULES)]
+    counts = {n: Counter() for n in args.sizes}
+    compiled = 0
+    for name, text in texts:
+        try:
+            program = compile_program(text, args.opt_level, rules)
+        except Exception as e:
+            print(f'skipping {name}: {e.__class__.__name__}', file=sys.stderr)
+            continue
+        compiled += 1
+        if args.dynamic:
+            try:
+                dynamic_ngrams(program, args.sizes, counts, args.steps)
+            except Exception as e:
+                print(f'{name} stopped: {e.__class__.__name__}: {e}', file=sys.stderr)
+        else:
+            static_ngrams(program, args.sizes, counts)
+
+    kind = 'executed' if args.dynamic else 'static'
+    print(f'{compiled} programs, {kind} counts')
+    for n in args.sizes:
+        total = sum(counts[n].values()) or 1
+        print(f'\n{n}-grams')
+        for gram, count in counts[n].most_common(args.top):
+            print(f'{count:>12,} {100 * count / total:6.2f}%  {"; ".join(gram)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""Generated by quack_builtins.py from builtin_methods.json; do not edit."""
+
+from quack_builtins import freeze
+
+SOURCE_SHA256 = 'ebc26965cfd209469ae62fd2e995ee552f224e7b89ea0c6fec864a65cfebbb78'
+
+# method name -> vtable slot
+SELECTORS = freeze(
+{'$constructor': 0,
+ 'string': 1,
+ 'print': 2,
+ 'equals': 3,
+ 'less': 4,
+ 'plus': 5,
+ 'times': 6,
+ 'minus': 7,
+ 'divide': 8}
+)
+
+CLASSES = freeze(
+{'Obj': {'super': 'Obj',
+         'methods': {'$constructor': {'params': [], 'ret': 'Nothing', 'slot': 0},
+                     'string': {'params': [], 'ret': 'String', 'slot': 1},
+                     'print': {'params': [], 'ret': 'Nothing', 'slot': 2},
+                     'equals': {'params': ['Obj'], 'ret': 'Bool', 'slot': 3}},
+         'fields': {}},
+ 'Int': {'super': 'Obj',
+         'methods': {'$constructor': {'params': [], 'ret': 'Nothing', 'slot': 0},
+                     'string': {'params': [], 'ret': 'String', 'slot': 1},
+                     'print': {'params': [], 'ret': 'Nothing', 'slot': 2},
+                     'equals': {'params': ['Obj'], 'ret': 'Bool', 'slot': 3},
+                     'less': {'params': ['Int'], 'ret': 'Bool', 'slot': 4},
+                     'PLUS': {'params': ['Int'], 'ret': 'Int', 'slot': 5},
+                     'TIMES': {'params': ['Int'], 'ret': 'Int', 'slot': 6},
+                     'MINUS': {'params': ['Int'], 'ret': 'Int', 'slot': 7},
+                     'DIVIDE': {'params': ['Int'], 'ret': 'Int', 'slot': 8}},
+         'fields': {}},
+ 'String': {'super': 'Obj',
+            'methods': {'$constructor': {'params': [], 'ret': 'Nothing', 'slot': 0},
+                        'string': {'params': [], 'ret': 'String', 'slot': 1},
+                        'print': {'params': [], 'ret': 'Nothing', 'slot': 2},
+                        'equals': {'params': ['Obj'], 'ret': 'Bool', 'slot': 3},
+                        'less': {'params': ['String'], 'ret': 'Bool', 'slot': 4},
+                        'PLUS': {'params': ['String'], 'ret': 'String', 'slot': 5}},
+            'fields': {}},
+ 'Nothing': {'super': 'Obj',
+             'methods': {'$constructor': {'params': [], 'ret': 'Nothing', 'slot': 0},
+                         'string': {'params': [], 'ret': 'String', 'slot': 1},
+                         'print': {'params': [], 'ret': 'Nothing', 'slot': 2},
+                         'equals': {'params': ['Obj'], 'ret': 'Bool', 'slot': 3}},
+             'fields': {}},
+ 'Bool': {'super': 'Obj',
+          'methods': {'$constructor': {'params': [], 'ret': 'Nothing', 'slot': 0},
+                      'string': {'params': [], 'ret': 'String', 'slot': 1},
+                      'print': {'params': [], 'ret': 'Nothing', 'slot': 2},
+                      'equals': {'params': ['Obj'], 'ret': 'Bool', 'slot': 3}},
+          'fields': {}}}
+)
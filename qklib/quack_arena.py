@@ -0,0 +1,179 @@
+"""Flat, array-backed AST storage for very large programs.
+
+In arena mode every node is a row in parallel typed arrays instead of a
+Python object:
+
+    kinds     array('B')  index into KINDS (the node class)
+    types     array('B')  index into the interned type names
+    first     array('I')  offset of the node's operands in `operands`
+    operands  array('i')  one entry per constructor field, in field order:
+                          a child node id, an interned value id, or an
+                          offset into `lists` for variable-length fields
+    lists     array('i')  count followed by the entries, for Block
+                          statements, call arguments and parameter lists
+
+Names, type names and literal values are interned in `values`, so a
+variable mentioned a million times is stored once.
+
+ArenaTransformer packs each statement into the arena as soon as the
+parser reduces it, so only the statement being parsed exists as node
+objects; everything already parsed is a few bytes per node.  Code is
+generated one top-level statement at a time by materializing that
+statement back into ordinary nodes (node()), so gen_code stays the one
+code generator for both representations.
+"""
+
+import sys
+from array import array
+
+from quack_ast import (Add, And, Assign, Block, Boolean, Div, Equal, Float,
+                       FuncCall, FuncDef, GreaterThan, GreaterThanOrEqual, If,
+                       Int, LessThan, LessThanOrEqual, MethodCall, Mul, Not,
+                       NotEqual, Or, Print, Return, String, Sub, Var, While)
+from quack_transformer import QuackTransformer
+
+NODE, VALUE, NODES, PARAMS = range(4)
+
+# Constructor fields of each node class, in constructor order
+FIELDS = {
+    Assign: (('var', NODE), ('vartype', VALUE), ('expr', NODE)),
+    Var: (('name', VALUE),),
+    Int: (('value', VALUE),),
+    Float: (('value', VALUE),),
+    String: (('value', VALUE),),
+    Boolean: (('value', VALUE),),
+    FuncCall: (('func_name', VALUE), ('args', NODES)),
+    MethodCall: (('obj', NODE), ('method_name', VALUE), ('args', NODES)),
+    FuncDef: (('name', VALUE), ('params', PARAMS), ('return_type', VALUE), ('body', NODE)),
+    Return: (('expr', NODE),),
+    Print: (('expr', NODE),),
+    Not: (('expr', NODE),),
+    Block: (('statements', NODES),),
+    If: (('condition', NODE), ('then_body', NODE), ('else_body', NODE)),
+    While: (('condition', NODE), ('body', NODE)),
+}
+for _binary in (Add, Sub, Mul, Div, LessThan, GreaterThan, LessThanOrEqual,
+                GreaterThanOrEqual, Equal, NotEqual, And, Or):
+    FIELDS[_binary] = (('left', NODE), ('right', NODE))
+
+KINDS = list(FIELDS)
+KIND_INDEX = {cls: i for i, cls in enumerate(KINDS)}
+
+
+class NodeArena:
+    def __init__(self):
+        self.kinds = array('B')
+        self.types = array('B')
+        self.first = array('I')
+        self.operands = array('i')
+        self.lists = array('i')
+        self.values = []
+        self.value_index = {}
+        self.type_names = [None]
+        self.type_index = {None: 0}
+        self.root = -1
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def intern(self, value):
+        key = (type(value), value)
+        index = self.value_index.get(key)
+        if index is None:
+            index = self.value_index[key] = len(self.values)
+            self.values.append(sys.intern(value) if isinstance(value, str) else value)
+        return index
+
+    def pack(self, node):
+        """Store node (and any children that are still objects); returns its id.
+        Ints are ids of nodes that are already in the arena.
+        """
+        if isinstance(node, int):
+            return node
+        cls = type(node)
+        encoded = []
+        for name, kind in FIELDS[cls]:
+            value = getattr(node, name)
+            if kind == NODE:
+                encoded.append(self.pack(value))
+            elif kind == VALUE:
+                encoded.append(self.intern(value))
+            else:
+                encoded.append(len(self.lists))
+                self.lists.append(len(value))
+                if kind == NODES:
+                    self.lists.extend([self.pack(child) for child in value])
+                else:
+                    for param_name, param_type in value:
+                        self.lists.append(self.intern(param_name))
+                        self.lists.append(self.intern(param_type))
+        node_type = getattr(node, 'inferred_type', None)
+        if node_type not in self.type_index:
+            self.type_index[node_type] = len(self.type_names)
+            self.type_names.append(node_type)
+        self.kinds.append(KIND_INDEX[cls])
+        self.types.append(self.type_index[node_type])
+        self.first.append(len(self.operands))
+        self.operands.extend(encoded)
+        return len(self.kinds) - 1
+
+    def statements(self):
+        """Ids of the top-level statements"""
+        offset = self.operands[self.first[self.root]]
+        count = self.lists[offset]
+        return self.lists[offset + 1:offset + 1 + count]
+
+    def node(self, node_id):
+        """Materialize node_id (and its subtree) as ordinary AST objects"""
+        cls = KINDS[self.kinds[node_id]]
+        at = self.first[node_id]
+        fields = []
+        for i, (_, kind) in enumerate(FIELDS[cls]):
+            operand = self.operands[at + i]
+            if kind == NODE:
+                fields.append(self.node(operand))
+            elif kind == VALUE:
+                fields.append(self.values[operand])
+            else:
+                count = self.lists[operand]
+                items = self.lists[operand + 1:operand + 1 + (count if kind == NODES else 2 * count)]
+                if kind == NODES:
+                    fields.append([self.node(child) for child in items])
+                else:
+                    fields.append([(self.values[items[j]], self.values[items[j + 1]])
+                                   for j in range(0, len(items), 2)])
+        node = cls(*fields)
+        node_type = self.type_names[self.types[node_id]]
+        if node_type is not None:
+            node.inferred_type = node_type
+        return node
+
+    def generate(self, generator, transform=None):
+        """Generate code one top-level statement at a time.  transform, if
+        given, rewrites each materialized statement first (e.g. optimize).
+        """
+        for statement in self.statements():
+            node = self.node(statement)
+            generator.generate(node if transform is None else transform(node))
+
+    def nbytes(self):
+        arrays = (self.kinds, self.types, self.first, self.operands, self.lists)
+        return sum(a.itemsize * len(a) for a in arrays)
+
+
+class ArenaTransformer(QuackTransformer):
+    """QuackTransformer that moves every statement into a NodeArena as soon
+    as it has been type-checked.  Parsing returns the arena.
+    """
+    def __init__(self):
+        super().__init__()
+        self.arena = NodeArena()
+
+    def statement(self, items):
+        return self.arena.pack(items[0])
+
+    def start(self, items):
+        arena = self.arena
+        arena.root = arena.pack(Block(items))
+        self.arena = NodeArena()
+        return arena
@@ -1,11 +1,72 @@
 #AST节点类用于表示抽象语法树（AST)的结构。每个节点类对应一种语法结构。
 
+def static_class(node):
+    """The class a call on node's value is checked against: its inferred
+    type, or Obj when the checker does not know it
+    """
+    clazz = getattr(node, 'inferred_type', None)
+    return 'Obj' if clazz in (None, 'Unknown') else clazz
+
+def emit_binary(node, generator, method):
+    """Operands, then a type-specialized instruction when the checker proved
+    both operand types, else a generic call of the left operand's class
+    """
+    node.left.gen_code(generator)
+    node.right.gen_code(generator)
+    left_type = getattr(node.left, 'inferred_type', None)
+    if left_type == getattr(node.right, 'inferred_type', None):
+        opcode = SPECIALIZED.get((type(node), left_type))
+        if opcode is not None:
+            generator.code.append(opcode)
+            return
+    generator.code.append(f'call {static_class(node.left)}: {method}')
+
+def emit_branch(generator, true_label, false_label):
+    """Jumps on the Bool on top of the stack; a None label falls through"""
+    if true_label is None:
+        generator.code.append(f'jump_ifnot {false_label}')
+    elif false_label is None:
+        generator.code.append(f'jump_if {true_label}')
+    else:
+        generator.code.append(f'jump_if {true_label}')
+        generator.code.append(f'jump {false_label}')
+
+def emit_condition_value(node, generator):
+    """A Bool value computed by branching, for conditions used as values"""
+    label_false = generator.new_label()
+    label_end = generator.new_label()
+    node.c_eval(generator, None, label_false)
+    generator.code.append('const true')
+    generator.code.append(f'jump {label_end}')
+    generator.code.append(f'{label_false}:')
+    generator.code.append('const false')
+    generator.code.append(f'{label_end}:')
+
 class ASTNode:
+    # inferred_type is filled in by QuackTransformer.get_type
+    __slots__ = ('inferred_type',)
+
     def gen_code(self, generator):
         raise NotImplementedError("gen_code not implemented in base class")
 
-class Assign(ASTNode):
+    def c_eval(self, generator, true_label, false_label):
+        """Code that jumps to true_label when this condition holds and to
+        false_label when it does not; a None label means fall through.
+        By default the value is computed and branched on; comparisons of
+        Ints become compare-and-branch instructions in fusion.
+        """
+        self.gen_code(generator)
+        emit_branch(generator, true_label, false_label)
+
+class Statement(ASTNode):
+    # line is the source line, set by QuackTransformer when a line table is
+    # requested (quack_parser.py -g); unset otherwise
+    __slots__ = ('line',)
+
+class Assign(Statement):
     # Assign表示赋值语句
+    __slots__ = ('var', 'vartype', 'expr')
+
     def __init__(self, var, vartype, expr):
         if isinstance(var, str):
             self.var = Var(var)  # Convert string to Var object if necessary
@@ -24,6 +85,8 @@ class Assign(ASTNode):
 
 
 class Add(ASTNode):
+    __slots__ = ('left', 'right')
+
     def __init__(self, left, right):
         self.left = left
         self.right = right 
@@ -32,11 +95,11 @@ class Add(ASTNode):
         return f"Add({self.left}, {self.right})"
     
     def gen_code(self, generator):
-        self.left.gen_code(generator)
-        self.right.gen_code(generator)
-        generator.code.append('call Int: plus')
+        emit_binary(self, generator, 'plus')
 
 class Sub(ASTNode):
+    __slots__ = ('left', 'right')
+
     def __init__(self, left, right):
         self.left = left
         self.right = right 
@@ -45,28 +108,38 @@ class Sub(ASTNode):
         return f"Sub({self.left}, {self.right})"
     
     def gen_code(self, generator):
-        self.left.gen_code(generator)
-        self.right.gen_code(generator)
-        generator.code.append('call Int: minus')
+        emit_binary(self, generator, 'minus')
+
+class Mul(ASTNode):
+    __slots__ = ('left', 'right')
 
-class Mul:
     def __init__(self, left, right):
         self.left = left
         self.right = right 
     
     def __repr__(self):
         return f"Mul({self.left}, {self.right})"
+    
+    def gen_code(self, generator):
+        emit_binary(self, generator, 'times')
+
+class Div(ASTNode):
+    __slots__ = ('left', 'right')
 
-class Div:
     def __init__(self, left, right):
         self.left = left
         self.right = right 
     
     def __repr__(self):
         return f"Div({self.left}, {self.right})"
+    
+    def gen_code(self, generator):
+        emit_binary(self, generator, 'divide')
 
 class Var(ASTNode):
     #Var表示变量
+    __slots__ = ('name',)
+
     def __init__(self, name):
         self.name = name
     
@@ -79,6 +152,8 @@ class Var(ASTNode):
 
 class Int(ASTNode):
     #Number表示整数常量
+    __slots__ = ('value',)
+
     def __init__(self, value):
         self.value = value
     
@@ -88,29 +163,52 @@ class Int(ASTNode):
     def gen_code(self, generator):
         generator.code.append(f'const {self.value}')
 
-class String:
+class String(ASTNode):
+    __slots__ = ('value',)
+
     def __init__(self, value):
         self.value = value
     
     def __repr__(self):
         return f"String({self.value})"
+    
+    def gen_code(self, generator):
+        generator.code.append(f'const "{self.value}"')
+
+class Float(ASTNode):
+    __slots__ = ('value',)
 
-class Float:
     def __init__(self, value):
         self.value = value
     
     def __repr__(self):
         return f"Float({self.value})"
+    
+    def gen_code(self, generator):
+        generator.code.append(f'const {self.value}')
+
+class Boolean(ASTNode):
+    __slots__ = ('value',)
 
-class Boolean:
     def __init__(self, value):
         self.value = value
     
     def __repr__(self):
         return f"Boolean({self.value})"
+    
+    def gen_code(self, generator):
+        generator.code.append('const true' if self.value else 'const false')
+
+    def c_eval(self, generator, true_label, false_label):
+        # A literal condition is a jump or nothing
+        label = true_label if self.value else false_label
+        if label is not None:
+            generator.code.append(f'jump {label}')
 
 
-class FuncCall:
+class FuncCall(ASTNode):
+    __slots__ = ('func_name', 'args')
+
     def __init__(self, func_name, args):
         self.func_name = func_name
         self.args = args
@@ -118,7 +216,15 @@ class FuncCall:
     def __repr__(self):
         return f"FuncCall({self.func_name}, {self.args})"
 
-class MethodCall:
+    def gen_code(self, generator):
+        # Free functions are called as methods of $Main
+        for arg in self.args:
+            arg.gen_code(generator)
+        generator.code.append(f'call $Main: {self.func_name}')
+
+class MethodCall(ASTNode):
+    __slots__ = ('obj', 'method_name', 'args')
+
     def __init__(self, obj, method_name, args):
         self.obj = obj
         self.method_name = method_name
@@ -127,7 +233,17 @@ class MethodCall:
     def __repr__(self):
         return f"MethodCall({self.obj}, {self.method_name}, {self.args})"
 
-class FuncDef:
+    def gen_code(self, generator):
+        # Dispatch is virtual; the receiver's static type only names the call site
+        self.obj.gen_code(generator)
+        for arg in self.args:
+            arg.gen_code(generator)
+        receiver_type = getattr(self.obj, 'inferred_type', None) or 'Obj'
+        generator.code.append(f'call {receiver_type}: {self.method_name}')
+
+class FuncDef(Statement):
+    __slots__ = ('name', 'params', 'return_type', 'body')
+
     def __init__(self, name, params, return_type, body):
         self.name = name
         self.params = params 
@@ -137,14 +253,33 @@ class FuncDef:
     def __repr__(self):
         return f"FuncDef({self.name}, {self.params}, {self.return_type}, {self.body})"
 
-class Return:
+    def gen_code(self, generator):
+        # The body goes into its own .method section, emitted after the main program
+        generator.begin_method(self.name, [param[0] for param in self.params])
+        generator.mark_line(self)
+        for param_name, _ in reversed(self.params):
+            generator.code.append(f'store {generator.get_var_index(param_name)}')
+        self.body.gen_code(generator)
+        generator.code.append('const nothing')
+        generator.code.append('return 1')
+        generator.end_method()
+
+class Return(Statement):
+    __slots__ = ('expr',)
+
     def __init__(self, expr):
         self.expr = expr 
     
     def __repr__(self):
         return f"Return({self.expr})"
 
+    def gen_code(self, generator):
+        self.expr.gen_code(generator)
+        generator.code.append('return 1')
+
 class Block(ASTNode):
+    __slots__ = ('statements',)
+
     def __init__(self, statements):
         self.statements = statements
 
@@ -153,9 +288,12 @@ class Block(ASTNode):
     
     def gen_code(self, generator):
         for stmt in self.statements:
+            generator.mark_line(stmt)
             stmt.gen_code(generator)
 
-class If:
+class If(Statement):
+    __slots__ = ('condition', 'then_body', 'else_body')
+
     def __init__(self, condition, then_body, else_body):
         self.condition = condition
         self.then_body = then_body
@@ -164,7 +302,20 @@ class If:
     def __repr__(self):
         return f"If({self.condition}, {self.then_body}, {self.else_body})"
 
-class While:
+    def gen_code(self, generator):
+        label_else = generator.new_label()
+        label_end = generator.new_label()
+        self.condition.c_eval(generator, None, label_else)
+        self.then_body.gen_code(generator)
+        generator.mark_line(self)
+        generator.code.append(f'jump {label_end}')
+        generator.code.append(f'{label_else}:')
+        self.else_body.gen_code(generator)
+        generator.code.append(f'{label_end}:')
+
+class While(Statement):
+    __slots__ = ('condition', 'body')
+
     def __init__(self, condition, body):
         self.condition = condition
         self.body = body
@@ -172,63 +323,112 @@ class While:
     def __repr__(self):
         return f"While({self.condition}, {self.body})"
 
-class Print:
+    def gen_code(self, generator):
+        label_top = generator.new_label()
+        label_end = generator.new_label()
+        generator.code.append(f'{label_top}:')
+        self.condition.c_eval(generator, None, label_end)
+        self.body.gen_code(generator)
+        generator.mark_line(self)
+        generator.code.append(f'jump {label_top}')
+        generator.code.append(f'{label_end}:')
+
+class Print(Statement):
+    __slots__ = ('expr',)
+
     def __init__(self, expr):
         self.expr = expr
 
     def __repr__(self):
         return f"Print({self.expr})"
 
-class LessThan:
+    def gen_code(self, generator):
+        self.expr.gen_code(generator)
+        generator.code.append('call Obj: print')
+        generator.code.append('pop')
+
+class LessThan(ASTNode):
+    __slots__ = ('left', 'right')
+
     def __init__(self, left, right):
         self.left = left
         self.right = right 
     
     def __repr__(self):
         return f"LessThan({self.left}, {self.right})"
+    
+    def gen_code(self, generator):
+        emit_binary(self, generator, 'less')
+
+class GreaterThan(ASTNode):
+    __slots__ = ('left', 'right')
 
-class GreaterThan:
     def __init__(self, left, right):
         self.left = left
         self.right = right 
     
     def __repr__(self):
         return f"GreaterThan({self.left}, {self.right})"
+    
+    def gen_code(self, generator):
+        emit_binary(self, generator, 'greater')
+
+class LessThanOrEqual(ASTNode):
+    __slots__ = ('left', 'right')
 
-class LessThanOrEqual:
     def __init__(self, left, right):
         self.left = left
         self.right = right 
     
     def __repr__(self):
         return f"LessThanOrEqual({self.left}, {self.right})"
+    
+    def gen_code(self, generator):
+        emit_binary(self, generator, 'atmost')
+
+class GreaterThanOrEqual(ASTNode):
+    __slots__ = ('left', 'right')
 
-class GreaterThanOrEqual:
     def __init__(self, left, right):
         self.left = left
         self.right = right 
     
     def __repr__(self):
         return f"GreaterThanOrEqual({self.left}, {self.right})"
+    
+    def gen_code(self, generator):
+        emit_binary(self, generator, 'atleast')
+
+class Equal(ASTNode):
+    __slots__ = ('left', 'right')
 
-class Equal:
     def __init__(self, left, right):
         self.left = left
         self.right = right 
     
     def __repr__(self):
         return f"Equal({self.left}, {self.right})"
+    
+    def gen_code(self, generator):
+        emit_binary(self, generator, 'equals')
+
 
+class NotEqual(ASTNode):
+    __slots__ = ('left', 'right')
 
-class NotEqual:
     def __init__(self, left, right):
         self.left = left
         self.right = right 
     
     def __repr__(self):
         return f"NotEqual({self.left}, {self.right})"
+    
+    def gen_code(self, generator):
+        emit_binary(self, generator, 'notequals')
+
+class And(ASTNode):
+    __slots__ = ('left', 'right')
 
-class And:
     def __init__(self, left, right):
         self.left = left
         self.right = right
@@ -236,7 +436,23 @@ class And:
     def __repr__(self):
         return f"And({self.left}, {self.right})"
 
-class Or:
+    def gen_code(self, generator):
+        emit_condition_value(self, generator)
+
+    def c_eval(self, generator, true_label, false_label):
+        # The right operand only runs when the left one holds
+        if false_label is None:
+            label_false = generator.new_label()
+            self.left.c_eval(generator, None, label_false)
+            self.right.c_eval(generator, true_label, None)
+            generator.code.append(f'{label_false}:')
+        else:
+            self.left.c_eval(generator, None, false_label)
+            self.right.c_eval(generator, true_label, false_label)
+
+class Or(ASTNode):
+    __slots__ = ('left', 'right')
+
     def __init__(self, left, right):
         self.left = left
         self.right = right
@@ -244,9 +460,53 @@ class Or:
     def __repr__(self):
         return f"Or({self.left}, {self.right})"
 
-class Not:
+    def gen_code(self, generator):
+        emit_condition_value(self, generator)
+
+    def c_eval(self, generator, true_label, false_label):
+        # The right operand only runs when the left one does not hold
+        if true_label is None:
+            label_true = generator.new_label()
+            self.left.c_eval(generator, label_true, None)
+            self.right.c_eval(generator, None, false_label)
+            generator.code.append(f'{label_true}:')
+        else:
+            self.left.c_eval(generator, true_label, None)
+            self.right.c_eval(generator, true_label, false_label)
+
+class Not(ASTNode):
+    __slots__ = ('expr',)
+
     def __init__(self, expr):
         self.expr = expr
 
     def __repr__(self):
-        return f"Not({self.expr})"
\ No newline at end of file
+        return f"Not({self.expr})"
+
+    def gen_code(self, generator):
+        emit_condition_value(self, generator)
+
+    def c_eval(self, generator, true_label, false_label):
+        self.expr.c_eval(generator, false_label, true_label)
+
+
+# (node class, operand type) -> specialized VM instruction, see emit_binary
+SPECIALIZED = {
+    (Add, 'Int'): 'iadd', (Sub, 'Int'): 'isub', (Mul, 'Int'): 'imul', (Div, 'Int'): 'idiv',
+    (Add, 'Float'): 'fadd', (Sub, 'Float'): 'fsub', (Mul, 'Float'): 'fmul', (Div, 'Float'): 'fdiv',
+    (Add, 'String'): 'sconcat',
+    (LessThan, 'Int'): 'ilt', (GreaterThan, 'Int'): 'igt',
+    (LessThanOrEqual, 'Int'): 'ile', (GreaterThanOrEqual, 'Int'): 'ige',
+    (Equal, 'Int'): 'ieq', (NotEqual, 'Int'): 'ine',
+    (LessThan, 'Float'): 'flt', (GreaterThan, 'Float'): 'fgt',
+    (LessThanOrEqual, 'Float'): 'fle', (GreaterThanOrEqual, 'Float'): 'fge',
+    (Equal, 'Float'): 'feq', (NotEqual, 'Float'): 'fne',
+    (Equal, 'String'): 'seq', (NotEqual, 'String'): 'sne',
+}
+
+# Binary node -> method called when the operands are not proven, see emit_binary
+GENERIC = {
+    Add: 'plus', Sub: 'minus', Mul: 'times', Div: 'divide',
+    LessThan: 'less', GreaterThan: 'greater', LessThanOrEqual: 'atmost',
+    GreaterThanOrEqual: 'atleast', Equal: 'equals', NotEqual: 'notequals',
+}
@@ -0,0 +1,133 @@
+"""Compile many Quack programs in parallel.
+
+Each worker process imports quack_parser once, so the parser (and its
+cached LALR tables) is built once per worker rather than once per file,
+and every input gets its own symbol table and its own output object.
+
+Usage:
+    python3 qklib/quack_batch.py 'samples/**/*.qk' -d OBJ -j 4
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import quack_parser
+from quack_optimizer import DEFAULT_LEVEL, MAX_LEVEL
+from quack_peephole import RULES, PeepholeOptimizer
+
+
+def expand_inputs(patterns):
+    """Expand globs (including **) and keep the given order, without duplicates"""
+    seen = {}
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True)) if glob.has_magic(pattern) else [pattern]
+        if not matches:
+            raise SystemExit(f"no files match {pattern}")
+        for path in matches:
+            seen.setdefault(os.path.normpath(path), None)
+    return list(seen)
+
+
+def output_paths(sources, outdir, out_format):
+    """Mirror the input layout under outdir so equal file names do not collide"""
+    base = os.path.commonpath([os.path.dirname(os.path.abspath(s)) for s in sources])
+    paths = []
+    for source in sources:
+        rel = os.path.relpath(os.path.abspath(source), base)
+        paths.append(os.path.join(outdir, os.path.splitext(rel)[0] + '.' + out_format))
+    return paths
+
+
+def compile_job(job):
+    """Worker: compile one file, returning per-phase times or the error,
+    and the peephole rule hits
+    """
+    source, output, out_format, level = job
+    times = {}
+    peephole = PeepholeOptimizer()
+    try:
+        start = time.perf_counter()
+        with open(source) as f:
+            text = f.read()
+        tree = quack_parser.parse_with_symbols(text, {})
+        times['parse'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        codegen, _ = quack_parser.compile_tree(tree, level, peephole)
+        code = codegen.get_code()
+        times['codegen'] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+        quack_parser.write_output(code, output, out_format)
+        times['write'] = time.perf_counter() - start
+        return source, output, times, None, peephole.hits
+    except Exception as e:
+        message = str(e).strip().splitlines()
+        error = f"{e.__class__.__name__}: {message[0] if message else ''}"
+        return source, output, times, error, peephole.hits
+
+
+def print_summary(results, wall):
+    name_width = max([len('file')] + [len(r[0]) for r in results])
+    print(f"{'file':<{name_width}}  {'parse ms':>9} {'codegen ms':>10} {'write ms':>9} {'total ms':>9}  status")
+    for source, _, times, error, _ in results:
+        cols = [times.get(phase) for phase in ('parse', 'codegen', 'write')]
+        total = sum(t for t in cols if t is not None)
+        cells = ' '.join(f'{t * 1000:>{w}.2f}' if t is not None else f'{"-":>{w}}'
+                         for t, w in zip(cols, (9, 10, 9)))
+        print(f"{source:<{name_width}}  {cells} {total * 1000:>9.2f}  {error or 'ok'}")
+    failed = sum(1 for r in results if r[3])
+    busy = sum(sum(r[2].values()) for r in results)
+    print(f"{len(results)} files, {failed} failed, {busy:.3f}s compile time in {wall:.3f}s wall")
+
+
+def print_peephole_totals(results):
+    """Rule hits summed over every file, most productive first"""
+    totals = dict.fromkeys(RULES, 0)
+    for result in results:
+        for rule, hits in result[4].items():
+            totals[rule] += hits
+    for rule, hits in sorted(totals.items(), key=lambda item: -item[1]):
+        print(f"peephole {rule:<14} {hits:>8}")
+
+
+def cli():
+    cli_parser = argparse.ArgumentParser(description="Compile many Quack programs in parallel")
+    cli_parser.add_argument("inputs", nargs="+", help="source files or glob patterns")
+    cli_parser.add_argument("-d", "--outdir", default="OBJ", help="output directory (default OBJ)")
+    cli_parser.add_argument("-f", "--format", choices=["asm", "qko"], default="qko")
+    cli_parser.add_argument("-O", dest="opt_level", type=int, default=DEFAULT_LEVEL,
+                            choices=range(MAX_LEVEL + 1), metavar="LEVEL",
+                            help="optimization level 0-%d (default %d)" % (MAX_LEVEL, DEFAULT_LEVEL))
+    cli_parser.add_argument("--peephole-stats", action="store_true",
+                            help="print how often each peephole rule fired over all inputs")
+    cli_parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(),
+                            help="worker processes (default: one per CPU)")
+    return cli_parser.parse_args()
+
+
+def main():
+    args = cli()
+    sources = expand_inputs(args.inputs)
+    jobs = list(zip(sources, output_paths(sources, args.outdir, args.format),
+                    [args.format] * len(sources), [args.opt_level] * len(sources)))
+    start = time.perf_counter()
+    if args.jobs <= 1 or len(jobs) == 1:
+        results = [compile_job(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=min(args.jobs, len(jobs))) as pool:
+            results = list(pool.map(compile_job, jobs, chunksize=max(1, len(jobs) // (4 * args.jobs))))
+    print_summary(results, time.perf_counter() - start)
+    if args.peephole_stats:
+        print_peephole_totals(results)
+    if any(result[3] for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""Precompiled builtin symbol table.
+
+builtin_methods.json is the source of truth for the builtin classes, but
+parsing it and copying it into every new symbol table is startup work
+that grows with the library.  This module compiles it once into
+builtin_table.py: plain literals that Python caches as bytecode, wrapped
+into read-only mappings (MappingProxyType, tuples for parameter lists)
+at import, with every name interned and every method annotated with its
+vtable slot (see quack_classes.py).
+
+The generated module records the SHA-256 of the JSON it was built from.
+Building it is an explicit step (below); load_builtins() only compares
+the digest with the current file, and when the module is missing or
+stale it warns and reads the JSON directly for that run, never writing
+into the package.
+
+User symbols are layered on top with SymbolTable: lookups fall through
+to the frozen builtins and writes go to the user layer.
+
+Usage:
+    python3 qklib/quack_builtins.py            # rebuild builtin_table.py
+    python3 qklib/quack_builtins.py --check    # exit 1 if it is stale
+"""
+
+import argparse
+import functools
+import hashlib
+import importlib
+import json
+import os
+import sys
+from collections import ChainMap
+from pprint import pformat
+from types import MappingProxyType, SimpleNamespace
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BUILTINS_PATH = os.path.join(HERE, 'builtin_methods.json')
+TABLE_MODULE = 'builtin_table'
+TABLE_PATH = os.path.join(HERE, TABLE_MODULE + '.py')
+
+
+def source_digest(path=BUILTINS_PATH):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def freeze(value):
+    """Read-only copy: dicts become mappingproxies, lists tuples, strings interned"""
+    if isinstance(value, dict):
+        return MappingProxyType({sys.intern(k): freeze(v) for k, v in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    if isinstance(value, str):
+        return sys.intern(value)
+    return value
+
+
+def thaw(value):
+    """Mutable (and JSON-serializable) copy of a frozen value"""
+    if isinstance(value, (dict, MappingProxyType, ChainMap)):
+        return {k: thaw(v) for k, v in value.items()}
+    if isinstance(value, tuple):
+        return [thaw(v) for v in value]
+    return value
+
+
+def annotated_table(path=BUILTINS_PATH):
+    """The JSON table with a 'slot' added to every method"""
+    from quack_classes import ClassLayout, normalize_method
+    with open(path) as f:
+        table = json.load(f)
+    layout = ClassLayout({name: (entry.get('super', name), entry.get('methods', {}))
+                          for name, entry in table.items()})
+    for entry in table.values():
+        for method, signature in entry.get('methods', {}).items():
+            signature['slot'] = layout.selectors[normalize_method(method)]
+    return table, layout.selectors
+
+
+def build(path=BUILTINS_PATH, out_path=TABLE_PATH):
+    """Write the importable table for the JSON at path"""
+    table, selectors = annotated_table(path)
+    lines = [
+        f'"""Generated by quack_builtins.py from {os.path.basename(path)}; do not edit."""',
+        '',
+        'from quack_builtins import freeze',
+        '',
+        f'SOURCE_SHA256 = {source_digest(path)!r}',
+        '',
+        '# method name -> vtable slot',
+        'SELECTORS = freeze(',
+        pformat(selectors, sort_dicts=False),
+        ')',
+        '',
+        'CLASSES = freeze(',
+        pformat(table, width=100, sort_dicts=False),
+        ')',
+        '',
+    ]
+    tmp_path = f'{out_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as out:
+        out.write('\n'.join(lines))
+    os.replace(tmp_path, out_path)
+
+
+@functools.cache
+def load_table():
+    """The generated module (SOURCE_SHA256, SELECTORS, CLASSES), or the same
+    names read from the JSON, with a warning, if the module is missing or
+    stale
+    """
+    digest = source_digest()
+    try:
+        table = importlib.import_module(TABLE_MODULE)
+    except ImportError:
+        table = None
+    if table is not None and table.SOURCE_SHA256 == digest:
+        return table
+    state = 'missing' if table is None else 'stale'
+    print(f'warning: {TABLE_PATH} is {state}; reading {BUILTINS_PATH} '
+          f'(rebuild with python3 qklib/quack_builtins.py)', file=sys.stderr)
+    classes, selectors = annotated_table()
+    return SimpleNamespace(SOURCE_SHA256=digest, SELECTORS=freeze(selectors),
+                           CLASSES=freeze(classes))
+
+
+def load_builtins():
+    """The frozen builtin class table"""
+    return load_table().CLASSES
+
+
+class SymbolTable(ChainMap):
+    """User symbols over the frozen builtin table"""
+    def __init__(self, builtins=None):
+        super().__init__({}, load_builtins() if builtins is None else builtins)
+
+    def thaw(self):
+        return thaw(self)
+
+
+def cli():
+    cli_parser = argparse.ArgumentParser(description="Compile builtin_methods.json into builtin_table.py")
+    cli_parser.add_argument("--check", action="store_true",
+                            help="only report whether builtin_table.py is up to date")
+    return cli_parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = cli()
+    if args.check:
+        try:
+            table = importlib.import_module(TABLE_MODULE)
+        except ImportError:
+            sys.exit(f'{TABLE_PATH} is missing')
+        if table.SOURCE_SHA256 != source_digest():
+            sys.exit(f'{TABLE_PATH} is stale')
+        print(f'{TABLE_PATH} is up to date')
+    else:
+        build()
+        print(f'wrote {TABLE_PATH}')
@@ -0,0 +1,224 @@
+"""Content-addressed incremental compilation cache.
+
+A source file is split into its top-level statements (each `def`, `if`,
+`while`, assignment or print is one unit) by a light scanner that only
+tracks braces and string literals.  Each unit is compiled on its own and
+its generated code is stored in a size-bounded SQLite cache under a key
+made of
+
+    - the unit's source text,
+    - the symbol-table entries (variable types, function signatures) of
+      every identifier the unit mentions, as they are before the unit,
+    - a fingerprint of the compiler sources,
+
+so editing one statement only recompiles that statement (and any later
+statement whose dependencies changed type).  Cached code is relocatable:
+variables are stored by local slot with the slot's name, labels by local
+number, and linking maps both onto the program-wide numbering.  The
+linked result is identical to what a whole-file compile produces.
+"""
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+
+from quack_code_generator import QuackCodeGenerator
+from quack_optimizer import DEFAULT_LEVEL, optimize
+
+DEFAULT_LIMIT = 64 * 1024 * 1024
+
+# Statement boundaries: string literals are skipped as a whole
+SCAN_RE = re.compile(r'"(?:\\.|[^"\\])*"|(?P<open>\{)|(?P<close>\})|(?P<end>;)|(?P<else>\belse\b)')
+# The same over bytes, for scanning a memory-mapped file
+SCAN_BYTES_RE = re.compile(SCAN_RE.pattern.encode('ascii'))
+STRING_RE = re.compile(r'"(?:\\.|[^"\\])*"')
+IDENT_RE = re.compile(r'[_a-zA-Z][_a-zA-Z0-9]*')
+KEYWORDS = {'def', 'return', 'print', 'if', 'else', 'while', 'true', 'false',
+            'Int', 'Float', 'String', 'Bool', 'Void'}
+
+JUMPS = ('jump', 'jump_if', 'jump_ifnot')
+
+# Source files whose changes invalidate every cached unit
+COMPILER_SOURCES = ['quack_grammar.txt', 'quack_transformer.py', 'quack_ast.py',
+                    'quack_code_generator.py', 'quack_optimizer.py', 'quack_cache.py']
+
+
+def compiler_fingerprint():
+    digest = hashlib.sha256()
+    here = os.path.dirname(os.path.abspath(__file__))
+    for name in COMPILER_SOURCES:
+        with open(os.path.join(here, name), 'rb') as source:
+            digest.update(source.read())
+    return digest.hexdigest()
+
+
+def unit_spans(text):
+    """Yield (start, end) of each top-level statement.  text may be a str
+    or any bytes-like object, such as an mmap of the source file.
+    """
+    scan = SCAN_RE if isinstance(text, str) else SCAN_BYTES_RE
+    depth = 0
+    start = 0
+    pending = None      # end of a closed top-level block that may still take an else
+    for m in scan.finditer(text):
+        token = m.lastgroup
+        if pending is not None:
+            if token == 'else' and not text[pending:m.start()].strip():
+                pending = None
+                continue
+            yield start, pending
+            start, pending = pending, None
+        if token == 'open':
+            depth += 1
+        elif token == 'close':
+            depth -= 1
+            if depth == 0:
+                pending = m.end()
+        elif token == 'end' and depth == 0:
+            yield start, m.end()
+            start = m.end()
+    if pending is not None:
+        yield start, pending
+        start = pending
+    if text[start:].strip():
+        yield start, len(text)
+
+
+def split_units(text):
+    """Yield the source text of each top-level statement"""
+    for start, end in unit_spans(text):
+        yield text[start:end]
+
+
+def referenced_names(unit):
+    return sorted(set(IDENT_RE.findall(STRING_RE.sub('', unit))) - KEYWORDS)
+
+
+class CompileCache:
+    """SQLite-backed store of compiled units with LRU eviction by size"""
+    def __init__(self, path, limit=DEFAULT_LIMIT):
+        self.limit = limit
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.touched = []
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=30)
+        self.db.execute('CREATE TABLE IF NOT EXISTS units ('
+                        'key TEXT PRIMARY KEY, data BLOB NOT NULL, '
+                        'size INTEGER NOT NULL, atime REAL NOT NULL)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS units_atime ON units(atime)')
+
+    def get(self, key):
+        row = self.db.execute('SELECT data FROM units WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.touched.append(key)
+        return json.loads(row[0])
+
+    def put(self, key, unit):
+        data = json.dumps(unit, separators=(',', ':'))
+        self.db.execute('INSERT OR REPLACE INTO units VALUES (?, ?, ?, ?)',
+                        (key, data, len(data), time.time()))
+
+    def total_bytes(self):
+        return self.db.execute('SELECT COALESCE(SUM(size), 0) FROM units').fetchone()[0]
+
+    def entries(self):
+        return self.db.execute('SELECT COUNT(*) FROM units').fetchone()[0]
+
+    def evict(self):
+        """Drop least recently used units until the cache fits its limit"""
+        excess = self.total_bytes() - self.limit
+        if excess <= 0:
+            return
+        rows = self.db.execute('SELECT key, size FROM units ORDER BY atime')
+        doomed = []
+        for key, size in rows:
+            if excess <= 0:
+                break
+            doomed.append((key,))
+            excess -= size
+        self.db.executemany('DELETE FROM units WHERE key = ?', doomed)
+        self.evicted += len(doomed)
+
+    def close(self):
+        now = time.time()
+        self.db.executemany('UPDATE units SET atime = ? WHERE key = ?',
+                            [(now, key) for key in self.touched])
+        self.evict()
+        self.db.commit()
+        self.final_size = (self.total_bytes(), self.entries())
+        self.db.close()
+        self.db = None
+
+    def stats(self):
+        size, entries = self.final_size if self.db is None else (self.total_bytes(), self.entries())
+        return {'hits': self.hits, 'misses': self.misses, 'bytes': size,
+                'entries': entries, 'evicted': self.evicted}
+
+
+def compile_unit(unit_text, symbols, parse, level=DEFAULT_LEVEL):
+    """Compile one top-level statement against the given symbol table,
+    which is updated in place.  Returns the relocatable unit record.
+    """
+    before = dict(symbols)
+    tree, _ = optimize(parse(unit_text, symbols), level)
+    codegen = QuackCodeGenerator()
+    codegen.generate(tree)
+    return {
+        'code': codegen.code,
+        'vars': list(codegen.var_mapping),
+        'labels': codegen.label_counter,
+        'methods': codegen.methods,
+        'exports': {name: value for name, value in symbols.items() if before.get(name) != value},
+    }
+
+
+def relocate(lines, slots, label_base):
+    """Map local slots (unless slots is None) and labels onto the linked numbering"""
+    out = []
+    for line in lines:
+        op, _, arg = line.partition(' ')
+        if op in ('load', 'store', 'tee') and slots is not None:
+            line = f'{op} {slots[int(arg)]}'
+        elif op in JUMPS:
+            line = f'{op} label_{int(arg[6:]) + label_base}'
+        elif op.startswith('label_') and op.endswith(':'):
+            line = f'label_{int(op[6:-1]) + label_base}:'
+        out.append(line)
+    return out
+
+
+def compile_incremental(text, cache, parse, level=DEFAULT_LEVEL):
+    """Compile a whole file unit by unit, reusing cached units.
+
+    parse(text, symbols) must parse and type-check text with symbols as
+    the transformer's symbol table (updating it in place).
+    """
+    fingerprint = compiler_fingerprint()
+    linked = QuackCodeGenerator()
+    symbols = {}
+    for unit_text in split_units(text):
+        unit_text = unit_text.strip()
+        deps = [(name, symbols.get(name)) for name in referenced_names(unit_text)]
+        key = hashlib.sha256(json.dumps([fingerprint, level, unit_text, deps]).encode('utf-8')).hexdigest()
+        unit = cache.get(key)
+        if unit is None:
+            unit = compile_unit(unit_text, symbols, parse, level)
+            cache.put(key, unit)
+        else:
+            symbols.update(unit['exports'])
+        slots = [linked.get_var_index(name) for name in unit['vars']]
+        label_base = linked.label_counter
+        linked.label_counter += unit['labels']
+        linked.code.extend(relocate(unit['code'], slots, label_base))
+        for name, params, body in unit['methods']:
+            # Method frames are private, so only their labels move
+            linked.methods.append((name, params, relocate(body, None, label_base)))
+    return linked
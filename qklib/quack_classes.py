@@ -0,0 +1,119 @@
+"""Class layout: inheritance flattened into integer-indexed vtables.
+
+The class table in builtin_methods.json nests each class's methods under
+string keys and only names the superclass, so resolving a call means
+walking the `super` chain and looking names up at every step.  This
+pass does that once.  Every method name (selector) gets one slot number
+for the whole program, assigned superclasses first, and every class gets
+a vtable: a list indexed by slot whose entries name the class that
+defines the method the class actually runs (its own, or the nearest
+inherited one), or None.
+
+Because a selector has the same slot in every class, `call Int: plus`
+can be compiled to a slot index once and still dispatch virtually on
+whatever class the receiver turns out to have.
+
+Method names are normalized to lower case: the JSON table spells the
+operators PLUS, TIMES, MINUS and DIVIDE while the VM and the code
+generator use plus, times, minus and divide.
+
+The builtin table is read from its precompiled form (quack_builtins.py),
+which also fixes the slot numbers of the builtin selectors; layouts that
+add classes pass those in as `selectors` so the numbering never shifts.
+"""
+
+import json
+
+from quack_builtins import load_builtins
+
+ROOT_CLASS = 'Obj'
+
+
+def normalize_method(name):
+    return name if name.startswith('$') else name.lower()
+
+
+def load_class_table(path=None):
+    """The builtin class table, or the JSON one at path, as {class: (super, {method: signature})}"""
+    if path is None:
+        table = load_builtins()
+    else:
+        with open(path) as f:
+            table = json.load(f)
+    return {name: (entry.get('super', ROOT_CLASS),
+                   {normalize_method(method): signature
+                    for method, signature in entry.get('methods', {}).items()})
+            for name, entry in table.items()}
+
+
+def merge_tables(*tables):
+    """Union of class tables; later tables win on the superclass and add methods"""
+    merged = {}
+    for table in tables:
+        for name, (super_class, methods) in table.items():
+            _, known = merged.get(name, (super_class, {}))
+            merged[name] = (super_class, dict(known, **dict(methods)))
+    return merged
+
+
+class ClassLayout:
+    def __init__(self, classes, selectors=()):
+        """classes: {name: (super, methods)}, methods any iterable of names;
+        selectors: slots 0..n-1 already assigned, as {method: slot}
+        """
+        self.classes = []           # superclasses before subclasses
+        self.selectors = dict(selectors)    # method name -> slot
+        self.vtables = {}           # class -> [defining class or None] per slot
+        seen = set()
+
+        def place(name, chain=()):
+            if name in seen:
+                return
+            if name in chain:
+                raise ValueError(f"inheritance cycle through {name}")
+            super_class = classes[name][0]
+            if super_class != name:
+                if super_class not in classes:
+                    raise ValueError(f"{name} extends unknown class {super_class}")
+                place(super_class, chain + (name,))
+            seen.add(name)
+            self.classes.append(name)
+
+        for name in classes:
+            place(name)
+
+        for name in self.classes:
+            super_class, methods = classes[name]
+            vtable = list(self.vtables[super_class]) if super_class != name else []
+            for method in methods:
+                method = normalize_method(method)
+                slot = self.selectors.setdefault(method, len(self.selectors))
+                vtable.extend([None] * (slot + 1 - len(vtable)))
+                vtable[slot] = name
+            self.vtables[name] = vtable
+        for vtable in self.vtables.values():
+            vtable.extend([None] * (len(self.selectors) - len(vtable)))
+        self.class_index = {name: i for i, name in enumerate(self.classes)}
+
+    def slot(self, method):
+        """Slot of a selector, or None if no class defines it"""
+        return self.selectors.get(normalize_method(method))
+
+    def resolve(self, clazz, method):
+        """Class whose definition of method an instance of clazz runs, or None"""
+        slot = self.slot(method)
+        return None if slot is None else self.vtables[clazz][slot]
+
+    def dump(self):
+        """Readable vtables, one line per class"""
+        names = sorted(self.selectors, key=self.selectors.get)
+        lines = []
+        for clazz in self.classes:
+            entries = [f'{slot}:{names[slot]}@{owner}'
+                       for slot, owner in enumerate(self.vtables[clazz]) if owner is not None]
+            lines.append(f'{clazz}: ' + ' '.join(entries))
+        return '\n'.join(lines)
+
+
+if __name__ == "__main__":
+    print(ClassLayout(load_class_table()).dump())
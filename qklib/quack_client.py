@@ -0,0 +1,96 @@
+"""Thin client for quackd.
+
+Only the standard library is imported, so the client starts in a
+fraction of the time a full compiler process needs.  If no server is
+listening, compile requests fall back to running quack_parser.py.
+
+Usage:
+    python3 qklib/quack_client.py compile prog.qk -o OBJ/prog.qko
+    python3 qklib/quack_client.py check prog.qk
+    python3 qklib/quack_client.py stats
+    python3 qklib/quack_client.py shutdown
+"""
+
+import argparse
+import json
+import os
+import socket
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def default_socket_path():
+    # Keep in step with quackd.default_socket_path (not imported: it pulls in Lark)
+    if os.environ.get('QUACK_SOCKET'):
+        return os.environ['QUACK_SOCKET']
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir:
+        return os.path.join(runtime_dir, 'quackd.sock')
+    return f'/tmp/quackd-{os.getuid()}.sock'
+
+
+def request(path, message):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+        conn.connect(path)
+        conn.sendall(json.dumps(message).encode('utf-8') + b'\n')
+        reply = conn.makefile('rb').readline()
+    if not reply:
+        raise ConnectionError('quackd closed the connection')
+    return json.loads(reply)
+
+
+def cli():
+    cli_parser = argparse.ArgumentParser(description="Client for the quackd compile server")
+    cli_parser.add_argument("op", choices=["compile", "check", "stats", "shutdown"])
+    cli_parser.add_argument("source", nargs="?", help="Quack source file")
+    cli_parser.add_argument("-o", "--output", help="output file (compile)")
+    cli_parser.add_argument("-f", "--format", choices=["asm", "qko"])
+    cli_parser.add_argument("-O", dest="opt_level", type=int,
+                            help="optimization level (default: the compiler's)")
+    cli_parser.add_argument("--socket", default=default_socket_path())
+    cli_parser.add_argument("--no-fallback", action="store_true",
+                            help="fail instead of compiling locally when quackd is not running")
+    args = cli_parser.parse_args()
+    if args.op in ("compile", "check") and not args.source:
+        cli_parser.error(f"{args.op} needs a source file")
+    return args
+
+
+def main():
+    args = cli()
+    message = {'op': args.op}
+    if args.source:
+        message['source'] = os.path.abspath(args.source)
+    if args.output:
+        message['output'] = os.path.abspath(args.output)
+        message['format'] = args.format or ('qko' if args.output.endswith('.qko') else 'asm')
+    if args.opt_level is not None:
+        message['opt'] = args.opt_level
+    try:
+        response = request(args.socket, message)
+    except (FileNotFoundError, ConnectionRefusedError):
+        if args.op != 'compile' or args.no_fallback:
+            raise SystemExit(f'quackd is not running on {args.socket}')
+        command = [sys.executable, os.path.join(HERE, 'quack_parser.py'), args.source]
+        if args.output:
+            command += ['-o', args.output]
+        if args.format:
+            command += ['-f', args.format]
+        if args.opt_level is not None:
+            command += [f'-O{args.opt_level}']
+        os.execv(sys.executable, command)
+
+    if not response.get('ok'):
+        print(response.get('error', 'unknown error'), file=sys.stderr)
+        sys.exit(1)
+    if 'code' in response:
+        print(f"Code Generation: \n{response['code']}")
+    elif 'symbols' in response:
+        print(json.dumps(response['symbols'], indent=4))
+    elif 'stats' in response:
+        print(json.dumps(response['stats'], indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,30 @@
 from quack_ast import Add, Assign, Block, FuncDef, Int, Return, Sub, Var
 
+SLOT_OPS = ('load', 'store', 'tee')
+# Superinstructions whose operands are slots too
+FUSED_SLOT_OPS = ('inc_local', 'load_load_add')
+
+
+def frame_size(code):
+    """Local slots a body needs: one more than the highest slot it uses"""
+    size = 0
+    for line in code:
+        op, _, arg = line.partition(' ')
+        if op in SLOT_OPS:
+            size = max(size, int(arg) + 1)
+        elif op in FUSED_SLOT_OPS:
+            size = max([size] + [int(slot) + 1 for slot in arg.split()])
+    return size
+
 
 class QuackCodeGenerator:
     def __init__(self):
         self.code = []
         self.var_mapping = {}
         self.var_counter = 0
+        self.label_counter = 0
+        self.methods = []
+        self.outer = []     # (code, var_mapping, var_counter) of the enclosing bodies
     
     def generate(self, node):
         if isinstance(node, list):
@@ -17,12 +36,35 @@ class QuackCodeGenerator:
     def generate_error(self, node):
         raise Exception(f'No generator found for{type(node).__name__}')
     
+    def mark_line(self, node):
+        """`.line N` before the code of a statement that carries a source line"""
+        line = getattr(node, 'line', None)
+        if line is None:
+            return
+        directive = f'.line {line}'
+        if self.code and self.code[-1].startswith('.line '):
+            self.code[-1] = directive     # the previous statement emitted nothing
+        else:
+            self.code.append(directive)
+
     def get_var_index(self, var_name):
         if var_name not in self.var_mapping:
             self.var_mapping[var_name] = self.var_counter
             self.var_counter += 1
         return self.var_mapping[var_name]
 
+    def begin_method(self, name, params):
+        # Method bodies are collected separately and placed after the main halt in get_code.
+        # Each method has its own frame, so its variables are numbered from 0.
+        self.outer.append((self.code, self.var_mapping, self.var_counter))
+        self.code = []
+        self.var_mapping = {}
+        self.var_counter = 0
+        self.methods.append((name, params, self.code))
+
+    def end_method(self):
+        self.code, self.var_mapping, self.var_counter = self.outer.pop()
+
     
 
    
@@ -61,5 +103,16 @@ class QuackCodeGenerator:
         return label
     
     def get_code(self):
-        self.code.insert(0, f'alloc {len(self.var_mapping)}')
+        self.code.insert(0, f'alloc {frame_size(self.code)}')
+        if self.methods:
+            self.code.append('halt')
+        for name, params, body in self.methods:
+            self.code.append(f'.method {name}')
+            if params:
+                self.code.append(f'.args {", ".join(params)}')
+            if body and body[0].startswith('.line '):
+                self.code.append(body[0])     # the prologue belongs to the def
+            self.code.append('enter')
+            self.code.append(f'alloc {frame_size(body)}')
+            self.code.extend(body)
         return '\n'.join(self.code)
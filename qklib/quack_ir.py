@@ -0,0 +1,789 @@
+"""Control-flow graph and SSA form between the typed AST and the VM code.
+
+build_program turns the tree (after the AST passes of quack_optimizer)
+into one Function per body, the main program first and then every def.
+A function is a list of basic blocks; a block holds phis, straight-line
+instructions and one terminator:
+
+    jump B              unconditional
+    branch v T F        on the Bool value v
+    return v            leave the body with v
+    (none)              fall off the end of the body
+
+`if` and `while` become diamonds and loops, and their conditions become
+branch chains as in c_eval, so `&&`, `||` and `!` short-circuit.  Used as
+a value, such a condition assigns true or false to a hidden variable
+($0, $1, ...) on each path and reads it back at the join.  Statements
+after a `return` land in blocks no path reaches, which are dropped.
+
+to_ssa then puts each function in SSA form (Cytron et al.): dominators
+by the iterative algorithm of Cooper, Harvey and Kennedy over reverse
+postorder, dominance frontiers, phis at the iterated frontiers of each
+variable's assignments, and renaming along the dominator tree.  Phis
+whose operands are all the same value, or that nothing reads, are
+removed afterwards.  Every step is linear in the size of the function
+for the structured control flow Quack has; benchmarks/bench_ir.py
+checks that on large generated programs.
+
+Renaming never folds one variable's value into another: `y = x` is a
+copy instruction that y owns.  The result is conventional SSA: the
+versions of one variable are never live at the same time, so lowering
+gives each variable one slot, every value its variable owns is stored
+there, and a phi costs nothing unless one of its operands is a literal
+(or `nothing`, for a variable not yet assigned on that path), which is
+copied in at the end of the predecessor.  Only blocks ending in a jump
+lead to a phi, so the copies never need a block of their own.  Values
+no variable owns are emitted as expression trees where they are used
+when that keeps the order of evaluation, and get a slot otherwise.
+
+The lowered code goes into a QuackCodeGenerator and through the same
+instruction-level passes as the AST code generator's (quack_parser.py
+--ir).  Line tables (-g) are not carried through the IR.
+
+Usage:
+    python3 qklib/quack_ir.py prog.qk [-O 2] [--dominators] [--lower]
+"""
+
+import argparse
+
+from quack_ast import (And, Block, Boolean, Float, FuncCall, GENERIC, Int, MethodCall, Not, Or,
+                       SPECIALIZED, String, Var, static_class)
+from quack_code_generator import QuackCodeGenerator
+from quack_optimizer import DEFAULT_LEVEL, optimize
+
+
+class Value:
+    """One SSA value.
+
+    op      'const' (attr: the operand of `const`), 'param' (attr: index),
+            'copy' (args: the value copied), 'phi' (args: one per
+            predecessor of its block), or 'op': args are pushed and attr
+            is the VM instruction (`iadd`, `call Obj: print`, ...).
+            'get' and 'set' (attr: variable name) only exist until
+            renaming.
+    home    the variable that owns the value, if any
+    """
+    __slots__ = ('id', 'op', 'args', 'attr', 'block', 'home')
+
+    def __init__(self, id, op, args=(), attr=None, block=None, home=None):
+        self.id = id
+        self.op = op
+        self.args = list(args)
+        self.attr = attr
+        self.block = block
+        self.home = home
+
+    def __repr__(self):
+        return self.attr if self.op == 'const' else f'v{self.id}'
+
+
+class BasicBlock:
+    __slots__ = ('id', 'phis', 'instrs', 'preds', 'succs', 'term',
+                 'rpo', 'idom', 'children', 'frontier', 'pre', 'post', 'label')
+
+    def __init__(self, id):
+        self.id = id
+        self.phis = []
+        self.instrs = []
+        self.preds = []
+        self.succs = []
+        self.term = None
+        self.idom = None
+        self.children = []
+        self.frontier = []
+        self.label = None
+
+    def __repr__(self):
+        return f'b{self.id}'
+
+
+class Function:
+    """A body: blocks in layout order, entry first"""
+
+    def __init__(self, name, params):
+        self.name = name            # None for the main program
+        self.params = params
+        self.blocks = []
+        self.entry = None
+        self.order = []             # reverse postorder, once dominators are computed
+        self.constants = {}
+        self.counter = 0
+
+    def value(self, op, args=(), attr=None, block=None, home=None):
+        self.counter += 1
+        return Value(self.counter, op, args, attr, block, home)
+
+    def constant(self, text):
+        """The literal `const text`; literals belong to no block"""
+        if text not in self.constants:
+            self.constants[text] = self.value('const', attr=text)
+        return self.constants[text]
+
+    def values(self):
+        for block in self.blocks:
+            yield from block.phis
+            yield from block.instrs
+
+    def dump(self):
+        lines = [f'def {self.name or "main"}({", ".join(self.params)}):']
+        for block in self.blocks:
+            notes = []
+            if block.preds:
+                notes.append('preds ' + ' '.join(map(repr, block.preds)))
+            if block.idom is not None:
+                notes.append(f'idom {block.idom!r}')
+            lines.append(f'  {block!r}:' + (f'  ; {", ".join(notes)}' if notes else ''))
+            for value in block.phis + block.instrs:
+                if value.op == 'op':
+                    text = f'{value.attr} ' + ' '.join(map(repr, value.args))
+                elif value.op == 'phi':
+                    text = 'phi ' + ', '.join(f'{arg!r} from {pred!r}'
+                                              for arg, pred in zip(value.args, block.preds))
+                elif value.op in ('get', 'set', 'param'):
+                    text = f'{value.op} {value.attr} ' + ' '.join(map(repr, value.args))
+                else:
+                    text = f'{value.op} ' + ' '.join(map(repr, value.args))
+                home = f'  ; {value.home}' if value.home else ''
+                lines.append(f'    {value!r} = {text.rstrip()}{home}')
+            if block.term is not None:
+                kind, *operands = block.term
+                lines.append(f'    {kind} ' + ' '.join(map(repr, operands)))
+        return '\n'.join(lines)
+
+
+class Program:
+    def __init__(self):
+        self.functions = []         # the main program first
+
+    def dump(self):
+        return '\n\n'.join(function.dump() for function in self.functions)
+
+    def stats(self):
+        """Blocks, phis and values over every function"""
+        stats = {'functions': len(self.functions), 'blocks': 0, 'phis': 0, 'values': 0}
+        for function in self.functions:
+            stats['blocks'] += len(function.blocks)
+            for block in function.blocks:
+                stats['phis'] += len(block.phis)
+                stats['values'] += len(block.phis) + len(block.instrs)
+        return stats
+
+
+# Building the control-flow graph
+
+class FunctionBuilder:
+    def __init__(self, program, name, params):
+        self.program = program
+        self.function = Function(name, params)
+        program.functions.append(self.function)
+        self.blocks = 0
+        self.temps = 0
+        self.block = None
+        self.function.entry = self.start(self.new_block())
+        for index, param in enumerate(params):
+            self.assign(param, self.emit('param', attr=index))
+
+    def new_block(self):
+        block = BasicBlock(self.blocks)
+        self.blocks += 1
+        return block
+
+    def start(self, block):
+        """Continue in block, which is laid out after the blocks started so far"""
+        self.function.blocks.append(block)
+        self.block = block
+        return block
+
+    def emit(self, op, args=(), attr=None):
+        value = self.function.value(op, args, attr, self.block)
+        self.block.instrs.append(value)
+        return value
+
+    def terminate(self, term, *targets):
+        self.block.term = term
+        self.block.succs = list(targets)
+        for target in targets:
+            target.preds.append(self.block)
+
+    def jump(self, target):
+        self.terminate(('jump', target), target)
+
+    def assign(self, name, value):
+        self.emit('set', [value], name)
+
+    def build(self, statements):
+        for stmt in statements:
+            self.statement(stmt)
+        finish(self.function)
+        return self.function
+
+    def statement(self, node):
+        method = getattr(self, f'visit_{type(node).__name__}', None)
+        if method is None:
+            raise NotImplementedError(f'no IR for {type(node).__name__}')
+        method(node)
+
+    # Statements
+
+    def visit_Assign(self, node):
+        self.assign(node.var.name, self.expr(node.expr))
+
+    def visit_Print(self, node):
+        self.emit('op', [self.expr(node.expr)], 'call Obj: print')
+
+    def visit_Block(self, node):
+        for stmt in node.statements:
+            self.statement(stmt)
+
+    def visit_Return(self, node):
+        self.block.term = ('return', self.expr(node.expr))
+        self.start(self.new_block())     # unreachable until a label
+
+    def visit_If(self, node):
+        then_block, else_block, join = self.new_block(), self.new_block(), self.new_block()
+        self.condition(node.condition, then_block, else_block)
+        self.start(then_block)
+        self.visit_Block(node.then_body)
+        self.jump(join)
+        self.start(else_block)
+        self.visit_Block(node.else_body)
+        self.jump(join)
+        self.start(join)
+
+    def visit_While(self, node):
+        header, body, exit = self.new_block(), self.new_block(), self.new_block()
+        self.jump(header)
+        self.start(header)
+        self.condition(node.condition, body, exit)
+        self.start(body)
+        self.visit_Block(node.body)
+        self.jump(header)
+        self.start(exit)
+
+    def visit_FuncDef(self, node):
+        builder = FunctionBuilder(self.program, node.name, [param for param, _ in node.params])
+        builder.build(node.body.statements)
+
+    # Conditions and expressions
+
+    def condition(self, node, if_true, if_false):
+        """Branch to if_true or if_false, short-circuiting && and ||"""
+        if isinstance(node, And):
+            middle = self.new_block()
+            self.condition(node.left, middle, if_false)
+            self.start(middle)
+            self.condition(node.right, if_true, if_false)
+        elif isinstance(node, Or):
+            middle = self.new_block()
+            self.condition(node.left, if_true, middle)
+            self.start(middle)
+            self.condition(node.right, if_true, if_false)
+        elif isinstance(node, Not):
+            self.condition(node.expr, if_false, if_true)
+        elif isinstance(node, Boolean):
+            self.jump(if_true if node.value else if_false)
+        else:
+            value = self.expr(node)
+            self.terminate(('branch', value, if_true, if_false), if_true, if_false)
+
+    def condition_value(self, node):
+        name = f'${self.temps}'
+        self.temps += 1
+        yes, no, join = self.new_block(), self.new_block(), self.new_block()
+        self.condition(node, yes, no)
+        for block, literal in ((yes, 'true'), (no, 'false')):
+            self.start(block)
+            self.assign(name, self.function.constant(literal))
+            self.jump(join)
+        self.start(join)
+        return self.emit('get', attr=name)
+
+    def expr(self, node):
+        if isinstance(node, Var):
+            return self.emit('get', attr=node.name)
+        if isinstance(node, Boolean):
+            return self.function.constant('true' if node.value else 'false')
+        if isinstance(node, (Int, Float)):
+            return self.function.constant(f'{node.value}')
+        if isinstance(node, String):
+            return self.function.constant(f'"{node.value}"')
+        if isinstance(node, (And, Or, Not)):
+            return self.condition_value(node)
+        if type(node) in GENERIC:
+            left, right = self.expr(node.left), self.expr(node.right)
+            left_type = getattr(node.left, 'inferred_type', None)
+            opcode = None
+            if left_type == getattr(node.right, 'inferred_type', None):
+                opcode = SPECIALIZED.get((type(node), left_type))
+            generic = f'call {static_class(node.left)}: {GENERIC[type(node)]}'
+            return self.emit('op', [left, right], opcode or generic)
+        if isinstance(node, FuncCall):
+            args = [self.expr(arg) for arg in node.args]
+            return self.emit('op', args, f'call $Main: {node.func_name}')
+        if isinstance(node, MethodCall):
+            args = [self.expr(node.obj)] + [self.expr(arg) for arg in node.args]
+            receiver_type = getattr(node.obj, 'inferred_type', None) or 'Obj'
+            return self.emit('op', args, f'call {receiver_type}: {node.method_name}')
+        raise NotImplementedError(f'no IR for {type(node).__name__}')
+
+
+def finish(function):
+    """Drop the blocks no path reaches and number the rest in layout order"""
+    reachable = {function.entry}
+    pending = [function.entry]
+    while pending:
+        for succ in pending.pop().succs:
+            if succ not in reachable:
+                reachable.add(succ)
+                pending.append(succ)
+    function.blocks = [block for block in function.blocks if block in reachable]
+    for index, block in enumerate(function.blocks):
+        block.id = index
+        block.preds = [pred for pred in block.preds if pred in reachable]
+
+
+def build_program(tree):
+    """Program for tree (a Block of statements, or a list of them), not yet in SSA form"""
+    statements = tree.statements if isinstance(tree, Block) else list(tree)
+    program = Program()
+    FunctionBuilder(program, None, []).build(statements)
+    return program
+
+
+# Dominators
+
+def reverse_postorder(entry):
+    order = []
+    seen = {entry}
+    stack = [(entry, iter(entry.succs))]
+    while stack:
+        block, succs = stack[-1]
+        for succ in succs:
+            if succ not in seen:
+                seen.add(succ)
+                stack.append((succ, iter(succ.succs)))
+                break
+        else:
+            stack.pop()
+            order.append(block)
+    order.reverse()
+    return order
+
+
+def intersect(a, b):
+    while a is not b:
+        while a.rpo > b.rpo:
+            a = a.idom
+        while b.rpo > a.rpo:
+            b = b.idom
+    return a
+
+
+def compute_dominators(function):
+    """Immediate dominators, the dominator tree and dominance frontiers.
+
+    Sets block.idom (None for the entry), block.children, block.frontier,
+    block.rpo and block.pre/block.post (dominator tree numbering, see
+    dominates), and function.order.
+    """
+    order = reverse_postorder(function.entry)
+    function.order = order
+    for index, block in enumerate(order):
+        block.rpo = index
+        block.idom = None
+        block.children = []
+        block.frontier = []
+    entry = function.entry
+    entry.idom = entry
+    changed = True
+    while changed:
+        changed = False
+        for block in order[1:]:
+            idom = None
+            for pred in block.preds:
+                if pred.idom is not None:
+                    idom = pred if idom is None else intersect(pred, idom)
+            if idom is not block.idom:
+                block.idom = idom
+                changed = True
+    entry.idom = None
+    for block in order[1:]:
+        block.idom.children.append(block)
+
+    for block in order:
+        if len(block.preds) < 2:
+            continue
+        for pred in block.preds:
+            runner = pred
+            while runner is not block.idom:
+                if block not in runner.frontier:
+                    runner.frontier.append(block)
+                runner = runner.idom
+
+    counter = 0
+    stack = [(entry, False)]
+    while stack:
+        block, leaving = stack.pop()
+        counter += 1
+        if leaving:
+            block.post = counter
+            continue
+        block.pre = counter
+        stack.append((block, True))
+        stack.extend((child, False) for child in reversed(block.children))
+
+
+def dominates(a, b):
+    """Whether block a dominates block b (every block dominates itself)"""
+    return a.pre <= b.pre and b.post <= a.post
+
+
+# SSA construction
+
+def to_ssa(function):
+    compute_dominators(function)
+    place_phis(function)
+    simplify_phis(function, rename(function))
+
+
+def place_phis(function):
+    assigned = {}
+    for block in function.blocks:
+        for value in block.instrs:
+            if value.op == 'set':
+                blocks = assigned.setdefault(value.attr, [])
+                if not blocks or blocks[-1] is not block:
+                    blocks.append(block)
+    for name, blocks in assigned.items():
+        has_phi = set()
+        pending = list(blocks)
+        defining = set(blocks)
+        while pending:
+            for join in pending.pop().frontier:
+                if join in has_phi:
+                    continue
+                has_phi.add(join)
+                join.phis.append(function.value('phi', [None] * len(join.preds), name, join,
+                                                home=name))
+                if join not in defining:
+                    defining.add(join)
+                    pending.append(join)
+
+
+def resolve(value, replaced):
+    """What value stands for after renaming and phi removal"""
+    if value not in replaced:
+        return value
+    path = []
+    while value in replaced:
+        path.append(value)
+        value = replaced[value]
+    for step in path:
+        replaced[step] = value
+    return value
+
+
+def rename(function):
+    """Replace 'get' and 'set' by the values they stand for; returns the
+    map from each removed 'get' to its value
+    """
+    undefined = function.constant('nothing')
+    current = {}                # variable -> stack of its values
+    replaced = {}               # 'get' -> the value it reads
+    stack = [(function.entry, None)]
+    while stack:
+        block, pushed = stack.pop()
+        if pushed is not None:
+            for name in pushed:
+                current[name].pop()
+            continue
+        pushed = []
+        for phi in block.phis:
+            current.setdefault(phi.attr, []).append(phi)
+            pushed.append(phi.attr)
+        instrs = []
+        for value in block.instrs:
+            value.args = [resolve(arg, replaced) for arg in value.args]
+            if value.op == 'get':
+                versions = current.get(value.attr)
+                replaced[value] = versions[-1] if versions else undefined
+                continue
+            if value.op == 'set':
+                name, (arg,) = value.attr, value.args
+                if arg.op in ('op', 'param') and arg.home is None:
+                    arg.home = name
+                else:
+                    arg = function.value('copy', [arg], block=block, home=name)
+                    instrs.append(arg)
+                current.setdefault(name, []).append(arg)
+                pushed.append(name)
+                continue
+            instrs.append(value)
+        block.instrs = instrs
+        if block.term is not None:
+            block.term = tuple(resolve(part, replaced) if isinstance(part, Value) else part
+                               for part in block.term)
+        for succ in block.succs:
+            index = succ.preds.index(block)
+            for phi in succ.phis:
+                versions = current.get(phi.attr)
+                phi.args[index] = versions[-1] if versions else undefined
+        stack.append((block, pushed))
+        stack.extend((child, None) for child in reversed(block.children))
+    return replaced
+
+
+def simplify_phis(function, replaced):
+    """Remove phis with one distinct operand, then phis nothing reads"""
+    users = {}
+    phis = [phi for block in function.blocks for phi in block.phis]
+    for phi in phis:
+        for arg in phi.args:
+            users.setdefault(arg, []).append(phi)
+    pending = list(phis)
+    while pending:
+        phi = pending.pop()
+        if phi in replaced:
+            continue
+        args = {resolve(arg, replaced) for arg in phi.args} - {phi}
+        if len(args) > 1:
+            continue
+        replaced[phi] = args.pop() if args else function.constant('nothing')
+        pending.extend(users.get(phi, ()))
+
+    live = set()
+    pending = []
+    for block in function.blocks:
+        block.phis = [phi for phi in block.phis if phi not in replaced]
+        for value in block.instrs:
+            value.args = [resolve(arg, replaced) for arg in value.args]
+            pending.extend(arg for arg in value.args if arg.op == 'phi')
+        if block.term is not None:
+            block.term = tuple(resolve(part, replaced) if isinstance(part, Value) else part
+                               for part in block.term)
+            pending.extend(part for part in block.term[1:2]
+                           if isinstance(part, Value) and part.op == 'phi')
+    while pending:
+        phi = pending.pop()
+        if phi in live:
+            continue
+        live.add(phi)
+        phi.args = [resolve(arg, replaced) for arg in phi.args]
+        pending.extend(arg for arg in phi.args if arg.op == 'phi')
+    for block in function.blocks:
+        block.phis = [phi for phi in block.phis if phi in live]
+
+
+def verify(function):
+    """Raise ValueError unless every operand is defined on every path to its use"""
+    defined = {}
+    for block in function.blocks:
+        for index, value in enumerate(block.phis + block.instrs):
+            defined[value] = (block, index)
+    for block in function.blocks:
+        uses = [(value, arg, block, index)
+                for index, value in enumerate(block.phis + block.instrs)
+                if value.op != 'phi' for arg in value.args]
+        if block.term is not None:
+            uses.extend((block.term[0], part, block, len(block.phis) + len(block.instrs))
+                        for part in block.term[1:2] if isinstance(part, Value))
+        for phi in block.phis:
+            if len(phi.args) != len(block.preds):
+                raise ValueError(f'{phi!r} in {block!r} has {len(phi.args)} operands')
+            uses.extend((phi, arg, pred, len(pred.phis) + len(pred.instrs))
+                        for arg, pred in zip(phi.args, block.preds))
+        for user, arg, where, index in uses:
+            if arg.op == 'const':
+                continue
+            if arg not in defined:
+                raise ValueError(f'{user!r} in {block!r} uses {arg!r}, which is not in the function')
+            home, position = defined[arg]
+            if not dominates(home, where) or home is where and position >= index:
+                raise ValueError(f'{user!r} in {block!r} uses {arg!r} before it is defined')
+
+
+def build_ssa(tree):
+    """Program for tree with every function in SSA form"""
+    program = build_program(tree)
+    for function in program.functions:
+        to_ssa(function)
+    return program
+
+
+# Lowering
+
+def inlined_operands(block, uses):
+    """Values emitted as part of the expression that uses them: no home, one
+    use, in the same block, and computed just before the rest of that
+    expression, so moving them keeps the order of evaluation
+    """
+    position = {value: index for index, value in enumerate(block.instrs)}
+    start = {}
+    inlined = set()
+
+    def place(args, index):
+        for arg in reversed(args):
+            if (arg.op == 'op' and arg.home is None and uses.get(arg) == 1
+                    and position.get(arg) == index - 1):
+                inlined.add(arg)
+                index = start[arg]
+            elif arg.op != 'const' and position.get(arg, -1) >= index:
+                break
+        return index
+
+    for index, value in enumerate(block.instrs):
+        start[value] = place(value.args, index) if value.op == 'op' else index
+    if block.term is not None and block.term[0] in ('branch', 'return'):
+        place([block.term[1]], len(block.instrs))
+    return inlined
+
+
+def count_uses(function):
+    uses = {}
+    for value in function.values():
+        for arg in value.args:
+            uses[arg] = uses.get(arg, 0) + 1
+    for block in function.blocks:
+        if block.term is not None and block.term[0] in ('branch', 'return'):
+            uses[block.term[1]] = uses.get(block.term[1], 0) + 1
+    return uses
+
+
+def lower_function(function, generator):
+    """VM instructions for one function in SSA form"""
+    code = []
+    slots = {}
+
+    def slot(value):
+        key = value.home or value
+        if key not in slots:
+            slots[key] = len(slots)
+        return slots[key]
+
+    def push(value):
+        if value.op == 'const':
+            code.append(f'const {value.attr}')
+        elif value in inlined:
+            emit(value)
+        else:
+            code.append(f'load {slot(value)}')
+
+    def emit(value):
+        for arg in value.args:
+            push(arg)
+        if value.op == 'op':
+            code.append(value.attr)
+
+    uses = count_uses(function)
+    params = [value for value in function.entry.instrs if value.op == 'param']
+    for param in params:
+        slot(param)
+    for param in reversed(params):
+        code.append(f'store {slot(param)}')
+    for block in function.blocks:
+        for succ in block.succs:
+            if succ.label is None and succ is not function.entry:
+                succ.label = generator.new_label()
+
+    for index, block in enumerate(function.blocks):
+        following = function.blocks[index + 1] if index + 1 < len(function.blocks) else None
+        if block.label:
+            code.append(f'{block.label}:')
+        inlined = inlined_operands(block, uses)
+        for value in block.instrs:
+            if value.op == 'param' or value in inlined:
+                continue
+            emit(value)
+            if value.home or uses.get(value):
+                code.append(f'store {slot(value)}')
+            else:
+                code.append('pop')
+        term = block.term
+        if term is None:
+            if function.name is not None:
+                code.extend(['const nothing', 'return 1'])
+        elif term[0] == 'jump':
+            target = term[1]
+            if target.phis:
+                which = target.preds.index(block)
+                copies = [phi for phi in target.phis if phi.args[which].home != phi.home]
+                for phi in copies:
+                    push(phi.args[which])
+                for phi in reversed(copies):
+                    code.append(f'store {slot(phi)}')
+            if target is not following:
+                code.append(f'jump {target.label}')
+        elif term[0] == 'branch':
+            _, value, if_true, if_false = term
+            if if_true.phis or if_false.phis:
+                raise ValueError(f'{block!r} branches to a block with phis')
+            push(value)
+            if if_true is following:
+                code.append(f'jump_ifnot {if_false.label}')
+            elif if_false is following:
+                code.append(f'jump_if {if_true.label}')
+            else:
+                code.extend([f'jump_ifnot {if_false.label}', f'jump {if_true.label}'])
+        else:
+            push(term[1])
+            code.append('return 1')
+    return code
+
+
+def lower_program(program):
+    """A QuackCodeGenerator holding the code of every function of program,
+    ready for quack_parser.optimize_code and get_code
+    """
+    generator = QuackCodeGenerator()
+    for function in program.functions:
+        code = lower_function(function, generator)
+        if function.name is None:
+            generator.code = code
+        else:
+            generator.methods.append((function.name, function.params, code))
+    return generator
+
+
+def cli():
+    from quack_parser import parse_code     # quack_parser imports this module
+
+    cli_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    cli_parser.add_argument('source', help='Quack source file')
+    cli_parser.add_argument('-O', dest='opt_level', type=int, default=DEFAULT_LEVEL,
+                            help='AST optimization level before building the IR')
+    cli_parser.add_argument('--cfg', action='store_true',
+                            help='print the control-flow graph before SSA construction')
+    cli_parser.add_argument('--dominators', action='store_true',
+                            help='print the dominator tree and frontiers of each function')
+    cli_parser.add_argument('--lower', action='store_true',
+                            help='print the lowered VM code instead of the IR')
+    args = cli_parser.parse_args()
+
+    with open(args.source) as f:
+        tree, _ = optimize(parse_code(f.read()), args.opt_level)
+    program = build_program(tree)
+    if args.cfg:
+        print(program.dump())
+        return
+    for function in program.functions:
+        to_ssa(function)
+        verify(function)
+    if args.lower:
+        print(lower_program(program).get_code())
+        return
+    print(program.dump())
+    if args.dominators:
+        for function in program.functions:
+            print(f'\ndominators of {function.name or "main"}:')
+            for block in function.order:
+                depth = 0
+                runner = block
+                while runner.idom is not None:
+                    depth += 1
+                    runner = runner.idom
+                frontier = ' '.join(map(repr, block.frontier))
+                print(f'{"  " * (depth + 1)}{block!r}' + (f'  frontier {frontier}' if frontier else ''))
+
+
+if __name__ == '__main__':
+    cli()
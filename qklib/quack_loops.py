@@ -0,0 +1,435 @@
+"""Loop optimizations over the SSA form of quack_ir: invariant code motion
+and strength reduction of induction variables.
+
+Every `while` is a natural loop in the control-flow graph: the header
+(where its condition starts) dominates the block that jumps back to it.
+find_loops collects each loop's blocks from that back edge and nests the
+loops; optimize_loops then works from the innermost loop outwards, so
+what leaves an inner loop can leave the enclosing ones too.
+
+Invariant code motion moves an instruction to the preheader (the one
+block that enters the loop from outside) when none of its operands is
+computed in the loop.  The preheader runs even when the loop body never
+does, so only instructions that cannot fail move:
+
+    arithmetic and comparisons the checker specialized (iadd, ilt, ...),
+    when every operand is proven to be of the class the instruction
+    expects and none can be nothing (a variable not assigned on some
+    path, a parameter, or the result of a user function), and Int or
+    Float division only by a non-zero literal
+    `string`, `equals` and `notequals`, which every value understands
+
+An operand is proven when it is a literal, the result of a specialized
+instruction on proven operands, of `string` (a String) or of `equals` or
+`notequals` (a Bool), or a copy or merge of proven values of one class.
+The declared types the checker trusted are not enough on their own: the
+specialized instruction would fail on a value of another class before
+the loop decides not to run.
+
+Calls of user functions and `print` stay where they are.  A hoisted
+value a variable owns leaves a copy behind (`x = t`), so the variable
+keeps one slot.
+
+Strength reduction finds basic induction variables (a header phi
+stepped by `i = i + c` or `i = i - c` once per iteration) and rewrites
+`i * k`, for a literal k, as a new variable that starts at `i * k` and
+grows by `k * c` at the end of each iteration.  On the VM a multiply is
+one instruction like an add, so this only pays when it removes more
+instructions than the update adds: the report says when it does not.
+
+The report lists, for each loop, what was hoisted, what was reduced and
+what stayed for lack of safety.  quack_parser.py --ir runs these passes
+from -O2 and prints the report with --opt-report;
+benchmarks/bench_loops.py counts instructions with and without them.
+
+Usage:
+    python3 qklib/quack_loops.py prog.qk [--ir]
+"""
+
+import argparse
+import itertools
+
+from quack_ir import Value, build_ssa, dominates
+
+# Methods every class understands and that never fail
+SAFE_METHODS = ('string', 'equals', 'notequals')
+
+SYMBOLS = {
+    'iadd': '+', 'fadd': '+', 'sconcat': '+', 'isub': '-', 'fsub': '-',
+    'imul': '*', 'fmul': '*', 'idiv': '/', 'fdiv': '/',
+    'ilt': '<', 'flt': '<', 'igt': '>', 'fgt': '>', 'ile': '<=', 'fle': '<=',
+    'ige': '>=', 'fge': '>=', 'ieq': '==', 'feq': '==', 'seq': '==',
+    'ine': '!=', 'fne': '!=', 'sne': '!=',
+}
+
+# Classes of the operands and of the result of the specialized instructions
+COMPARISONS = ('lt', 'gt', 'le', 'ge', 'eq', 'ne')
+OPERAND_CLASSES = {'i': 'Int', 'f': 'Float', 's': 'String'}
+METHOD_CLASSES = {'string': 'String', 'equals': 'Bool', 'notequals': 'Bool'}
+
+# Instructions counted per use and per update by the strength reduction cost model
+MULTIPLY_COST = 3       # load i; const k; imul
+REDUCED_COST = 1        # load r
+UPDATE_COST = 4         # load r; const s; iadd; store r
+INCREMENT_COST = 1      # inc_local r
+
+
+class Loop:
+    def __init__(self, header):
+        self.header = header
+        self.latches = []
+        self.blocks = {header}
+        self.parent = None
+        self.depth = 1
+        self.preheader = None
+
+    def body(self):
+        """The loop's blocks in reverse postorder, header first"""
+        return sorted(self.blocks, key=lambda block: block.rpo)
+
+
+def find_loops(function):
+    """Natural loops of a function in SSA form, innermost first.
+    Returns (loops, innermost loop of each block in a loop).
+    """
+    loops = {}
+    for block in function.order:
+        for succ in block.succs:
+            if dominates(succ, block):
+                loops.setdefault(succ, Loop(succ)).latches.append(block)
+    for loop in loops.values():
+        pending = list(loop.latches)
+        while pending:
+            block = pending.pop()
+            if block not in loop.blocks:
+                loop.blocks.add(block)
+                pending.extend(block.preds)
+        outside = [pred for pred in loop.header.preds if pred not in loop.blocks]
+        if len(outside) == 1 and outside[0].succs == [loop.header]:
+            loop.preheader = outside[0]
+    ordered = sorted(loops.values(), key=lambda loop: len(loop.blocks))
+    loop_of = {}
+    for loop in ordered:
+        for block in loop.blocks:
+            inner = loop_of.setdefault(block, loop)
+            while inner.parent is not None:
+                inner = inner.parent
+            if inner is not loop:
+                inner.parent = loop
+    for loop in reversed(ordered):
+        if loop.parent is not None:
+            loop.depth = loop.parent.depth + 1
+    return ordered, loop_of
+
+
+def maybe_nothing(function):
+    """Values that can be nothing at run time: the literal, parameters,
+    results of user functions and print, and whatever is copied or
+    merged from those
+    """
+    maybe = {function.constant('nothing')}
+    users = {}
+    for value in function.values():
+        for arg in value.args:
+            users.setdefault(arg, []).append(value)
+        if value.op == 'param' or value.op == 'op' and value.attr.startswith('call ') and (
+                value.attr.startswith('call $Main: ') or method_of(value) not in SAFE_METHODS):
+            maybe.add(value)
+    pending = list(maybe)
+    while pending:
+        for user in users.get(pending.pop(), ()):
+            if user.op in ('copy', 'phi') and user not in maybe:
+                maybe.add(user)
+                pending.append(user)
+    return maybe
+
+
+def literal_class(value):
+    text = value.attr
+    if text in ('true', 'false'):
+        return 'Bool'
+    if text.startswith('"'):
+        return 'String'
+    if text == 'nothing':
+        return None
+    return 'Int' if text.lstrip('-').isdigit() else 'Float'
+
+
+def operand_class(attr):
+    return OPERAND_CLASSES[attr[0]]
+
+
+def proven_classes(function):
+    """The class of every value the code proves one for (see the module
+    docstring); other values are missing
+    """
+    unknown = object()      # not computed yet: agrees with every class
+    classes = {value: unknown for value in function.values()}
+
+    def class_of(value):
+        return literal_class(value) if value.op == 'const' else classes.get(value)
+
+    def infer(value):
+        if value.op == 'copy':
+            return class_of(value.args[0])
+        if value.op == 'phi':
+            found = {class_of(arg) for arg in value.args} - {unknown}
+            return found.pop() if len(found) == 1 else unknown if not found else None
+        if value.op != 'op':
+            return None
+        if value.attr in SYMBOLS:
+            expected = operand_class(value.attr)
+            if any(class_of(arg) not in (expected, unknown) for arg in value.args):
+                return None
+            return 'Bool' if value.attr[1:] in COMPARISONS else expected
+        if value.attr.startswith('call $Main: '):
+            return None
+        return METHOD_CLASSES.get(method_of(value)) if value.attr.startswith('call ') else None
+
+    changed = True
+    while changed:
+        changed = False
+        for value in classes:
+            found = infer(value)
+            if found is not classes[value]:
+                classes[value] = found
+                changed = True
+    return {value: found for value, found in classes.items()
+            if found is not None and found is not unknown}
+
+
+def method_of(value):
+    return value.attr.rpartition(': ')[2]
+
+
+def is_int_literal(value):
+    return value.op == 'const' and value.attr.lstrip('-').isdigit()
+
+
+def failure(value, maybe, classes):
+    """Why value could fail or have effects if it ran before the loop, or None"""
+    attr = value.attr
+    if attr.startswith('call '):
+        if attr.startswith('call $Main: ') or method_of(value) not in SAFE_METHODS:
+            return 'calls stay in the loop'
+        return None
+    if attr not in SYMBOLS:
+        return 'may fail'
+    if any(arg in maybe for arg in value.args):
+        return 'an operand may be nothing'
+    expected = operand_class(attr)
+    if any((literal_class(arg) if arg.op == 'const' else classes.get(arg)) != expected
+           for arg in value.args):
+        return f'an operand is not proven {expected}'
+    if attr in ('idiv', 'fdiv'):
+        divisor = value.args[1]
+        if divisor.op != 'const' or float(divisor.attr) == 0:
+            return 'may divide by zero'
+    return None
+
+
+def plural(count, noun):
+    return f'{count} {noun}' + ('s' if count != 1 else '')
+
+
+def describe(value, top=True, depth=0):
+    """Source-like text for a value, using variable names for operands"""
+    if value.op == 'const':
+        return value.attr
+    if not top and value.home:
+        return value.home
+    if value.op == 'copy':
+        return describe(value.args[0], False, depth)
+    if value.op != 'op':
+        return value.home or repr(value)
+    if depth > 3:
+        return '...'
+    args = [describe(arg, False, depth + 1) for arg in value.args]
+    if value.attr in SYMBOLS:
+        left, right = (f'({arg})' if ' ' in arg and i else arg for i, arg in enumerate(args))
+        return f'{left} {SYMBOLS[value.attr]} {right}'
+    name = method_of(value)
+    if value.attr.startswith('call $Main: '):
+        return f'{name}({", ".join(args)})'
+    return f'{args[0]}.{name}({", ".join(args[1:])})'
+
+
+def hoist(function, loop, maybe, classes, report):
+    """Move the invariant instructions of loop to its preheader"""
+    preheader = loop.preheader
+    moved = set()
+    for block in loop.body():
+        kept = []
+        for value in block.instrs:
+            invariant = value.op == 'op' and all(
+                arg.op == 'const' or arg in moved or arg.block not in loop.blocks
+                for arg in value.args)
+            reason = failure(value, maybe, classes) if invariant else None
+            if not invariant or reason:
+                if invariant:
+                    report['kept'].append((describe(value), reason))
+                kept.append(value)
+                continue
+            if value.home:
+                # The variable keeps its value, now a copy of the hoisted one
+                hoisted = function.value('op', value.args, value.attr, preheader)
+                value.op, value.args, value.attr = 'copy', [hoisted], None
+                kept.append(value)
+                if value in maybe:
+                    maybe.add(hoisted)
+                if value in classes:
+                    classes[hoisted] = classes[value]
+            else:
+                hoisted = value
+                hoisted.block = preheader
+            preheader.instrs.append(hoisted)
+            moved.add(hoisted)
+        block.instrs = kept
+    used = {arg for value in moved for arg in value.args}
+    report['moved'] = len(moved)
+    report['hoisted'] = [describe(value) for value in preheader.instrs
+                         if value in moved and value not in used]
+
+
+def reduce_strength(function, loop, maybe, classes, replace, names, report):
+    """Rewrite i * k, i a basic induction variable and k a literal, as an
+    added variable when that leaves fewer instructions per iteration
+    """
+    if len(loop.latches) != 1:
+        return
+    header, latch, preheader = loop.header, loop.latches[0], loop.preheader
+    back, entry = header.preds.index(latch), header.preds.index(preheader)
+    for phi in list(header.phis):
+        update = phi.args[back]
+        if (update.op != 'op' or update.attr not in ('iadd', 'isub')
+                or update.block not in loop.blocks):
+            continue
+        left, right = update.args
+        if left is phi and is_int_literal(right):
+            step = int(right.attr) if update.attr == 'iadd' else -int(right.attr)
+        elif right is phi and update.attr == 'iadd' and is_int_literal(left):
+            step = int(left.attr)
+        else:
+            continue
+        products = {}
+        for block in loop.body():
+            for value in block.instrs:
+                if value.op == 'op' and value.attr == 'imul' and phi in value.args:
+                    factor = value.args[1] if value.args[0] is phi else value.args[0]
+                    if is_int_literal(factor):
+                        products.setdefault(int(factor.attr), []).append(value)
+        init = phi.args[entry]
+        while init.op == 'copy':
+            init = init.args[0]
+        for factor, uses in products.items():
+            text = f'{phi.home} * {factor}'
+            before = MULTIPLY_COST * len(uses)
+            after = REDUCED_COST * len(uses) + (
+                INCREMENT_COST if factor * step == 1 else UPDATE_COST)
+            if after >= before:
+                report['kept'].append((text, f'{plural(len(uses), "use")} cost {before} '
+                                             f'instructions per iteration, {after} if reduced'))
+                continue
+            if init in maybe:
+                report['kept'].append((text, f'{phi.home} may be nothing on entry'))
+                continue
+            if not is_int_literal(init) and classes.get(init) != 'Int':
+                report['kept'].append((text, f'{phi.home} is not proven Int on entry'))
+                continue
+            name = f'$r{next(names)}'
+            if is_int_literal(init):
+                start = function.constant(str(int(init.attr) * factor))
+            else:
+                start = function.value('op', [init, function.constant(str(factor))], 'imul',
+                                       preheader, home=name)
+                preheader.instrs.append(start)
+            reduced = function.value('phi', [None] * len(header.preds), name, header, home=name)
+            following = function.value('op', [reduced, function.constant(str(factor * step))],
+                                       'iadd', latch, home=name)
+            reduced.args[entry], reduced.args[back] = start, following
+            header.phis.append(reduced)
+            latch.instrs.append(following)
+            classes.update({start: 'Int', reduced: 'Int', following: 'Int'})
+            for value in uses:
+                if value.home:
+                    value.op, value.args, value.attr = 'copy', [reduced], None
+                else:
+                    replace[value] = reduced
+                    value.block.instrs.remove(value)
+            report['reduced'].append(f'{text} ({plural(len(uses), "use")}): '
+                                     f'{name} += {factor * step} per iteration')
+
+
+def optimize_loops(function, strength=True):
+    """Both passes over every loop of a function in SSA form; returns the
+    report, one entry per loop from the outermost, in layout order
+    """
+    loops, _ = find_loops(function)
+    maybe = maybe_nothing(function)
+    classes = proven_classes(function)
+    replace = {}
+    names = itertools.count()
+    reports = []
+    for loop in loops:
+        header = loop.header
+        condition = header.term[1] if header.term and header.term[0] == 'branch' else None
+        report = {'function': function.name, 'header': header.id, 'depth': loop.depth,
+                  'blocks': len(loop.blocks), 'moved': 0, 'hoisted': [], 'reduced': [],
+                  'kept': [],
+                  'condition': describe(condition) if condition is not None else None}
+        reports.append(report)
+        if loop.preheader is None:
+            report['kept'].append(('the whole loop', 'no single block enters it'))
+            continue
+        hoist(function, loop, maybe, classes, report)
+        if strength:
+            reduce_strength(function, loop, maybe, classes, replace, names, report)
+    if replace:
+        for value in function.values():
+            value.args = [replace.get(arg, arg) for arg in value.args]
+        for block in function.blocks:
+            if block.term is not None:
+                block.term = tuple(replace.get(part, part) if isinstance(part, Value) else part
+                                   for part in block.term)
+    reports.sort(key=lambda report: report['header'])
+    return reports
+
+
+def format_report(reports):
+    lines = []
+    for report in reports:
+        where = report['function'] or 'main'
+        condition = f'while {report["condition"]}' if report['condition'] else 'loop'
+        lines.append(f'loop {condition} in {where} (depth {report["depth"]}, '
+                     f'{plural(report["blocks"], "block")}): '
+                     f'{plural(report["moved"], "instruction")} hoisted')
+        lines.extend(f'  hoisted  {text}' for text in report['hoisted'])
+        lines.extend(f'  reduced  {text}' for text in report['reduced'])
+        lines.extend(f'  kept     {text}: {reason}' for text, reason in report['kept'])
+    return lines
+
+
+def cli():
+    from quack_optimizer import MAX_LEVEL, optimize
+    from quack_parser import parse_code     # quack_parser imports this module
+
+    cli_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    cli_parser.add_argument('source', help='Quack source file')
+    cli_parser.add_argument('--ir', action='store_true', help='also print the IR afterwards')
+    cli_parser.add_argument('--no-strength', action='store_true',
+                            help='only hoist, do not reduce induction variables')
+    args = cli_parser.parse_args()
+
+    with open(args.source) as f:
+        tree, _ = optimize(parse_code(f.read()), MAX_LEVEL)
+    program = build_ssa(tree)
+    for function in program.functions:
+        for line in format_report(optimize_loops(function, not args.no_strength)):
+            print(line)
+    if args.ir:
+        print()
+        print(program.dump())
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,196 @@
+"""Binary object format (.qko) for assembled Quack programs.
+
+Layout (all header and table fields little-endian):
+
+    header      magic b'QKO\\0', format version, byte order of the code
+                section, then the section counts and the code offset
+    strings     interned string table: u32 length + UTF-8 bytes each
+    constants   tag byte + payload (i64, f64, or a string table index)
+    calls       (class, method) string indices and vtable slot per 'call' site
+    methods     (name, entry offset, arity) for each .method
+    code        opcode bytes, padded to 4, then one int32 operand per
+                opcode in the byte order recorded in the header
+
+read_object maps the file with mmap and hands the code section back as
+memoryviews over the mapping, so the instruction stream is never copied
+or re-parsed; only the (small) tables are decoded into Python objects.
+"""
+
+import mmap
+import struct
+import sys
+from array import array
+from collections import namedtuple
+
+MAGIC = b'QKO\0'
+VERSION = 2         # 2: call entries carry their vtable slot
+
+HEADER = struct.Struct('<4sHBxIIIIII')
+U32 = struct.Struct('<I')
+I64 = struct.Struct('<q')
+F64 = struct.Struct('<d')
+CALL_ENTRY = struct.Struct('<III')
+METHOD_ENTRY = struct.Struct('<III')
+
+CODE_ALIGN = 8
+
+TAG_NOTHING = 0
+TAG_FALSE = 1
+TAG_TRUE = 2
+TAG_INT = 3
+TAG_FLOAT = 4
+TAG_STRING = 5
+TAG_BIGINT = 6      # ints outside i64, stored as decimal text
+
+LITTLE, BIG = 0, 1
+NATIVE_ORDER = LITTLE if sys.byteorder == 'little' else BIG
+
+ObjectFile = namedtuple('ObjectFile', ['ops', 'args', 'consts', 'calls', 'methods', 'buffer'])
+
+
+class ObjectFormatError(Exception):
+    pass
+
+
+def is_object_file(path):
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def write_object(path, ops, args, consts, calls, methods):
+    """Write an assembled program.
+
+    ops is a bytes-like opcode stream, args an array('i') of operands,
+    calls a list of (class, method) and methods a list of
+    (name, entry, arity).
+    """
+    strings = []
+    string_index = {}
+
+    def intern(text):
+        if text not in string_index:
+            string_index[text] = len(strings)
+            strings.append(text)
+        return string_index[text]
+
+    const_part = bytearray()
+    for value in consts:
+        if value is None:
+            const_part.append(TAG_NOTHING)
+        elif value is True:
+            const_part.append(TAG_TRUE)
+        elif value is False:
+            const_part.append(TAG_FALSE)
+        elif isinstance(value, int):
+            if -2**63 <= value < 2**63:
+                const_part.append(TAG_INT)
+                const_part += I64.pack(value)
+            else:
+                const_part.append(TAG_BIGINT)
+                const_part += U32.pack(intern(str(value)))
+        elif isinstance(value, float):
+            const_part.append(TAG_FLOAT)
+            const_part += F64.pack(value)
+        elif isinstance(value, str):
+            const_part.append(TAG_STRING)
+            const_part += U32.pack(intern(value))
+        else:
+            raise ObjectFormatError(f'cannot encode constant {value!r}')
+
+    call_part = bytearray()
+    for clazz, method, slot in calls:
+        call_part += CALL_ENTRY.pack(intern(clazz), intern(method), slot)
+
+    method_part = bytearray()
+    for name, entry, arity in methods:
+        method_part += METHOD_ENTRY.pack(intern(name), entry, arity)
+
+    string_part = bytearray()
+    for text in strings:
+        data = text.encode('utf-8')
+        string_part += U32.pack(len(data)) + data
+
+    tables = bytes(string_part + const_part + call_part + method_part)
+    code_offset = HEADER.size + len(tables)
+    code_offset += -code_offset % CODE_ALIGN
+    header = HEADER.pack(MAGIC, VERSION, NATIVE_ORDER, len(strings), len(consts),
+                         len(calls), len(methods), len(ops), code_offset)
+
+    with open(path, 'wb') as out:
+        out.write(header)
+        out.write(tables)
+        out.write(b'\0' * (code_offset - HEADER.size - len(tables)))
+        out.write(bytes(ops))
+        out.write(b'\0' * (-len(ops) % 4))
+        out.write(args.tobytes())
+
+
+def read_object(path):
+    """Map an object file and decode its tables; the code stays mapped."""
+    with open(path, 'rb') as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if len(buffer) < HEADER.size:
+        raise ObjectFormatError(f'{path}: truncated header')
+    (magic, version, order, n_strings, n_consts, n_calls, n_methods,
+     n_code, code_offset) = HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise ObjectFormatError(f'{path}: not a Quack object file')
+    if version != VERSION:
+        raise ObjectFormatError(f'{path}: object format version {version}, expected {VERSION}')
+
+    offset = HEADER.size
+    strings = []
+    for _ in range(n_strings):
+        (length,) = U32.unpack_from(buffer, offset)
+        offset += U32.size
+        strings.append(sys.intern(buffer[offset:offset + length].decode('utf-8')))
+        offset += length
+
+    consts = []
+    for _ in range(n_consts):
+        tag = buffer[offset]
+        offset += 1
+        if tag == TAG_NOTHING:
+            consts.append(None)
+        elif tag == TAG_TRUE:
+            consts.append(True)
+        elif tag == TAG_FALSE:
+            consts.append(False)
+        elif tag == TAG_INT:
+            consts.append(I64.unpack_from(buffer, offset)[0])
+            offset += I64.size
+        elif tag == TAG_FLOAT:
+            consts.append(F64.unpack_from(buffer, offset)[0])
+            offset += F64.size
+        elif tag in (TAG_STRING, TAG_BIGINT):
+            text = strings[U32.unpack_from(buffer, offset)[0]]
+            consts.append(text if tag == TAG_STRING else int(text))
+            offset += U32.size
+        else:
+            raise ObjectFormatError(f'{path}: bad constant tag {tag}')
+
+    calls = []
+    for _ in range(n_calls):
+        clazz, method, slot = CALL_ENTRY.unpack_from(buffer, offset)
+        calls.append((strings[clazz], strings[method], slot))
+        offset += CALL_ENTRY.size
+
+    methods = []
+    for _ in range(n_methods):
+        name, entry, arity = METHOD_ENTRY.unpack_from(buffer, offset)
+        methods.append((strings[name], entry, arity))
+        offset += METHOD_ENTRY.size
+
+    args_offset = code_offset + n_code + (-n_code % 4)
+    if args_offset + 4 * n_code > len(buffer):
+        raise ObjectFormatError(f'{path}: truncated code section')
+    view = memoryview(buffer)
+    ops = view[code_offset:code_offset + n_code]
+    args = view[args_offset:args_offset + 4 * n_code]
+    if order == NATIVE_ORDER:
+        args = args.cast('i')
+    else:
+        # Foreign byte order: the one case where the operands are copied
+        args = array('i', args.tobytes())
+        args.byteswap()
+    return ObjectFile(ops, args, consts, calls, methods, buffer)
@@ -0,0 +1,252 @@
+"""AST optimization passes, run between QuackTransformer and QuackCodeGenerator.
+
+Optimization levels:
+
+    -O0   no AST passes
+    -O1   constant folding: arithmetic, comparisons and boolean operators
+          whose operands are Int/Float/String/Bool literals are evaluated
+          at compile time, with the same semantics the VM uses
+    -O2   as -O1, plus dead-branch elimination: `if` on a literal keeps
+          only the branch taken, `while (false)` disappears, and
+          statements after a `return` in the same block are dropped
+
+The passes never modify the tree they are given; changed nodes are
+rebuilt and unchanged subtrees are shared, so the original tree can
+still be compiled for comparison (see count_instructions).
+"""
+
+import math
+import operator
+
+from quack_ast import (Add, And, Block, Boolean, Div, Equal, Float, FuncDef,
+                       GreaterThan, GreaterThanOrEqual, If, Int, LessThan,
+                       LessThanOrEqual, Mul, Not, NotEqual, Or, Return, String,
+                       Sub, While)
+from vm import int_divide
+
+DEFAULT_LEVEL = 1
+MAX_LEVEL = 2
+
+LITERALS = (Int, Float, String, Boolean)
+TYPE_NAMES = {Int: 'Int', Float: 'Float', String: 'String', Boolean: 'Bool'}
+
+
+# Binary node -> {operand literal class: implementation}
+BINARY = {
+    Add: {Int: operator.add, Float: operator.add, String: operator.add},
+    Sub: {Int: operator.sub, Float: operator.sub},
+    Mul: {Int: operator.mul, Float: operator.mul},
+    Div: {Int: int_divide, Float: operator.truediv},
+    LessThan: {Int: operator.lt, Float: operator.lt, String: operator.lt},
+    GreaterThan: {Int: operator.gt, Float: operator.gt, String: operator.gt},
+    LessThanOrEqual: {Int: operator.le, Float: operator.le, String: operator.le},
+    GreaterThanOrEqual: {Int: operator.ge, Float: operator.ge, String: operator.ge},
+    Equal: {Int: operator.eq, Float: operator.eq, String: operator.eq, Boolean: operator.eq},
+    NotEqual: {Int: operator.ne, Float: operator.ne, String: operator.ne, Boolean: operator.ne},
+}
+
+
+def literal(value):
+    """Wrap a Python value as a typed literal node"""
+    if isinstance(value, bool):
+        node = Boolean(value)
+    elif isinstance(value, int):
+        node = Int(value)
+    elif isinstance(value, float):
+        node = Float(value)
+    else:
+        node = String(value)
+    node.inferred_type = TYPE_NAMES[type(node)]
+    return node
+
+
+def is_true(node):
+    return isinstance(node, Boolean) and node.value is True
+
+
+def is_false(node):
+    return isinstance(node, Boolean) and node.value is False
+
+
+def function_defs(statements):
+    """FuncDefs nested in statements that are about to be dropped.  Every
+    def becomes a method wherever it appears, so they must survive.
+    """
+    defs = []
+    pending = list(reversed(statements))
+    while pending:
+        stmt = pending.pop()
+        if isinstance(stmt, FuncDef):
+            defs.append(stmt)
+        elif isinstance(stmt, Block):
+            pending.extend(reversed(stmt.statements))
+        elif isinstance(stmt, If):
+            pending.extend((stmt.else_body, stmt.then_body))
+        elif isinstance(stmt, While):
+            pending.append(stmt.body)
+    return defs
+
+
+class Optimizer:
+    """One run of the AST passes at a given level, with counters"""
+    def __init__(self, level=DEFAULT_LEVEL):
+        self.level = level
+        self.stats = {'folded': 0, 'branches': 0, 'loops': 0, 'unreachable': 0}
+
+    def optimize(self, node):
+        if self.level <= 0:
+            return node
+        return self.visit(node)
+
+    def visit(self, node):
+        method = getattr(self, f'visit_{type(node).__name__}', None)
+        return method(node) if method is not None else node
+
+    # Expressions
+
+    def fold_binary(self, node):
+        left = self.visit(node.left)
+        right = self.visit(node.right)
+        folded = self.evaluate(type(node), left, right)
+        if folded is not None:
+            self.stats['folded'] += 1
+            return folded
+        if left is node.left and right is node.right:
+            return node
+        return self.rebuild(node, left, right)
+
+    visit_Add = visit_Sub = visit_Mul = visit_Div = fold_binary
+    visit_LessThan = visit_GreaterThan = visit_LessThanOrEqual = fold_binary
+    visit_GreaterThanOrEqual = visit_Equal = visit_NotEqual = fold_binary
+
+    def evaluate(self, cls, left, right):
+        """The folded literal, or None when the operation must run at run time"""
+        if type(left) is not type(right) or not isinstance(left, LITERALS):
+            return None
+        implementation = BINARY[cls].get(type(left))
+        if implementation is None:
+            return None
+        if isinstance(left, String) and cls is not Add and ('\\' in left.value or '\\' in right.value):
+            # Values are kept in source form; compare escapes only after decoding
+            return None
+        if cls is Div and right.value == 0:
+            return None         # leave the division-by-zero error to run time
+        value = implementation(left.value, right.value)
+        if isinstance(value, float) and not math.isfinite(value):
+            return None
+        return literal(value)
+
+    def fold_logical(self, node):
+        left = self.visit(node.left)
+        right = self.visit(node.right)
+        # The right operand only runs when the left one does not decide the result
+        deciding = is_false if isinstance(node, And) else is_true
+        if deciding(left):
+            self.stats['folded'] += 1
+            return left
+        if is_true(left) or is_false(left):
+            self.stats['folded'] += 1
+            return right
+        if left is node.left and right is node.right:
+            return node
+        return self.rebuild(node, left, right)
+
+    visit_And = visit_Or = fold_logical
+
+    def visit_Not(self, node):
+        expr = self.visit(node.expr)
+        if isinstance(expr, Boolean):
+            self.stats['folded'] += 1
+            return literal(not expr.value)
+        if expr is node.expr:
+            return node
+        return self.rebuild(node, expr)
+
+    def rebuild(self, node, *fields):
+        new = type(node)(*fields)
+        new_type = getattr(node, 'inferred_type', None)
+        if new_type is not None:
+            new.inferred_type = new_type
+        line = getattr(node, 'line', None)
+        if line is not None:
+            new.line = line
+        return new
+
+    # Statements
+
+    def visit_Assign(self, node):
+        expr = self.visit(node.expr)
+        return node if expr is node.expr else self.rebuild(node, node.var, node.vartype, expr)
+
+    def visit_Print(self, node):
+        expr = self.visit(node.expr)
+        return node if expr is node.expr else self.rebuild(node, expr)
+
+    def visit_Return(self, node):
+        expr = self.visit(node.expr)
+        return node if expr is node.expr else self.rebuild(node, expr)
+
+    def visit_FuncCall(self, node):
+        args = [self.visit(arg) for arg in node.args]
+        if all(new is old for new, old in zip(args, node.args)):
+            return node
+        return self.rebuild(node, node.func_name, args)
+
+    def visit_FuncDef(self, node):
+        body = self.visit(node.body)
+        return node if body is node.body else self.rebuild(node, node.name, node.params,
+                                                           node.return_type, body)
+
+    def visit_Block(self, node):
+        statements = []
+        changed = False
+        for i, stmt in enumerate(node.statements):
+            new = self.visit(stmt)
+            changed = changed or new is not stmt
+            if new is not None:
+                statements.append(new)
+            if self.level >= 2 and isinstance(new, Return):
+                dropped = node.statements[i + 1:]
+                if dropped:
+                    self.stats['unreachable'] += len(dropped)
+                    statements.extend(function_defs(dropped))
+                    changed = True
+                break
+        return self.rebuild(node, statements) if changed else node
+
+    def visit_If(self, node):
+        condition = self.visit(node.condition)
+        then_body = self.visit(node.then_body)
+        else_body = self.visit(node.else_body)
+        if self.level >= 2 and isinstance(condition, Boolean):
+            self.stats['branches'] += 1
+            taken, dropped = (then_body, else_body) if condition.value else (else_body, then_body)
+            defs = function_defs([dropped])
+            return Block(defs + [taken]) if defs else taken
+        if condition is node.condition and then_body is node.then_body and else_body is node.else_body:
+            return node
+        return self.rebuild(node, condition, then_body, else_body)
+
+    def visit_While(self, node):
+        condition = self.visit(node.condition)
+        if self.level >= 2 and is_false(condition):
+            self.stats['loops'] += 1
+            defs = function_defs([node.body])
+            return Block(defs) if defs else None
+        body = self.visit(node.body)
+        if condition is node.condition and body is node.body:
+            return node
+        return self.rebuild(node, condition, body)
+
+
+def optimize(tree, level=DEFAULT_LEVEL):
+    """Run the AST passes for level on tree; returns (new tree, stats)"""
+    optimizer = Optimizer(level)
+    result = optimizer.optimize(tree)
+    return (result if result is not None else Block([])), optimizer.stats
+
+
+def count_instructions(code):
+    """Instructions in generated assembly, not counting labels and directives"""
+    return sum(1 for line in code.splitlines()
+               if line and not line.endswith(':') and not line.startswith('.'))
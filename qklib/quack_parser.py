@@ -1,23 +1,391 @@
-from lark import Lark
+import argparse
+import glob
+import hashlib
+import os
+import py_compile
+import sys
+import time
+
+import lark
+from lark import Lark, Tree
 from quack_transformer import QuackTransformer
 from quack_code_generator import QuackCodeGenerator
+from vm import assemble, save_object
+from quack_cache import DEFAULT_LIMIT, CompileCache, compile_incremental
+from quack_arena import ArenaTransformer
+from quack_optimizer import DEFAULT_LEVEL, MAX_LEVEL, count_instructions, optimize
+from quack_peephole import RULES, PeepholeOptimizer
+from quack_slots import allocate_generator
+from quack_stream import compile_stream
+from quack_passes import NO_PASSES, PassTimer
+from quack_pygen import QuackPythonGenerator
+from quack_ir import build_program, lower_program, to_ssa
+from quack_loops import format_report, optimize_loops
 #read grammar from quack_grammer.txt
-with open('qklib/quack_grammar.txt', 'r') as file:
+GRAMMAR_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'quack_grammar.txt')
+with open(GRAMMAR_PATH, 'r') as file:
         grammar = file.read()
 
+# Built LALR tables are pickled here so later runs skip grammar analysis.
+# QUACK_CACHE_DIR overrides the location; QUACK_PARSER_CACHE=0 disables it.
+CACHE_DIR = os.environ.get('QUACK_CACHE_DIR') or os.path.join(
+    os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'), 'quack')
+# Tables no compile has used for this long are removed on the next cold build.
+# Other grammars, Lark or Python versions share the directory, so only age
+# says a table is no longer wanted
+CACHE_MAX_AGE = 30 * 24 * 3600
+
+def parser_cache_path(grammar_text):
+    """Cache file for these tables, keyed by grammar text, Lark and Python version"""
+    key = f'{grammar_text}\0{lark.__version__}\0{sys.version_info[:2]}'
+    digest = hashlib.sha256(key.encode('utf-8')).hexdigest()[:24]
+    return os.path.join(CACHE_DIR, f'parser-{digest}.lark')
+
+def build_parser(transformer):
+    options = dict(start='start', parser='lalr', transformer=transformer)
+    if os.environ.get('QUACK_PARSER_CACHE', '1') == '0':
+        return Lark(grammar, **options)
+    cache_path = parser_cache_path(grammar)
+    if os.path.exists(cache_path):
+        try:
+            os.utime(cache_path)    # the mtime records the last use
+        except OSError:
+            pass
+        return Lark(grammar, cache=cache_path, **options)
+    # Cold start: build into a private file and rename it into place, so
+    # concurrent compiles never read a half-written cache
+    tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        result = Lark(grammar, cache=tmp_path, **options)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return Lark(grammar, **options)
+    cutoff = time.time() - CACHE_MAX_AGE
+    for old in glob.glob(os.path.join(CACHE_DIR, 'parser-*.lark')):
+        try:
+            if os.path.getmtime(old) < cutoff:
+                os.remove(old)
+        except OSError:
+            pass
+    return result
+
 # build the parser
-parser = Lark(grammar, start='start', parser='lalr', transformer=QuackTransformer());
+transformer = QuackTransformer()
+parser = build_parser(transformer)
 
 # strip()
 def parse_code(code):
     return parser.parse(code)
 
+def parse_with_symbols(code, symbols):
+    """Parse code with symbols as the transformer's symbol table"""
+    transformer.symbols = symbols
+    return parser.parse(code)
+
+# Parser that records positions, for line tables (-g); built on first use
+positions_parser = None
+
+def statement_lines(code):
+    """Source line of every statement of code, in the order the LALR parser
+    reduces them (children before parents, left to right), which is the
+    order QuackTransformer.statement sees them in
+    """
+    global positions_parser
+    if positions_parser is None:
+        positions_parser = Lark(grammar, start='start', parser='lalr',
+                                propagate_positions=True, cache=True)
+    lines = []
+    stack = [(positions_parser.parse(code), False)]
+    while stack:
+        node, done = stack.pop()
+        if done:
+            if node.data == 'statement':
+                lines.append(node.meta.line)
+            continue
+        stack.append((node, True))
+        stack.extend((child, False) for child in reversed(node.children) if isinstance(child, Tree))
+    return lines
+
+def parse_with_lines(code):
+    """parse_code, with the source line recorded on every statement"""
+    transformer.statement_lines = iter(statement_lines(code))
+    try:
+        return parser.parse(code)
+    finally:
+        transformer.statement_lines = None
+
+# The arena parser is only built when arena mode is used
+arena_transformer = None
+arena_parser = None
+
+def parse_to_arena(code, symbols=None):
+    """Parse code into a NodeArena instead of a tree of node objects"""
+    global arena_transformer, arena_parser
+    if arena_parser is None:
+        arena_transformer = ArenaTransformer()
+        arena_parser = build_parser(arena_transformer)
+    arena_transformer.symbols = {} if symbols is None else symbols
+    return arena_parser.parse(code)
+
+def optimize_code(codegen, level=DEFAULT_LEVEL, peephole=None):
+    """Instruction-level passes, from -O1 on: peephole (a PeepholeOptimizer, by
+    default one with every rule), slot allocation, peephole again for the pops
+    left by dead stores, and finally superinstruction fusion.  Returns the slot
+    allocator's per-body frame stats.
+    """
+    if level < 1:
+        return []
+    peephole = peephole or PeepholeOptimizer()
+    peephole.optimize_generator(codegen)
+    frames = allocate_generator(codegen)
+    peephole.optimize_generator(codegen)
+    peephole.fuse_generator(codegen)
+    return frames
+
+def compile_tree(tree, level=DEFAULT_LEVEL, peephole=None, passes=NO_PASSES):
+    """Optimize and generate code for a parsed tree; returns (codegen, optimizer stats)"""
+    with passes.phase('optimize'):
+        tree, stats = optimize(tree, level)
+    with passes.phase('codegen'):
+        codegen = QuackCodeGenerator()
+        codegen.generate(tree)
+    with passes.phase('lower'):
+        stats['frames'] = optimize_code(codegen, level, peephole)
+    return codegen, stats
+
+def compile_ir(tree, level=DEFAULT_LEVEL, peephole=None, passes=NO_PASSES, loops=None):
+    """As compile_tree, with code generated through the SSA IR of quack_ir;
+    stats['ir'] counts its functions, blocks, phis and values.  The loop
+    optimizations of quack_loops run from -O2, or as loops says;
+    stats['loop_report'] lists what they did to each loop
+    """
+    with passes.phase('optimize'):
+        tree, stats = optimize(tree, level)
+    with passes.phase('cfg'):
+        program = build_program(tree)
+    with passes.phase('ssa'):
+        for function in program.functions:
+            to_ssa(function)
+        stats['ir'] = program.stats()
+    stats['loop_report'] = []
+    if level >= 2 if loops is None else loops:
+        with passes.phase('loops'):
+            for function in program.functions:
+                stats['loop_report'].extend(optimize_loops(function))
+    with passes.phase('codegen'):
+        codegen = lower_program(program)
+    with passes.phase('lower'):
+        stats['frames'] = optimize_code(codegen, level, peephole)
+    return codegen, stats
+
+def compile_python(tree, level=DEFAULT_LEVEL, source_name=None, passes=NO_PASSES):
+    """The AST passes, then the Python backend; returns (module source, optimizer stats)"""
+    with passes.phase('optimize'):
+        tree, stats = optimize(tree, level)
+    with passes.phase('codegen'):
+        module = QuackPythonGenerator(source_name).generate(tree)
+    return module, stats
+
+def instrumented_parse(code, passes):
+    """Parse as parse_code does, with the lexer timed on its own and every
+    transformer callback timed (the parse phase includes lexing again)
+    """
+    with passes.phase('lex'):
+        for _ in parser.lex(code):
+            pass
+    with passes.phase('grammar'):
+        timed_parser = build_parser(passes.instrument_transformer(QuackTransformer()))
+    with passes.phase('parse'):
+        return timed_parser.parse(code)
+
+def write_output(code, path, out_format='asm'):
+    """Write generated code as text assembly or as a .qko object file"""
+    if out_format == 'qko':
+        save_object(assemble(code), path)
+    else:
+        with open(path, 'w') as out:
+            out.write(code + '\n')
+
+def cli():
+    cli_parser = argparse.ArgumentParser(description="Compile a Quack program to assembly")
+    cli_parser.add_argument("source", help="Quack source file")
+    cli_parser.add_argument("-o", "--output",
+                            help="write the assembly to this file instead of printing it")
+    cli_parser.add_argument("-f", "--format", choices=["asm", "qko"],
+                            help="output format; qko is the binary object file the VM maps "
+                                 "directly (default: qko if the output ends in .qko, else asm)")
+    cli_parser.add_argument("--target", choices=["vm", "py"], default="vm",
+                            help="vm: assembly for vm.py (default); py: a Python module, "
+                                 "byte-compiled to a .pyc when written to a file")
+    cli_parser.add_argument("-O", dest="opt_level", type=int, default=DEFAULT_LEVEL,
+                            choices=range(MAX_LEVEL + 1), metavar="LEVEL",
+                            help="optimization level 0-%d (default %d)" % (MAX_LEVEL, DEFAULT_LEVEL))
+    cli_parser.add_argument("--ir", action="store_true",
+                            help="generate code through the control-flow graph and SSA form "
+                                 "of quack_ir.py instead of straight from the AST; from -O2 "
+                                 "this also moves invariant code out of loops")
+    cli_parser.add_argument("-g", "--line-table", action="store_true",
+                            help="emit .line directives so the VM profiler can attribute "
+                                 "instructions to source lines (text assembly only)")
+    cli_parser.add_argument("--opt-report", action="store_true",
+                            help="print what the optimizer did and how many instructions "
+                                 "it removed on stderr")
+    cli_parser.add_argument("--peephole-rules", default=",".join(RULES),
+                            help="comma-separated peephole rules to run from -O1 on "
+                                 "(default: all of %(default)s)")
+    cli_parser.add_argument("--peephole-stats", action="store_true",
+                            help="print how often each peephole rule fired on stderr")
+    cli_parser.add_argument("--time-passes", action="store_true",
+                            help="report wall and CPU time and allocated blocks of every "
+                                 "phase, and time spent in each transformer callback, on stderr")
+    cli_parser.add_argument("--mem-passes", action="store_true",
+                            help="also trace memory and report each phase's peak (slower)")
+    cli_parser.add_argument("--passes-format", choices=["table", "json"], default="table",
+                            help="format of the --time-passes/--mem-passes report")
+    cli_parser.add_argument("--profile-passes", metavar="DIR",
+                            help="run each phase under cProfile and dump DIR/<phase>.prof")
+    cli_parser.add_argument("--arena", action="store_true",
+                            help="keep the AST in flat typed arrays (for very large inputs)")
+    cli_parser.add_argument("--stream", action="store_true",
+                            help="compile statement by statement straight into the output "
+                                 "file, in memory that does not grow with the input (asm only)")
+    cli_parser.add_argument("--incremental", action="store_true",
+                            help="compile statement by statement, reusing cached units")
+    cli_parser.add_argument("--cache-limit", type=float, default=DEFAULT_LIMIT / 2**20,
+                            help="size limit of the unit cache in MB (default %(default)g)")
+    cli_parser.add_argument("--cache-stats", action="store_true",
+                            help="print unit cache hits, misses and size on stderr")
+    return cli_parser.parse_args()
+
+def python_main(args, passes=NO_PASSES):
+    if args.stream or args.incremental or args.arena or args.line_table or args.format:
+        raise SystemExit("--target py only supports whole-file compiles without -f or -g")
+    with passes.phase('read'):
+        code = open(args.source).read()
+    tree = parse_code(code) if passes is NO_PASSES else instrumented_parse(code, passes)
+    module, stats = compile_python(tree, args.opt_level, os.path.basename(args.source), passes)
+    if args.opt_report:
+        print(f"optimizer -O{args.opt_level}: {stats['folded']} expressions folded, "
+              f"{stats['branches']} branches and {stats['loops']} loops removed, "
+              f"{stats['unreachable']} unreachable statements dropped", file=sys.stderr)
+    with passes.phase('write'):
+        if args.output:
+            with open(args.output, 'w') as out:
+                out.write(module)
+            py_compile.compile(args.output, doraise=True)
+        else:
+            print(module, end='')
+
+def stream_main(args, peephole, passes=NO_PASSES):
+    if not args.output or (args.format or 'asm') != 'asm' or args.output.endswith('.qko'):
+        raise SystemExit("--stream writes text assembly to an output file (-o)")
+    with passes.phase('stream'), open(args.output, 'w') as out:
+        stats = compile_stream(args.source, out, parse_with_symbols, args.opt_level, peephole)
+    if args.opt_report:
+        print(f"stream: {stats['units']} statements, {stats['methods']} methods, "
+              f"{stats['slots']} main-program slots", file=sys.stderr)
+    if args.peephole_stats:
+        for rule, hits in sorted(peephole.hits.items(), key=lambda item: -item[1]):
+            print(f"peephole {rule:<14} {hits:>8}", file=sys.stderr)
+
 if __name__ == "__main__":
-    import sys 
-    code = open(sys.argv[1]).read()
-    tree = parse_code(code)
-    #print(f'AST Tree: {tree}\n')
-    codegen = QuackCodeGenerator()
-    codegen.generate(tree)
-    print(f'Code Generation: \n{codegen.get_code()}')
-    
+    args = cli()
+    try:
+        peephole = PeepholeOptimizer([rule for rule in args.peephole_rules.split(",") if rule])
+    except ValueError as e:
+        raise SystemExit(e)
+    qko_output = args.format == 'qko' or (not args.format and args.output
+                                          and args.output.endswith('.qko'))
+    if args.line_table and (args.stream or args.incremental or args.arena or qko_output):
+        raise SystemExit("-g is only supported for whole-file compiles to text assembly "
+                         "(object files carry no line table)")
+    if args.ir and (args.line_table or args.stream or args.incremental or args.arena
+                    or args.target == 'py'):
+        raise SystemExit("--ir is only supported for whole-file VM compiles without -g")
+    passes = NO_PASSES
+    if args.time_passes or args.mem_passes or args.profile_passes:
+        passes = PassTimer(memory=args.mem_passes, profile_dir=args.profile_passes)
+    if args.target == 'py':
+        python_main(args, passes)
+        if passes is not NO_PASSES:
+            passes.write(args.passes_format)
+        sys.exit()
+    if args.stream:
+        stream_main(args, peephole, passes)
+        if passes is not NO_PASSES:
+            passes.write(args.passes_format)
+        sys.exit()
+    with passes.phase('read'):
+        code = open(args.source).read()
+    if args.incremental:
+        cache = CompileCache(os.path.join(CACHE_DIR, 'units.sqlite'), int(args.cache_limit * 2**20))
+        try:
+            with passes.phase('incremental'):
+                codegen = compile_incremental(code, cache, parse_with_symbols, args.opt_level)
+        finally:
+            cache.close()
+        with passes.phase('lower'):
+            frames = optimize_code(codegen, args.opt_level, peephole)
+        if args.cache_stats:
+            stats = cache.stats()
+            print(f"unit cache: {stats['hits']} hits, {stats['misses']} misses, "
+                  f"{stats['bytes']:,} bytes in {stats['entries']} entries, "
+                  f"{stats['evicted']} evicted", file=sys.stderr)
+    elif args.arena:
+        codegen = QuackCodeGenerator()
+        with passes.phase('parse'):
+            arena = parse_to_arena(code)
+        with passes.phase('codegen'):
+            arena.generate(codegen, lambda node: optimize(node, args.opt_level)[0])
+        with passes.phase('lower'):
+            frames = optimize_code(codegen, args.opt_level, peephole)
+    else:
+        if args.line_table:
+            with passes.phase('parse'):
+                tree = parse_with_lines(code)
+        elif passes is NO_PASSES:
+            tree = parse_code(code)
+        else:
+            tree = instrumented_parse(code, passes)
+        #print(f'AST Tree: {tree}\n')
+        compile_body = compile_ir if args.ir else compile_tree
+        codegen, opt_stats = compile_body(tree, args.opt_level, peephole, passes)
+        frames = opt_stats['frames']
+    out_format = args.format or ('qko' if args.output and args.output.endswith('.qko') else 'asm')
+    if out_format == 'qko' and not args.output:
+        raise SystemExit("an output file (-o) is required for the qko format")
+    with passes.phase('emit'):
+        generated = codegen.get_code()
+    if args.opt_report:
+        if args.incremental or args.arena:
+            _, opt_stats = optimize(parse_with_symbols(code, {}), args.opt_level)
+        baseline, _ = compile_tree(parse_with_symbols(code, {}), 0)
+        before, after = count_instructions(baseline.get_code()), count_instructions(generated)
+        print(f"optimizer -O{args.opt_level}: {opt_stats['folded']} expressions folded, "
+              f"{opt_stats['branches']} branches and {opt_stats['loops']} loops removed, "
+              f"{opt_stats['unreachable']} unreachable statements dropped; "
+              f"{before - after} of {before} instructions removed", file=sys.stderr)
+        if args.ir:
+            ir = opt_stats['ir']
+            print(f"ir: {ir['functions']} functions, {ir['blocks']} blocks, "
+                  f"{ir['phis']} phis, {ir['values']} values", file=sys.stderr)
+            for line in format_report(opt_stats['loop_report']):
+                print(line, file=sys.stderr)
+        for name, frame in frames:
+            print(f"frame {name or '(main)'}: {frame['before']} -> {frame['after']} slots, "
+                  f"{frame['dead_stores']} dead stores", file=sys.stderr)
+    if args.peephole_stats:
+        for rule, hits in sorted(peephole.hits.items(), key=lambda item: -item[1]):
+            print(f"peephole {rule:<14} {hits:>8}", file=sys.stderr)
+    with passes.phase('write'):
+        if args.output:
+            write_output(generated, args.output, out_format)
+        else:
+            print(f'Code Generation: \n{generated}')
+    if passes is not NO_PASSES:
+        passes.write(args.passes_format)
+
+
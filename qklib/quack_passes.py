@@ -0,0 +1,125 @@
+"""Per-pass instrumentation for the compiler driver (--time-passes, --mem-passes).
+
+A PassTimer wraps each phase of a compile in `with passes.phase(name):`
+and records its wall time, CPU time and the change in the number of
+allocated memory blocks; with memory tracing on it also records the
+tracemalloc peak during the phase, and with a profile directory each
+phase runs under its own cProfile and is dumped to <dir>/<phase>.prof.
+NO_PASSES is the do-nothing version the driver uses by default.
+
+Transformer callbacks run inline with the LALR parse, so their cost is
+only visible from inside: instrument_transformer() wraps every method
+QuackTransformer defines (add, func_call, get_type, ...) with a timer.
+Times are inclusive, so get_type also counts inside add.  Lark binds the
+callbacks when the parser is built, so the transformer has to be
+instrumented before build_parser().
+"""
+
+import cProfile
+import contextlib
+import functools
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+from quack_transformer import QuackTransformer
+
+
+class NullPasses:
+    def phase(self, name):
+        return contextlib.nullcontext()
+
+
+NO_PASSES = NullPasses()
+
+
+class PassTimer:
+    def __init__(self, memory=False, profile_dir=None):
+        self.memory = memory
+        self.profile_dir = profile_dir
+        self.phases = []            # [{'phase', 'wall', 'cpu', 'blocks', 'peak'}]
+        self.callbacks = {}         # name -> [calls, seconds]
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if profile_dir:
+            os.makedirs(profile_dir, exist_ok=True)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        profiler = cProfile.Profile() if self.profile_dir else None
+        if self.memory:
+            tracemalloc.reset_peak()
+        blocks = sys.getallocatedblocks()
+        wall, cpu = time.perf_counter(), time.process_time()
+        if profiler:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler:
+                profiler.disable()
+            record = {'phase': name,
+                      'wall': time.perf_counter() - wall,
+                      'cpu': time.process_time() - cpu,
+                      'blocks': sys.getallocatedblocks() - blocks,
+                      'peak': tracemalloc.get_traced_memory()[1] if self.memory else None}
+            self.phases.append(record)
+            if profiler:
+                profiler.dump_stats(os.path.join(self.profile_dir, f'{name}.prof'))
+
+    def instrument_transformer(self, transformer):
+        """Time every QuackTransformer method on this transformer instance"""
+        for name, member in vars(QuackTransformer).items():
+            if name.startswith('_') or not callable(member):
+                continue
+            setattr(transformer, name, self.timed(name, getattr(transformer, name)))
+        return transformer
+
+    def timed(self, name, method):
+        counter = self.callbacks.setdefault(name, [0, 0.0])
+
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                counter[0] += 1
+                counter[1] += time.perf_counter() - start
+        return wrapper
+
+    def report(self):
+        callbacks = sorted(((name, calls, seconds) for name, (calls, seconds) in self.callbacks.items()
+                            if calls), key=lambda item: -item[2])
+        return {'phases': self.phases,
+                'callbacks': [{'callback': name, 'calls': calls, 'seconds': seconds}
+                              for name, calls, seconds in callbacks]}
+
+    def format_table(self):
+        total_wall = sum(p['wall'] for p in self.phases) or 1
+        lines = [f'{"phase":<12} {"wall s":>9} {"%":>6} {"cpu s":>9} {"+blocks":>10}'
+                 + (f' {"peak KB":>10}' if self.memory else '')]
+        for p in self.phases:
+            line = (f'{p["phase"]:<12} {p["wall"]:>9.4f} {100 * p["wall"] / total_wall:>6.1f}'
+                    f' {p["cpu"]:>9.4f} {p["blocks"]:>10,}')
+            if self.memory:
+                line += f' {p["peak"] // 1024:>10,}'
+            lines.append(line)
+        lines.append(f'{"total":<12} {sum(p["wall"] for p in self.phases):>9.4f}'
+                     f' {"":>6} {sum(p["cpu"] for p in self.phases):>9.4f}')
+        callbacks = self.report()['callbacks']
+        if callbacks:
+            lines.append('')
+            lines.append(f'{"transformer callback (inclusive, within parse)":<48} {"calls":>9} {"s":>9}')
+            for c in callbacks:
+                lines.append(f'{c["callback"]:<48} {c["calls"]:>9,} {c["seconds"]:>9.4f}')
+        return '\n'.join(lines)
+
+    def write(self, out_format='table', out=sys.stderr):
+        if out_format == 'json':
+            json.dump(self.report(), out, indent=1)
+            out.write('\n')
+        else:
+            print(self.format_table(), file=out)
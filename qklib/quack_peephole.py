@@ -0,0 +1,283 @@
+"""Peephole optimizer over the instruction lists built by QuackCodeGenerator.
+
+Window rules look at the last few instructions emitted and rewrite them
+in place; after a rewrite the new tail is matched again, so chains
+collapse in one pass.  Flow rules need the whole body (label targets,
+which labels are used) and run between window passes.  Passes repeat
+until nothing changes.  Every rule has a name and a hit counter, and a
+run can be limited to a subset of the rules.
+
+The main program and each method body are optimized separately; labels
+never cross from one to another.
+
+`.line` directives (quack_parser.py -g) are transparent to the window
+rules, so a line table does not change the code: a directive that ends
+up inside a rewritten window moves to just after the replacement.
+
+Superinstructions (fusion rules) replace the most frequently executed
+sequences, as measured by benchmarks/opcode_ngrams.py, with one VM
+instruction each.  They run last, once slots are final.
+"""
+
+# Fused compare-and-branch instructions, jumping when the comparison holds
+CMP_JUMPS = ('jump_ilt', 'jump_ile', 'jump_igt', 'jump_ige', 'jump_ieq', 'jump_ine')
+JUMPS = ('jump', 'jump_if', 'jump_ifnot') + CMP_JUMPS
+# Control never falls through these
+TERMINATORS = ('jump', 'return', 'halt')
+
+MAX_PASSES = 10
+
+
+def split(line):
+    op, _, arg = line.partition(' ')
+    return op, arg
+
+
+def is_label(line):
+    return line.endswith(':')
+
+
+def is_line_directive(line):
+    return line.startswith('.line ')
+
+
+# Window rules: name -> (window size, rewrite).  rewrite(window) returns
+# the replacement list, or None when the window does not match.
+
+def self_assign(window):
+    # load i; store i  ->  (nothing)
+    (op1, arg1), (op2, arg2) = map(split, window)
+    if op1 == 'load' and op2 == 'store' and arg1 == arg2:
+        return []
+    return None
+
+
+def store_load(window):
+    # store i; load i  ->  tee i
+    (op1, arg1), (op2, arg2) = map(split, window)
+    if op1 == 'store' and op2 == 'load' and arg1 == arg2:
+        return [f'tee {arg1}']
+    return None
+
+
+def dead_push(window):
+    # const x; pop  or  load i; pop  ->  (nothing)
+    if window[1] == 'pop' and split(window[0])[0] in ('const', 'load'):
+        return []
+    return None
+
+
+def const_branch(window):
+    # A conditional jump on a literal is either a jump or nothing
+    (op1, arg1), (op2, arg2) = map(split, window)
+    if op1 != 'const' or arg1 not in ('true', 'false') or op2 not in ('jump_if', 'jump_ifnot'):
+        return None
+    taken = (arg1 == 'true') == (op2 == 'jump_if')
+    return [f'jump {arg2}'] if taken else []
+
+
+def jump_next(window):
+    # jump L; L:  ->  L:
+    op, arg = split(window[0])
+    if op in ('jump', 'jump_if', 'jump_ifnot') and window[1] == f'{arg}:':
+        return [window[1]] if op == 'jump' else ['pop', window[1]]
+    return None
+
+
+WINDOW_RULES = {
+    'self_assign': (2, self_assign),
+    'store_load': (2, store_load),
+    'dead_push': (2, dead_push),
+    'const_branch': (2, const_branch),
+    'jump_next': (2, jump_next),
+}
+
+
+# Flow rules: name -> rewrite(code), returning (new code, hits)
+
+def thread_jumps(code):
+    """A jump to a label whose first instruction is `jump M` goes to M"""
+    target = {}
+    for i, line in enumerate(code):
+        if is_label(line):
+            j = i + 1
+            while j < len(code) and (is_label(code[j]) or is_line_directive(code[j])):
+                j += 1
+            if j < len(code) and split(code[j])[0] == 'jump':
+                target[line[:-1]] = split(code[j])[1]
+    if not target:
+        return code, 0
+    out = []
+    hits = 0
+    for line in code:
+        op, arg = split(line)
+        if op in JUMPS and arg in target:
+            final, seen = arg, {arg}
+            while final in target and target[final] not in seen:
+                final = target[final]
+                seen.add(final)
+            if final != arg:
+                line = f'{op} {final}'
+                hits += 1
+        out.append(line)
+    return out, hits
+
+
+def unreachable(code):
+    """Drop instructions between an unconditional transfer and the next label"""
+    out = []
+    hits = 0
+    dead = False
+    for line in code:
+        if is_label(line):
+            dead = False
+        elif dead:
+            hits += 1
+            continue
+        out.append(line)
+        if split(line)[0] in TERMINATORS:
+            dead = True
+    return out, hits
+
+
+def unused_labels(code):
+    used = {split(line)[1] for line in code if split(line)[0] in JUMPS}
+    out = [line for line in code if not is_label(line) or line[:-1] in used]
+    return out, len(code) - len(out)
+
+
+FLOW_RULES = {
+    'thread_jumps': thread_jumps,
+    'unreachable': unreachable,
+    'unused_labels': unused_labels,
+}
+
+
+# Fusion rules: window rules applied by fuse_generator, after everything else
+
+def inc_local(window):
+    # load i; const 1; iadd; store i  ->  inc_local i
+    (op1, arg1), (op2, arg2), (op3, _), (op4, arg4) = map(split, window)
+    if (op1 == 'load' and op2 == 'const' and arg2 == '1' and op3 == 'iadd'
+            and op4 in ('store', 'tee') and arg4 == arg1):
+        return [f'inc_local {arg1}'] + ([f'load {arg1}'] if op4 == 'tee' else [])
+    return None
+
+
+# Both operands are packed into one 32-bit operand
+PACKED_LIMIT = 1 << 15
+
+
+def load_load_add(window):
+    # load a; load b; iadd|fadd|sconcat  ->  load_load_add a b
+    (op1, arg1), (op2, arg2), (op3, _) = map(split, window)
+    if (op1 == 'load' and op2 == 'load' and op3 in ('iadd', 'fadd', 'sconcat')
+            and int(arg1) < PACKED_LIMIT and int(arg2) < PACKED_LIMIT):
+        return [f'load_load_add {arg1} {arg2}']
+    return None
+
+
+# Int comparison -> (jump when it holds, jump when it does not)
+CMP_BRANCHES = {
+    'ilt': ('jump_ilt', 'jump_ige'), 'ige': ('jump_ige', 'jump_ilt'),
+    'igt': ('jump_igt', 'jump_ile'), 'ile': ('jump_ile', 'jump_igt'),
+    'ieq': ('jump_ieq', 'jump_ine'), 'ine': ('jump_ine', 'jump_ieq'),
+}
+
+
+def cmp_jump(window):
+    # ilt; jump_ifnot L  ->  jump_ige L   (Ints only: for Floats NaN breaks the negation)
+    (op1, _), (op2, arg2) = map(split, window)
+    if op1 in CMP_BRANCHES and op2 in ('jump_if', 'jump_ifnot'):
+        return [f'{CMP_BRANCHES[op1][op2 == "jump_ifnot"]} {arg2}']
+    return None
+
+
+FUSION_RULES = {
+    'inc_local': (4, inc_local),
+    'load_load_add': (3, load_load_add),
+    'cmp_jump': (2, cmp_jump),
+}
+
+RULES = list(WINDOW_RULES) + list(FLOW_RULES) + list(FUSION_RULES)
+
+
+class PeepholeOptimizer:
+    """Runs the selected rules; hits accumulates across every body optimized"""
+    def __init__(self, rules=None):
+        rules = RULES if rules is None else list(rules)
+        unknown = set(rules) - set(RULES)
+        if unknown:
+            raise ValueError(f"unknown peephole rule(s): {', '.join(sorted(unknown))}")
+        self.window_rules = [(name,) + WINDOW_RULES[name] for name in rules if name in WINDOW_RULES]
+        self.flow_rules = [(name, FLOW_RULES[name]) for name in rules if name in FLOW_RULES]
+        self.fusion_rules = [(name,) + FUSION_RULES[name] for name in rules if name in FUSION_RULES]
+        self.hits = dict.fromkeys(rules, 0)
+
+    def window_pass(self, code, rules=None):
+        out = []
+        marks = []      # (position in out, directive) of held-back .line directives
+        changed = False
+        for line in code:
+            if is_line_directive(line):
+                marks.append((len(out), line))
+                continue
+            out.append(line)
+            matched = True
+            while matched:
+                matched = False
+                for name, size, rewrite in rules or self.window_rules:
+                    if len(out) < size:
+                        continue
+                    replacement = rewrite(out[-size:])
+                    if replacement is not None:
+                        start = len(out) - size
+                        out[-size:] = replacement
+                        k = len(marks)
+                        while k and marks[k - 1][0] > start:
+                            k -= 1
+                            marks[k] = (len(out), marks[k][1])
+                        self.hits[name] += 1
+                        changed = matched = True
+                        break
+        if marks:
+            merged = []
+            previous = 0
+            for position, directive in marks:
+                merged.extend(out[previous:position])
+                merged.append(directive)
+                previous = position
+            merged.extend(out[previous:])
+            out = merged
+        return out, changed
+
+    def optimize(self, code):
+        """Return an optimized copy of one body's instruction list"""
+        for _ in range(MAX_PASSES):
+            code, changed = self.window_pass(code)
+            for name, rewrite in self.flow_rules:
+                code, hits = rewrite(code)
+                if hits:
+                    self.hits[name] += hits
+                    changed = True
+            if not changed:
+                break
+        return code
+
+    def optimize_generator(self, generator):
+        """Optimize the main program and every method body of generator in place"""
+        generator.code[:] = self.optimize(generator.code)
+        for _, _, body in generator.methods:
+            body[:] = self.optimize(body)
+
+    def fuse(self, code):
+        """Return a copy of one body with hot sequences replaced by superinstructions"""
+        if not self.fusion_rules:
+            return code
+        return self.window_pass(code, self.fusion_rules)[0]
+
+    def fuse_generator(self, generator):
+        """Replace hot sequences with superinstructions in every body of generator"""
+        generator.code[:] = self.fuse(generator.code)
+        for _, _, body in generator.methods:
+            body[:] = self.fuse(body)
@@ -0,0 +1,151 @@
+"""Counting profiler for the VM.
+
+Running vm.py under cProfile charges every instruction with a Python
+function call of bookkeeping and distorts the picture by an order of
+magnitude.  Profiler.run() instead executes the program with its own
+copy of the dispatch loop that counts every instruction by offset, and
+does a little more work only at calls, returns and backward jumps:
+
+    per opcode        instructions executed (summed from the offsets)
+    per method        calls, instructions, self and inclusive time
+    back-edges        taken backward jumps by target (loop headers)
+    per source line   instructions, through the `.line` table that
+                      quack_parser.py -g puts in the assembly
+    stacks            instructions per call stack, in the collapsed
+                      format flamegraph.pl and speedscope read
+
+VM.run() itself is untouched, so an unprofiled run costs nothing extra.
+Method times include the profiler's own overhead in proportion to the
+instructions run; instruction counts are exact.
+"""
+
+import time
+from collections import Counter
+
+from vm import CALL_USER, JUMPS, OPNAMES, RETURN
+
+MAIN = '$main'
+
+
+class Profiler:
+    def __init__(self, program):
+        self.program = program
+        self.pc_counts = [0] * len(program)
+        self.back_edges = Counter()         # target offset -> times taken
+        self.calls = Counter()              # method -> calls
+        self.self_time = Counter()          # method -> seconds on top of the stack
+        self.total_time = Counter()         # method -> seconds while active (outermost)
+        self.self_steps = Counter()         # method -> instructions on top of the stack
+        self.stacks = Counter()             # 'a;b;c' -> instructions
+        self.steps = 0
+
+    def run(self, vm, max_steps=None):
+        """Run vm (on self.program) as VM.run does, counting as it goes"""
+        ops = self.program.ops
+        args = self.program.args
+        methods = self.program.methods
+        dispatch = vm.dispatch
+        counts = self.pc_counts
+        back_edges = self.back_edges
+        watched = JUMPS | {CALL_USER, RETURN}
+        limit = -1 if max_steps is None else max_steps
+        # Call stack of (method, entry time); the stack key and the start of
+        # the current segment (time, steps) of the method on top
+        active = [(MAIN, time.perf_counter())]
+        key = MAIN
+        depth = Counter({MAIN: 1})
+        segment_time, segment_steps = active[0][1], 0
+        steps = 0
+        while vm.running and steps != limit:
+            pc = vm.pc
+            op = ops[pc]
+            counts[pc] += 1
+            vm.pc = pc + 1
+            dispatch[op](args[pc])
+            steps += 1
+            if op in watched:
+                if op == CALL_USER or op == RETURN and len(active) > 1:
+                    now = time.perf_counter()
+                    top = active[-1][0]
+                    self.self_time[top] += now - segment_time
+                    self.self_steps[top] += steps - segment_steps
+                    self.stacks[key] += steps - segment_steps
+                    segment_time, segment_steps = now, steps
+                    if op == CALL_USER:
+                        name = methods[args[pc]][0]
+                        active.append((name, now))
+                        depth[name] += 1
+                        self.calls[name] += 1
+                        key = f'{key};{name}'
+                    else:
+                        name, entered = active.pop()
+                        depth[name] -= 1
+                        if not depth[name]:
+                            self.total_time[name] += now - entered
+                        key = key.rpartition(';')[0]
+                elif vm.pc <= pc and op != RETURN:
+                    back_edges[vm.pc] += 1
+        now = time.perf_counter()
+        top = active[-1][0]
+        self.self_time[top] += now - segment_time
+        self.self_steps[top] += steps - segment_steps
+        self.stacks[key] += steps - segment_steps
+        for name, entered in active:
+            self.total_time[name] += now - entered
+        self.calls[MAIN] += 1
+        self.steps += steps
+        vm.steps += steps
+        return steps
+
+    def opcode_counts(self):
+        counts = Counter()
+        ops = self.program.ops
+        for pc, count in enumerate(self.pc_counts):
+            if count:
+                counts[OPNAMES[ops[pc]]] += count
+        return counts
+
+    def line_counts(self):
+        """Instructions per source line; empty without a line table"""
+        counts = Counter()
+        if not self.program.lines:
+            return counts
+        for pc, count in enumerate(self.pc_counts):
+            if count:
+                line = self.program.line_at(pc)
+                if line is not None:
+                    counts[line] += count
+        return counts
+
+    def collapsed(self):
+        """Collapsed stacks, one `frame;frame;frame count` line per stack"""
+        return [f'{stack} {count}' for stack, count in sorted(self.stacks.items()) if count]
+
+    def report(self, top=15):
+        total = self.steps or 1
+        lines = [f'{self.steps:,} instructions']
+        lines.append('')
+        lines.append(f'{"opcode":<16} {"count":>14} {"%":>6}')
+        for name, count in self.opcode_counts().most_common(top):
+            lines.append(f'{name:<16} {count:>14,} {100 * count / total:>6.1f}')
+        lines.append('')
+        lines.append(f'{"method":<24} {"calls":>10} {"instr":>14} {"self s":>9} {"total s":>9}')
+        for name, count in self.self_steps.most_common(top):
+            lines.append(f'{name:<24} {self.calls[name]:>10,} {count:>14,}'
+                         f' {self.self_time[name]:>9.4f} {self.total_time[name]:>9.4f}')
+        if self.back_edges:
+            lines.append('')
+            lines.append(f'{"loop header":<24} {"line":>6} {"iterations":>14}')
+            for target, count in self.back_edges.most_common(top):
+                line = self.program.line_at(target)
+                lines.append(f'{"pc " + str(target):<24} {line if line is not None else "-":>6}'
+                             f' {count:>14,}')
+        line_counts = self.line_counts()
+        lines.append('')
+        if line_counts:
+            lines.append(f'{"source line":<12} {"instr":>14} {"%":>6}')
+            for line, count in line_counts.most_common(top):
+                lines.append(f'{line:<12} {count:>14,} {100 * count / total:>6.1f}')
+        else:
+            lines.append('no line table: compile to .asm with quack_parser.py -g for per-line counts')
+        return '\n'.join(lines)
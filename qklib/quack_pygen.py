@@ -0,0 +1,267 @@
+"""Ahead-of-time backend: the typed AST as a Python module (--target py).
+
+QuackPythonGenerator walks the tree QuackTransformer builds, after the
+same AST passes as the VM target (quack_optimizer.optimize), and writes
+a self-contained module: every def becomes a module-level function, the
+main program becomes main(), and Quack variables become Python locals.
+The result runs on CPython with no VM underneath and, written to a file,
+is byte-compiled to a .pyc next to it like any other module.
+
+The module keeps the VM's semantics:
+
+    frames      a body only sees its parameters and its own variables;
+                every other name it uses starts out as nothing (None),
+                as the slots of `alloc` do
+    operators   operands the checker proved Int, Float or String use the
+                Python operator of the specialized instruction (Int
+                division truncates toward zero); anything else is sent
+                as the method the VM target would call
+    methods     `x.m(...)` dispatches on the runtime class of x through
+                a table rendered from vm.METHODS, and an unknown method
+                of the static class is rejected at compile time, as the
+                assembler does
+
+Names are prefixed (v_x, f_g) so Quack names never shadow Python ones.
+The instruction-level passes (peephole, slot allocation, fusion) have
+no counterpart here.  benchmarks/check_targets.py runs the samples on
+both targets and compares their output.
+"""
+
+import math
+import operator
+
+from quack_ast import (And, Assign, Block, Boolean, Float, FuncCall, FuncDef, GENERIC, Int,
+                       MethodCall, Not, Or, SPECIALIZED, String, Var, static_class)
+from vm import CLASS_OF, METHODS, VMError, builtin_arity, int_divide, quack_print, quack_str
+
+# Specialized instruction -> Python expression over the operand sources
+NATIVE = {
+    'iadd': '({0} + {1})', 'isub': '({0} - {1})', 'imul': '({0} * {1})',
+    'idiv': '_idiv({0}, {1})',
+    'fadd': '({0} + {1})', 'fsub': '({0} - {1})', 'fmul': '({0} * {1})', 'fdiv': '({0} / {1})',
+    'sconcat': '({0} + {1})',
+    'ilt': '({0} < {1})', 'igt': '({0} > {1})', 'ile': '({0} <= {1})', 'ige': '({0} >= {1})',
+    'ieq': '({0} == {1})', 'ine': '({0} != {1})',
+    'flt': '({0} < {1})', 'fgt': '({0} > {1})', 'fle': '({0} <= {1})', 'fge': '({0} >= {1})',
+    'feq': '({0} == {1})', 'fne': '({0} != {1})',
+    'seq': '({0} == {1})', 'sne': '({0} != {1})',
+}
+
+RUNTIME = '''\
+import operator as _operator
+
+
+class QuackError(Exception):
+    pass
+
+
+def _str(value):
+    if value is True:
+        return 'true'
+    if value is False:
+        return 'false'
+    if value is None:
+        return 'nothing'
+    return str(value)
+
+
+def _print(value):
+    print(_str(value))
+    return None
+
+
+def _idiv(left, right):
+    quotient = abs(left) // abs(right)
+    return quotient if (left >= 0) == (right >= 0) else -quotient
+
+
+_CLASS_OF = {class_of}
+
+_METHODS = {{
+{methods}
+}}
+
+
+def _send(receiver, clazz, method, *args):
+    impl = _METHODS[_CLASS_OF[type(receiver)]].get(method)
+    if impl is None:
+        raise QuackError(f'{{_str(receiver)}} does not understand {{clazz}}: {{method}}')
+    return impl(receiver, *args)
+'''
+
+# Runtime functions of the VM and their names in the generated module
+RUNTIME_NAMES = {quack_print: '_print', quack_str: '_str', int_divide: '_idiv'}
+
+
+def impl_name(impl):
+    if impl in RUNTIME_NAMES:
+        return RUNTIME_NAMES[impl]
+    if getattr(operator, impl.__name__, None) is impl:
+        return f'_operator.{impl.__name__}'
+    raise ValueError(f'no Python name for builtin implementation {impl!r}')
+
+
+def runtime():
+    """The module prelude, with the method table rendered from vm.METHODS"""
+    class_of = '{' + ', '.join(f'{"type(None)" if py_type is type(None) else py_type.__name__}: '
+                               f'{clazz!r}' for py_type, clazz in CLASS_OF.items()) + '}'
+    methods = []
+    for clazz, table in METHODS.items():
+        entries = ', '.join(f'{name!r}: {impl_name(impl)}' for name, (_, impl) in sorted(table.items()))
+        methods.append(f'    {clazz!r}: {{{entries}}},')
+    return RUNTIME.format(class_of=class_of, methods='\n'.join(methods))
+
+
+def variable(name):
+    return f'v_{name}'
+
+
+def function(name):
+    return f'f_{name}'
+
+
+def body_names(statements):
+    """Variables a body reads or assigns, not counting nested defs"""
+    names = {}
+    pending = list(reversed(statements))
+    while pending:
+        node = pending.pop()
+        if isinstance(node, FuncDef) or node is None:
+            continue
+        if isinstance(node, Var):
+            names.setdefault(node.name)
+        elif isinstance(node, Assign):
+            names.setdefault(node.var.name)
+        for field in getattr(type(node), '__slots__', ()):
+            if field in ('inferred_type', 'line', 'params'):
+                continue
+            child = getattr(node, field, None)
+            if isinstance(child, list):
+                pending.extend(reversed(child))
+            elif hasattr(child, '__slots__'):
+                pending.append(child)
+    return list(names)
+
+
+class QuackPythonGenerator:
+    def __init__(self, source_name=None):
+        self.source_name = source_name
+        self.functions = []         # lines of every def, in the order they were reached
+        self.defined = set()
+
+    def generate(self, tree):
+        """Module source for tree (a Block of statements, or a list of them)"""
+        statements = tree.statements if isinstance(tree, Block) else list(tree)
+        main = self.function_lines('main', [], statements)
+        origin = f' from {self.source_name}' if self.source_name else ''
+        parts = [f'"""Generated by quack_parser.py --target py{origin}; do not edit."""\n',
+                 runtime()]
+        for lines in self.functions:
+            parts.append('\n'.join(lines) + '\n')
+        parts.append('\n'.join(main) + '\n')
+        parts.append("if __name__ == '__main__':\n    main()\n")
+        return '\n\n'.join(parts)
+
+    def function_lines(self, name, params, statements):
+        lines = [f'def {name}({", ".join(variable(param) for param in params)}):']
+        unset = [variable(n) for n in body_names(statements) if n not in params]
+        if unset:
+            lines.append('    ' + ' = '.join(unset) + ' = None')
+        body = self.block(statements, 1)
+        lines.extend(body)
+        if len(lines) == 1:
+            lines.append('    pass')
+        return lines
+
+    def block(self, statements, depth):
+        lines = []
+        for stmt in statements:
+            lines.extend(self.statement(stmt, depth))
+        return lines
+
+    def statement(self, node, depth):
+        method = getattr(self, f'visit_{type(node).__name__}', None)
+        if method is None:
+            raise NotImplementedError(f'no Python translation for {type(node).__name__}')
+        return method(node, '    ' * depth, depth)
+
+    def nested(self, block, depth):
+        return self.block(block.statements, depth + 1) or ['    ' * (depth + 1) + 'pass']
+
+    # Statements
+
+    def visit_Assign(self, node, indent, depth):
+        return [f'{indent}{variable(node.var.name)} = {self.expr(node.expr)}']
+
+    def visit_Print(self, node, indent, depth):
+        return [f'{indent}_print({self.expr(node.expr)})']
+
+    def visit_Return(self, node, indent, depth):
+        return [f'{indent}return {self.expr(node.expr)}']
+
+    def visit_Block(self, node, indent, depth):
+        return self.block(node.statements, depth)
+
+    def visit_If(self, node, indent, depth):
+        lines = [f'{indent}if {self.expr(node.condition)}:']
+        lines.extend(self.nested(node.then_body, depth))
+        if node.else_body.statements:
+            lines.append(f'{indent}else:')
+            lines.extend(self.nested(node.else_body, depth))
+        return lines
+
+    def visit_While(self, node, indent, depth):
+        lines = [f'{indent}while {self.expr(node.condition)}:']
+        lines.extend(self.nested(node.body, depth))
+        return lines
+
+    def visit_FuncDef(self, node, indent, depth):
+        # Every def is a module-level function, wherever it appears
+        if node.name in self.defined:
+            raise VMError(f'redefinition of method {node.name}')
+        self.defined.add(node.name)
+        params = [param for param, _ in node.params]
+        self.functions.append(self.function_lines(function(node.name), params,
+                                                  node.body.statements))
+        return []
+
+    # Expressions
+
+    def expr(self, node):
+        if isinstance(node, Var):
+            return variable(node.name)
+        if isinstance(node, Boolean):
+            return 'True' if node.value else 'False'
+        if isinstance(node, Int):
+            return repr(int(node.value))
+        if isinstance(node, Float):
+            value = float(node.value)
+            return repr(value) if math.isfinite(value) else f"float('{value}')"
+        if isinstance(node, String):
+            return f'"{node.value}"'
+        if isinstance(node, And):
+            return f'({self.expr(node.left)} and {self.expr(node.right)})'
+        if isinstance(node, Or):
+            return f'({self.expr(node.left)} or {self.expr(node.right)})'
+        if isinstance(node, Not):
+            return f'(not {self.expr(node.expr)})'
+        if type(node) in GENERIC:
+            return self.binary(node)
+        if isinstance(node, FuncCall):
+            return f'{function(node.func_name)}({", ".join(self.expr(arg) for arg in node.args)})'
+        if isinstance(node, MethodCall):
+            clazz = getattr(node.obj, 'inferred_type', None) or 'Obj'
+            builtin_arity(clazz, node.method_name)
+            args = ''.join(f', {self.expr(arg)}' for arg in node.args)
+            return f'_send({self.expr(node.obj)}, {clazz!r}, {node.method_name!r}{args})'
+        raise NotImplementedError(f'no Python translation for {type(node).__name__}')
+
+    def binary(self, node):
+        left, right = self.expr(node.left), self.expr(node.right)
+        left_type = getattr(node.left, 'inferred_type', None)
+        if left_type == getattr(node.right, 'inferred_type', None):
+            opcode = SPECIALIZED.get((type(node), left_type))
+            if opcode is not None:
+                return NATIVE[opcode].format(left, right)
+        return f"_send({left}, {static_class(node.left)!r}, {GENERIC[type(node)]!r}, {right})"
+
@@ -0,0 +1,157 @@
+"""Liveness-based local slot allocation.
+
+QuackCodeGenerator numbers variables by name, one slot per name for the
+whole body, so a long script needs a frame as large as its vocabulary.
+This pass splits a body (the main program or one method) into basic
+blocks, computes which slots are live at every instruction, and colors
+the interference graph so that variables whose lifetimes do not overlap
+share a slot.  Stores to a variable that is never read again become
+`pop` (a dead `tee` is dropped).
+
+A variable that can be read before it is written (live on entry) keeps
+a slot of its own, so it still reads as nothing.  The pass runs before
+superinstruction fusion, so it only sees load, store and tee.
+"""
+
+from quack_code_generator import SLOT_OPS, frame_size
+from quack_peephole import JUMPS, TERMINATORS
+
+
+def is_label(line):
+    return line.endswith(':')
+
+
+def basic_blocks(code):
+    """[(start, end)] of each block, and the successors of each block"""
+    starts = {0}
+    for i, line in enumerate(code):
+        if is_label(line):
+            starts.add(i)
+        elif line.partition(' ')[0] in JUMPS + TERMINATORS:
+            starts.add(i + 1)
+    starts = sorted(s for s in starts if s < len(code))
+    bounds = list(zip(starts, starts[1:] + [len(code)]))
+    block_of_label = {}
+    for b, (start, end) in enumerate(bounds):
+        i = start
+        while i < end and is_label(code[i]):
+            block_of_label[code[i][:-1]] = b
+            i += 1
+    successors = []
+    for b, (start, end) in enumerate(bounds):
+        op, _, arg = code[end - 1].partition(' ')
+        succ = []
+        if op in JUMPS:
+            succ.append(block_of_label[arg])
+        if op not in TERMINATORS and b + 1 < len(bounds):
+            succ.append(b + 1)
+        successors.append(succ)
+    return bounds, successors
+
+
+def slot_of(line):
+    op, _, arg = line.partition(' ')
+    return (op, int(arg)) if op in SLOT_OPS else (op, None)
+
+
+def live_out_sets(code, bounds, successors):
+    """Slots live at the end of each block (iterated to a fixed point)"""
+    uses, defs = [], []
+    for start, end in bounds:
+        use, define = set(), set()
+        for line in code[start:end]:
+            op, slot = slot_of(line)
+            if op == 'load' and slot not in define:
+                use.add(slot)
+            elif op in ('store', 'tee'):
+                define.add(slot)
+        uses.append(use)
+        defs.append(define)
+    live_in = [set(use) for use in uses]
+    live_out = [set() for _ in bounds]
+    changed = True
+    while changed:
+        changed = False
+        for b in reversed(range(len(bounds))):
+            out = set()
+            for s in successors[b]:
+                out |= live_in[s]
+            if out != live_out[b]:
+                live_out[b] = out
+                new_in = uses[b] | (out - defs[b])
+                if new_in != live_in[b]:
+                    live_in[b] = new_in
+                changed = True
+    return live_in, live_out
+
+
+def allocate(code):
+    """Return (new code, stats) for one body"""
+    before = frame_size(code)
+    stats = {'before': before, 'after': before, 'dead_stores': 0}
+    if not code or not before:
+        return code, stats
+    bounds, successors = basic_blocks(code)
+    live_in, live_out = live_out_sets(code, bounds, successors)
+
+    interferes = {}
+    order = {}      # slot -> first position, to color in program order
+    for i, line in enumerate(code):
+        op, slot = slot_of(line)
+        if slot is not None:
+            order.setdefault(slot, i)
+            interferes.setdefault(slot, set())
+    dead = set()
+    for b, (start, end) in enumerate(bounds):
+        live = set(live_out[b])
+        for i in range(end - 1, start - 1, -1):
+            op, slot = slot_of(code[i])
+            if op in ('store', 'tee'):
+                if slot not in live:
+                    dead.add(i)
+                    continue
+                live.discard(slot)
+                for other in live:
+                    interferes[slot].add(other)
+                    interferes[other].add(slot)
+            elif op == 'load':
+                live.add(slot)
+
+    # Variables live on entry are never shared
+    reserved = sorted(live_in[0], key=order.get)
+    color = {slot: i for i, slot in enumerate(reserved)}
+    for slot in sorted(order, key=order.get):
+        if slot in color:
+            continue
+        taken = {color[other] for other in interferes[slot] if other in color}
+        c = len(reserved)
+        while c in taken:
+            c += 1
+        color[slot] = c
+
+    out = []
+    for i, line in enumerate(code):
+        op, slot = slot_of(line)
+        if i in dead:
+            stats['dead_stores'] += 1
+            if op == 'store':
+                out.append('pop')
+        elif slot is not None:
+            out.append(f'{op} {color[slot]}')
+        else:
+            out.append(line)
+    stats['after'] = frame_size(out)
+    return out, stats
+
+
+def allocate_generator(generator):
+    """Reallocate the slots of every body of generator in place.
+    Returns [(body name, stats)], the main program first (named None).
+    """
+    report = []
+    generator.code[:], stats = allocate(generator.code)
+    report.append((None, stats))
+    for name, _, body in generator.methods:
+        body[:], stats = allocate(body)
+        report.append((name, stats))
+    return report
@@ -0,0 +1,104 @@
+"""Streaming compilation with bounded memory.
+
+A whole-file compile reads the source into one string, parses it into
+one tree and joins the generated code in memory, so it needs several
+times the size of the input.  The streaming compiler instead maps the
+source file (mmap: the pages are the page cache's, not the process
+heap), finds its top-level statements with the scanner of quack_cache.py
+and parses, type-checks, optimizes and generates one statement at a
+time.  Code for the main program is written to the output file as soon
+as its statement is done; method bodies are spooled to a temporary file
+and copied after the `halt` at the end.
+
+The frame size of the main program is only known at the end, so the
+`alloc` header is written as a fixed-width placeholder and patched in
+place.  What stays in memory is the symbol table and the variable
+numbering, which grow with the number of distinct names, not with the
+length of the file.
+
+Per statement the peephole rules and superinstruction fusion run as
+usual; liveness-based slot allocation needs the whole main program, so
+main-program variables keep one slot per name (method bodies, which are
+complete when their `def` is, are still allocated).
+"""
+
+import mmap
+import shutil
+import tempfile
+
+from quack_cache import unit_spans
+from quack_code_generator import QuackCodeGenerator, frame_size
+from quack_optimizer import DEFAULT_LEVEL, optimize
+from quack_peephole import PeepholeOptimizer
+from quack_slots import allocate
+
+# 'alloc' and room for any frame size; the assembler strips the padding
+HEADER_WIDTH = 24
+
+
+def source_units(path):
+    """Yield the text of each top-level statement of the file at path"""
+    with open(path, 'rb') as source:
+        try:
+            mapped = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:      # empty file
+            return
+        with mapped:
+            for start, end in unit_spans(mapped):
+                yield mapped[start:end].decode('utf-8')
+
+
+def write_method(spool, name, params, body):
+    spool.write(f'.method {name}\n')
+    if params:
+        spool.write(f'.args {", ".join(params)}\n')
+    spool.write('enter\n')
+    spool.write(f'alloc {frame_size(body)}\n')
+    for line in body:
+        spool.write(line + '\n')
+
+
+def compile_stream(path, out, parse, level=DEFAULT_LEVEL, peephole=None):
+    """Compile the source file at path into out, a seekable text file.
+
+    parse(text, symbols) must parse and type-check text with symbols as
+    the transformer's symbol table (updating it in place).  Returns
+    {'units', 'methods', 'slots'}.
+    """
+    if level >= 1:
+        peephole = peephole or PeepholeOptimizer()
+    codegen = QuackCodeGenerator()
+    symbols = {}
+    stats = {'units': 0, 'methods': 0, 'slots': 0}
+    header = out.tell()
+    out.write(f'{"alloc 0":<{HEADER_WIDTH}}\n')
+    with tempfile.TemporaryFile('w+') as spool:
+        for unit_text in source_units(path):
+            tree, _ = optimize(parse(unit_text, symbols), level)
+            codegen.code = []
+            codegen.methods = []
+            codegen.generate(tree)
+            code = codegen.code
+            if level >= 1:
+                code = peephole.fuse(peephole.optimize(code))
+            for line in code:
+                out.write(line + '\n')
+            for name, params, body in codegen.methods:
+                if level >= 1:
+                    body = peephole.optimize(body)
+                    body, _ = allocate(body)
+                    body = peephole.fuse(peephole.optimize(body))
+                write_method(spool, name, params, body)
+                stats['methods'] += 1
+            stats['units'] += 1
+        if stats['methods']:
+            out.write('halt\n')
+            spool.seek(0)
+            shutil.copyfileobj(spool, out)
+    # Every main-program slot is a variable of the shared numbering
+    stats['slots'] = codegen.var_counter
+    end = out.tell()
+    out.seek(header)
+    out.write(f'{"alloc " + str(stats["slots"]):<{HEADER_WIDTH}}')
+    out.seek(end)
+    return stats
@@ -0,0 +1,473 @@
+"""Tiered execution: hot methods and loops run as compiled Python.
+
+TieredVM interprets a program like VM until part of it gets hot.  It
+counts calls per method (CALL_USER) and taken backward jumps per loop;
+when a count reaches the threshold, Translator turns that region of the
+bytecode into the source of a Python function, compile() builds it, and
+from then on the function runs instead of the interpreter:
+
+    method    called with its arguments, returns the method's value;
+              both interpreted and compiled callers use it
+    loop      entered at the header from the backward jump (on-stack
+              replacement), with the frame's locals list; it writes the
+              locals back and returns the offset where the loop exits
+
+The operand stack is resolved at translation time: locals become Python
+locals (l0, l1, ...), stack slots become expressions or temporaries, and
+the specialized and fused opcodes become Python operators, so
+`load 0; const 1; iadd; store 0` is `l0 = (l0 + 1)`.  Control flow is a
+`while True` over `if _pc == ...` blocks.  Builtin calls go through the
+vtables, user calls back through the VM, so a compiled method may call
+an interpreted one and the other way round.
+
+Anything the translator does not cover (inconsistent stack depths,
+jumps out of a method, a halt inside a loop) leaves that region to the
+interpreter.  Compiled code does not count instructions, so a run with
+max_steps is interpreted throughout; it also runs on the Python stack,
+so very deep recursion in compiled methods hits Python's recursion limit.
+"""
+
+import math
+from bisect import bisect_right
+from collections import Counter
+
+from vm import (ALLOC, CALL, CALL_USER, CONST, ENTER, HALT, JUMP, JUMP_IF, JUMP_IFNOT, JUMPS,
+                LOAD, OPCODES, OPNAMES, POP, RETURN, STORE, TEE, VM, VTABLES, VMError,
+                int_divide, quack_str)
+
+DEFAULT_THRESHOLD = 50
+
+INC_LOCAL = OPCODES['inc_local']
+LOAD_LOAD_ADD = OPCODES['load_load_add']
+
+# Specialized opcodes that are a single Python operator
+OPERATORS = {
+    'iadd': '+', 'isub': '-', 'imul': '*', 'fadd': '+', 'fsub': '-', 'fmul': '*',
+    'sconcat': '+',
+    'ilt': '<', 'igt': '>', 'ile': '<=', 'ige': '>=', 'ieq': '==', 'ine': '!=',
+    'flt': '<', 'fgt': '>', 'fle': '<=', 'fge': '>=', 'feq': '==', 'fne': '!=',
+    'seq': '==', 'sne': '!=',
+}
+BINARY = {OPCODES[name]: symbol for name, symbol in OPERATORS.items()}
+# Division can raise, so its result is computed where the interpreter would
+DIVISION = {OPCODES['idiv']: '_idiv({0}, {1})', OPCODES['fdiv']: '({0} / {1})'}
+CMP_JUMPS = {OPCODES['jump_' + name]: OPERATORS[name]
+             for name in ('ilt', 'ile', 'igt', 'ige', 'ieq', 'ine')}
+
+NO_LOCALS = frozenset()
+
+
+class Unsupported(Exception):
+    """The region uses something the translator does not handle"""
+
+
+def make_site(clazz, method, slot):
+    """Builtin call site: virtual dispatch on the receiver, as VM.op_call"""
+    def site(receiver, *args):
+        impl = VTABLES[type(receiver)][slot]
+        if impl is None:
+            raise VMError(f'{quack_str(receiver)} does not understand {clazz}: {method}')
+        return impl(receiver, *args)
+    return site
+
+
+class Translator:
+    """Python source for a method or a loop of an assembled Program"""
+    def __init__(self, program):
+        self.program = program
+        self.entries = sorted(entry for _, entry, _ in program.methods)
+
+    def region_end(self, pc):
+        """End of the method (or main program) containing pc"""
+        i = bisect_right(self.entries, pc)
+        return self.entries[i] if i < len(self.entries) else len(self.program)
+
+    def stack_effect(self, pc):
+        """(values popped, values pushed) by the instruction at pc"""
+        op, arg = self.program.ops[pc], self.program.args[pc]
+        if op in (CONST, LOAD, LOAD_LOAD_ADD):
+            return 0, 1
+        if op in (STORE, POP, JUMP_IF, JUMP_IFNOT):
+            return 1, 0
+        if op == TEE:
+            return 1, 1
+        if op in BINARY or op in DIVISION:
+            return 2, 1
+        if op in CMP_JUMPS:
+            return 2, 0
+        if op == CALL:
+            return self.program.calls[arg][2] + 1, 1
+        if op == CALL_USER:
+            return self.program.methods[arg][2], 1
+        if op == RETURN:
+            return (1 if arg else 0), 0
+        if op in (ALLOC, ENTER, JUMP, INC_LOCAL):
+            return 0, 0
+        raise Unsupported(OPNAMES[op])
+
+    def blocks(self, start, end, depth):
+        """Basic blocks reachable from start: {leader: (block end, stack depth)}"""
+        ops, args = self.program.ops, self.program.args
+        leaders = {start}
+        for pc in range(start, end):
+            op = ops[pc]
+            if op in JUMPS:
+                if start <= args[pc] < end:
+                    leaders.add(args[pc])
+                leaders.add(pc + 1)
+            elif op in (RETURN, HALT):
+                leaders.add(pc + 1)
+        leaders = sorted(pc for pc in leaders if pc < end)
+        ends = dict(zip(leaders, leaders[1:] + [end]))
+        depths = {start: depth}
+        work = [start]
+        while work:
+            leader = work.pop()
+            depth = depths[leader]
+            successors = []
+            for pc in range(leader, ends[leader]):
+                popped, pushed = self.stack_effect(pc)
+                depth -= popped
+                if depth < 0:
+                    raise Unsupported(f'stack underflow at {pc}')
+                depth += pushed
+                op = ops[pc]
+                if op in JUMPS:
+                    successors.append(args[pc])
+                if op in (JUMP, RETURN, HALT):
+                    break
+            else:
+                successors.append(ends[leader])
+            for target in successors:
+                if not start <= target < end:
+                    if depth:
+                        raise Unsupported(f'values left on the stack leaving at {target}')
+                    continue
+                if target not in depths:
+                    depths[target] = depth
+                    work.append(target)
+                elif depths[target] != depth:
+                    raise Unsupported(f'inconsistent stack depth at {target}')
+        return {leader: (ends[leader], depths[leader]) for leader in leaders if leader in depths}
+
+    def method(self, index):
+        """def _method_<index>(_s): the method, called with its argument list"""
+        _, entry, arity = self.program.methods[index]
+        return FunctionWriter(self, f'_method_{index}', entry, self.region_end(entry), arity,
+                              loop=False)
+
+    def loop(self, back_edge):
+        """def _loop_<offset>(_l): the loop closed by the backward jump at back_edge"""
+        header = self.program.args[back_edge]
+        if self.program.ops[back_edge] != JUMP or header > back_edge:
+            raise Unsupported('not a backward jump')
+        if self.region_end(header) != self.region_end(back_edge):
+            raise Unsupported('loop crosses a method boundary')
+        return FunctionWriter(self, f'_loop_{back_edge}', header, back_edge + 1, 0, loop=True)
+
+
+class FunctionWriter:
+    """Translation of the region [start, end) into a Python function.
+
+    Block lines are strings, or (indent, offset) for leaving a loop,
+    which becomes the write-back of every local the loop stores.
+    """
+    def __init__(self, translator, name, start, end, depth, loop):
+        self.program = translator.program
+        self.name = name
+        self.start = start
+        self.end = end
+        self.depth = depth
+        self.loop = loop
+        self.temps = 0
+        self.used = set()
+        self.stored = set()
+        self.constants = {}         # name -> value of constants with no literal
+        self.body = []
+        for leader, (block_end, block_depth) in sorted(translator.blocks(start, end, depth).items()):
+            self.body.append(f'if _pc == {leader}:')
+            self.body.extend(indent(self.block(leader, block_end, block_depth)))
+
+    def source(self):
+        lines = [f'def {self.name}({"_l" if self.loop else "_s"}):']
+        if self.loop:
+            lines.extend(f'    l{i} = _l[{i}]' for i in sorted(self.used))
+        else:
+            if self.used:
+                lines.append('    ' + ' = '.join(f'l{i}' for i in sorted(self.used)) + ' = None')
+            if self.depth:
+                lines.append('    ' + ', '.join(f's{i}' for i in range(self.depth))
+                             + (',' if self.depth == 1 else '') + ' = _s')
+        lines.append(f'    _pc = {self.start}')
+        lines.append('    while True:')
+        for line in self.body:
+            if isinstance(line, tuple):
+                prefix, target = line
+                prefix = '        ' + prefix
+                lines.extend(f'{prefix}_l[{i}] = l{i}' for i in sorted(self.stored))
+                lines.append(f'{prefix}return {target}')
+            else:
+                lines.append('        ' + line)
+        return '\n'.join(lines) + '\n'
+
+    def temp(self, out, expr):
+        name = f't{self.temps}'
+        self.temps += 1
+        out.append(f'{name} = {expr}')
+        return name
+
+    def local(self, slot):
+        self.used.add(slot)
+        return f'l{slot}'
+
+    def constant(self, index):
+        value = self.program.consts[index]
+        if isinstance(value, float) and not math.isfinite(value):
+            name = f'_k{index}'
+            self.constants[name] = value
+            return name
+        return repr(value)
+
+    def assign_local(self, out, stack, slot, expr):
+        """l<slot> = expr, first saving stack entries that read the old value"""
+        for i, (entry, reads) in enumerate(stack):
+            if slot in reads:
+                stack[i] = (self.temp(out, entry), NO_LOCALS)
+        self.stored.add(slot)
+        out.append(f'{self.local(slot)} = {expr}')
+
+    def flush(self, out, stack):
+        """Leave the stack in s0, s1, ... where the next block expects it"""
+        targets = [(f's{i}', entry) for i, (entry, _) in enumerate(stack) if entry != f's{i}']
+        if targets:
+            out.append(', '.join(name for name, _ in targets) + ' = '
+                       + ', '.join(entry for _, entry in targets))
+
+    def goto(self, leader, target):
+        if not self.start <= target < self.end:
+            if not self.loop:
+                raise Unsupported(f'jump out of the method to {target}')
+            return [('', target)]
+        if target <= leader:
+            return [f'_pc = {target}', 'continue']
+        return [f'_pc = {target}']
+
+    def branch(self, out, stack, leader, condition, target, next_pc):
+        if stack:
+            condition = self.temp(out, condition)
+            self.flush(out, stack)
+        out.append(f'if {condition}:')
+        out.extend(indent(self.goto(leader, target)))
+        out.append('else:')
+        out.extend(indent(self.goto(leader, next_pc)))
+
+    def block(self, leader, block_end, depth):
+        ops, args = self.program.ops, self.program.args
+        out = []
+        stack = [(f's{i}', NO_LOCALS) for i in range(depth)]
+        for pc in range(leader, block_end):
+            op, arg = ops[pc], args[pc]
+            if op == CONST:
+                stack.append((self.constant(arg), NO_LOCALS))
+            elif op == LOAD:
+                stack.append((self.local(arg), frozenset([arg])))
+            elif op == STORE:
+                self.assign_local(out, stack, arg, stack.pop()[0])
+            elif op == TEE:
+                self.assign_local(out, stack, arg, stack.pop()[0])
+                stack.append((self.local(arg), frozenset([arg])))
+            elif op == POP:
+                stack.pop()
+            elif op in BINARY:
+                right, right_reads = stack.pop()
+                left, left_reads = stack.pop()
+                stack.append((f'({left} {BINARY[op]} {right})', left_reads | right_reads))
+            elif op in DIVISION:
+                right, left = stack.pop()[0], stack.pop()[0]
+                stack.append((self.temp(out, DIVISION[op].format(left, right)), NO_LOCALS))
+            elif op == INC_LOCAL:
+                self.assign_local(out, stack, arg, f'{self.local(arg)} + 1')
+            elif op == LOAD_LOAD_ADD:
+                first, second = arg >> 16, arg & 0xffff
+                stack.append((f'({self.local(first)} + {self.local(second)})',
+                              frozenset([first, second])))
+            elif op == CALL:
+                values = self.pop_values(stack, self.program.calls[arg][2] + 1)
+                stack.append((self.temp(out, f'_site{arg}({", ".join(values)})'), NO_LOCALS))
+            elif op == CALL_USER:
+                values = self.pop_values(stack, self.program.methods[arg][2])
+                stack.append((self.temp(out, f'_call_user({arg}, [{", ".join(values)}])'),
+                               NO_LOCALS))
+            elif op == ALLOC:
+                if self.loop:
+                    raise Unsupported('alloc inside a loop')
+                if arg:
+                    out.append(' = '.join(self.local(i) for i in range(arg)) + ' = None')
+            elif op == ENTER:
+                if self.loop:
+                    raise Unsupported('enter inside a loop')
+            elif op == RETURN:
+                value = stack.pop()[0] if arg else 'None'
+                out.append(f'return ({value},)' if self.loop else f'return {value}')
+                return out
+            elif op == JUMP:
+                self.flush(out, stack)
+                out.extend(self.goto(leader, arg))
+                return out
+            elif op in (JUMP_IF, JUMP_IFNOT):
+                condition = stack.pop()[0]
+                if op == JUMP_IFNOT:
+                    condition = f'not {condition}'
+                self.branch(out, stack, leader, condition, arg, pc + 1)
+                return out
+            elif op in CMP_JUMPS:
+                right, left = stack.pop()[0], stack.pop()[0]
+                self.branch(out, stack, leader, f'{left} {CMP_JUMPS[op]} {right}', arg, pc + 1)
+                return out
+            else:
+                raise Unsupported(OPNAMES[op])
+        self.flush(out, stack)
+        out.extend(self.goto(leader, block_end))
+        return out
+
+    @staticmethod
+    def pop_values(stack, count):
+        values = [entry for entry, _ in stack[len(stack) - count:]]
+        del stack[len(stack) - count:]
+        return values
+
+
+def indent(lines):
+    return [('    ' + line[0], line[1]) if isinstance(line, tuple) else '    ' + line
+            for line in lines]
+
+
+class TieredVM(VM):
+    """VM that compiles methods and loops to Python once they are hot"""
+    def __init__(self, program, threshold=DEFAULT_THRESHOLD):
+        super().__init__(program)
+        self.threshold = threshold
+        self.translator = Translator(program)
+        self.call_counts = [0] * len(program.methods)
+        self.loop_counts = Counter()            # backward jump offset -> times taken
+        self.method_code = [None] * len(program.methods)   # function, or False: interpret
+        self.loop_code = {}                     # backward jump offset -> function or False
+        self.compiled = []                      # (kind, entry offset, source)
+        self.failed = []                        # (kind, entry offset, reason)
+        self.globals = {'_idiv': int_divide, '_call_user': self.call_method}
+        for site, (clazz, method, _, slot) in enumerate(program.calls):
+            self.globals[f'_site{site}'] = make_site(clazz, method, slot)
+
+    def run(self, max_steps=None):
+        if max_steps is not None:
+            # Compiled code runs outside the instruction count
+            self.dispatch[JUMP] = VM.op_jump.__get__(self)
+            self.dispatch[CALL_USER] = VM.op_call_user.__get__(self)
+        return super().run(max_steps)
+
+    def build(self, kind, offset, translate):
+        """Compile translate()'s function; False (interpret) if it is unsupported"""
+        try:
+            writer = translate()
+            source = writer.source()
+        except Unsupported as e:
+            self.failed.append((kind, offset, str(e)))
+            return False
+        self.globals.update(writer.constants)
+        exec(compile(source, f'<tier {writer.name}>', 'exec'), self.globals)
+        self.compiled.append((kind, offset, source))
+        return self.globals[writer.name]
+
+    def compile_method(self, index):
+        code = self.build('method', self.program.methods[index][1],
+                          lambda: self.translator.method(index))
+        self.method_code[index] = code
+        return code
+
+    def compile_loop(self, back_edge):
+        code = self.build('loop', self.program.args[back_edge],
+                          lambda: self.translator.loop(back_edge))
+        self.loop_code[back_edge] = code
+        return code
+
+    def call_method(self, index, args):
+        """Call user method index from compiled code"""
+        code = self.method_code[index]
+        if code is None:
+            self.call_counts[index] += 1
+            if self.call_counts[index] >= self.threshold:
+                code = self.compile_method(index)
+        if code:
+            return code(args)
+        return self.invoke(index, args)
+
+    def invoke(self, index, args):
+        """Interpret user method index to its return and give back the value"""
+        saved_pc = self.pc
+        depth = len(self.frames)
+        self.stack.extend(args)
+        self.frames.append((-1, self.locals))
+        self.pc = self.program.methods[index][1]
+        ops, code_args, dispatch, frames = self.program.ops, self.program.args, self.dispatch, self.frames
+        steps = 0
+        while len(frames) > depth:
+            pc = self.pc
+            self.pc = pc + 1
+            dispatch[ops[pc]](code_args[pc])
+            steps += 1
+        self.steps += steps
+        self.pc = saved_pc
+        return self.stack.pop()
+
+    def op_call_user(self, arg):
+        code = self.method_code[arg]
+        if code is None:
+            self.call_counts[arg] += 1
+            if self.call_counts[arg] < self.threshold:
+                VM.op_call_user(self, arg)
+                return
+            code = self.compile_method(arg)
+        if code is False:
+            VM.op_call_user(self, arg)
+            return
+        arity = self.program.methods[arg][2]
+        stack = self.stack
+        if arity:
+            args = stack[-arity:]
+            del stack[-arity:]
+        else:
+            args = []
+        stack.append(code(args))
+
+    def op_jump(self, arg):
+        pc = self.pc - 1
+        if arg > pc:
+            self.pc = arg
+            return
+        code = self.loop_code.get(pc)
+        if code is None:
+            self.loop_counts[pc] += 1
+            if self.loop_counts[pc] < self.threshold:
+                self.pc = arg
+                return
+            code = self.compile_loop(pc)
+        if code is False:
+            self.pc = arg
+            return
+        result = code(self.locals)
+        if result.__class__ is int:
+            self.pc = result
+        else:
+            # The loop returned from its method
+            self.stack.append(result[0])
+            self.op_return(1)
+
+    def tier_stats(self):
+        names = {entry: name for name, entry, _ in self.program.methods}
+        lines = [f'tiering: {len(self.compiled)} regions compiled, {len(self.failed)} left to '
+                 f'the interpreter (threshold {self.threshold})']
+        for kind, offset, _ in self.compiled:
+            lines.append(f'  compiled {kind} {names[offset] if kind == "method" else f"at pc {offset}"}')
+        for kind, offset, reason in self.failed:
+            lines.append(f'  interpreted {kind} at pc {offset}: {reason}')
+        return '\n'.join(lines)
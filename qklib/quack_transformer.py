@@ -1,19 +1,33 @@
 from lark import Transformer
+from quack_classes import ROOT_CLASS, load_class_table, normalize_method
 from quack_ast import (Add, And, Assign, Block, Boolean, Div, Equal, Float,
                        FuncCall, FuncDef, GreaterThan, GreaterThanOrEqual, If,
                        Int, LessThan, LessThanOrEqual, MethodCall, Mul, Not,
                        NotEqual, Or, Print, Return, String, Sub, Var, While)
 
+# Return types of the builtin methods, per class; classes the table does
+# not list (Float) only get the methods they inherit from Obj
+CLASSES = load_class_table()
+
 
 #将parser生成的parse tree转换成AST
 class QuackTransformer(Transformer):
     def __init__(self):
         self.symbols = {}
+        # Iterator over the source line of every statement in reduction
+        # order, when a line table is wanted (see quack_parser.statement_lines)
+        self.statement_lines = None
 
     def assignment(self, items):
         var = str(items[0])
         vartype = str(items[1])
         expr = items[2]
+        # Instruction selection trusts declared types, so a builtin-typed
+        # variable only takes values proven to have that type
+        expr_type = self.get_type(expr)
+        if vartype in ('Int', 'Float', 'String', 'Bool') and expr_type != vartype:
+            raise TypeError(f"Type mismatch in assignment to {var}: "
+                            f"declared {vartype}, got {expr_type}")
         self.symbols[var] = vartype
         return Assign(var, vartype, expr)
     
@@ -71,6 +85,15 @@ class QuackTransformer(Transformer):
             raise TypeError(f"Type mismatch: expected {expected_types}, got{left_type} and {right_type}")
     
     def get_type(self, node):
+        # Each node's type is inferred once and kept on the node, so checking
+        # a long operator chain does not re-walk the subtrees below it
+        node_type = getattr(node, 'inferred_type', None)
+        if node_type is None:
+            node_type = self.infer_type(node)
+            node.inferred_type = node_type
+        return node_type
+
+    def infer_type(self, node):
         if isinstance(node, Var):
             return self.symbols.get(node.name, 'Unknown')
         elif isinstance(node, Int):
@@ -84,7 +107,7 @@ class QuackTransformer(Transformer):
         elif isinstance(node, FuncCall):
             return self.symbols.get(node.func_name, {}).get('return_type', 'Unknown')
         elif isinstance(node, MethodCall):
-            return 'Obj'  # 暂时处理
+            return self.method_type(self.get_type(node.obj), node.method_name)
         elif isinstance(node, (Add, Sub, Mul, Div)):
             left_type = self.get_type(node.left)
             right_type = self.get_type(node.right)
@@ -99,6 +122,11 @@ class QuackTransformer(Transformer):
         else:
             return 'Unknown'
 
+    def method_type(self, clazz, method):
+        _, methods = CLASSES.get(clazz, CLASSES[ROOT_CLASS])
+        signature = methods.get(normalize_method(method))
+        return signature['ret'] if signature else 'Obj'
+
     def lt(self, items):
         left = items[0]
         right = items[1]
@@ -151,11 +179,14 @@ class QuackTransformer(Transformer):
         if len(args) != len(func_info['params']):
             raise TypeError(f"Expected {len(func_info['params'])} arguments, got {len(args)}")
         for arg, param in zip(args, func_info['params']):
-            self.check_types(arg, param[1], (param[1],))
+            arg_type = self.get_type(arg)
+            if arg_type != param[1]:
+                raise TypeError(f"Type mismatch in argument '{param[0]}': expected {param[1]}, got {arg_type}")
         return FuncCall(func_name, args)
     
     def method_call(self, items):
-        obj = items[0]
+        obj = self.var([items[0]])
+        self.get_type(obj)
         method_name = str(items[1])
         args = items[2:]
         return MethodCall(obj, method_name, args)
@@ -221,6 +252,8 @@ class QuackTransformer(Transformer):
         return Block(items)
     
     def statement(self, items):
+        if self.statement_lines is not None:
+            items[0].line = next(self.statement_lines)
         return items[0]
     
     def start(self, items):
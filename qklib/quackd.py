@@ -0,0 +1,269 @@
+"""quackd: long-lived Quack compile server on a Unix domain socket.
+
+The server keeps the LALR parser from quack_parser.py and a
+memory-bounded cache of recent sources in memory, so a compile costs a
+parse of the request rather than a Python + Lark start.  A cache entry
+holds a source's parsed and type-checked tree, its symbols and the code
+generated from it at each -O level asked for (the AST passes never
+modify the tree), so `check` stops after type checking and a later
+`compile` of the same text starts from the checked tree.  Requests and
+responses are one JSON object per line:
+
+    {"op": "compile", "source": "/abs/prog.qk", "output": "/abs/prog.qko", "format": "qko"}
+    {"op": "compile", "text": "a: Int = 1;"}            -> {"ok": true, "code": "..."}
+    {"op": "compile", "text": "...", "opt": 2}         optimization level (default 1)
+    {"op": "check", "source": "/abs/prog.qk"}           -> {"ok": true, "symbols": {...}}
+    {"op": "stats"}
+    {"op": "shutdown"}
+
+Failures come back as {"ok": false, "error": "..."}.  When more than
+--max-pending requests are in flight, new ones are refused with
+"server busy" instead of queueing without bound.
+
+Usage:
+    python3 qklib/quackd.py [--socket PATH] [--max-pending N] [--cache-mb M]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import quack_parser
+from quack_optimizer import DEFAULT_LEVEL
+
+
+def default_socket_path():
+    if os.environ.get('QUACK_SOCKET'):
+        return os.environ['QUACK_SOCKET']
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir:
+        return os.path.join(runtime_dir, 'quackd.sock')
+    return f'/tmp/quackd-{os.getuid()}.sock'
+
+
+def tree_bytes(tree):
+    """Approximate memory held by an AST: its nodes, lists and leaf values"""
+    total = 0
+    seen = set()
+    pending = [tree]
+    while pending:
+        node = pending.pop()
+        if node is None or id(node) in seen:
+            continue
+        seen.add(id(node))
+        total += sys.getsizeof(node)
+        if isinstance(node, (list, tuple)):
+            pending.extend(node)
+            continue
+        for cls in type(node).__mro__:
+            for field in getattr(cls, '__slots__', ()):
+                pending.append(getattr(node, field, None))
+    return total
+
+
+class Unit:
+    """A checked source: its tree, its symbols and code per -O level"""
+    def __init__(self, text, tree, symbols):
+        self.tree = tree
+        self.symbols = symbols
+        self.code = {}
+        self.base_size = len(text) + tree_bytes(tree) + len(json.dumps(symbols))
+
+    def size(self):
+        return self.base_size + sum(len(code) for code in self.code.values())
+
+
+class CompileCache:
+    """LRU of recent sources keyed by their hash, bounded in bytes.
+    An entry is charged for its source text, checked tree, symbols and
+    generated code.
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, value, size):
+        if key in self.entries:
+            self.bytes -= self.entries.pop(key)[1]
+        if size > self.max_bytes:
+            return
+        self.entries[key] = (value, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, (_, old_size) = self.entries.popitem(last=False)
+            self.bytes -= old_size
+
+    def stats(self):
+        return {'entries': len(self.entries), 'bytes': self.bytes,
+                'max_bytes': self.max_bytes, 'hits': self.hits, 'misses': self.misses}
+
+
+class CompileService:
+    def __init__(self, max_pending, cache_bytes):
+        self.cache = CompileCache(cache_bytes)
+        self.pending = threading.BoundedSemaphore(max_pending)
+        # The parser and its transformer carry state, so compiles run one at a time
+        self.parser_lock = threading.Lock()
+        self.counters = {'requests': 0, 'compiles': 0, 'checks': 0, 'errors': 0, 'rejected': 0}
+        self.counter_lock = threading.Lock()
+        self.started = time.time()
+
+    def count(self, name):
+        with self.counter_lock:
+            self.counters[name] += 1
+
+    def checked(self, text):
+        """The Unit for text, parsed and type-checked unless seen recently;
+        call with parser_lock held
+        """
+        key = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        unit = self.cache.get(key)
+        if unit is None:
+            symbols = {}
+            tree = quack_parser.parse_with_symbols(text, symbols)
+            unit = Unit(text, tree, symbols)
+            self.cache.put(key, unit, unit.size())
+        return key, unit
+
+    def check_text(self, text):
+        """The symbols of text, without generating code"""
+        with self.parser_lock:
+            return self.checked(text)[1].symbols
+
+    def compile_text(self, text, level=DEFAULT_LEVEL):
+        """Returns (code, symbols), from the cache when the text was seen recently"""
+        with self.parser_lock:
+            key, unit = self.checked(text)
+            if level not in unit.code:
+                codegen, _ = quack_parser.compile_tree(unit.tree, level)
+                unit.code[level] = codegen.get_code()
+                self.cache.put(key, unit, unit.size())
+            return unit.code[level], unit.symbols
+
+    def handle(self, request):
+        op = request.get('op')
+        if op == 'stats':
+            return {'ok': True, 'stats': self.stats()}
+        if op not in ('compile', 'check'):
+            raise ValueError(f'unknown op {op!r}')
+        if 'text' in request:
+            text = request['text']
+        else:
+            with open(request['source']) as source:
+                text = source.read()
+        if op == 'check':
+            symbols = self.check_text(text)
+            self.count('checks')
+            return {'ok': True, 'symbols': symbols}
+        code, _ = self.compile_text(text, int(request.get('opt', DEFAULT_LEVEL)))
+        self.count('compiles')
+        if request.get('output'):
+            quack_parser.write_output(code, request['output'], request.get('format', 'asm'))
+            return {'ok': True}
+        return {'ok': True, 'code': code}
+
+    def stats(self):
+        return dict(self.counters, uptime=time.time() - self.started, cache=self.cache.stats())
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        service = self.server.service
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            service.count('requests')
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                self.reply({'ok': False, 'error': f'bad request: {e}'})
+                continue
+            if request.get('op') == 'shutdown':
+                self.reply({'ok': True})
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+                return
+            if not service.pending.acquire(blocking=False):
+                service.count('rejected')
+                self.reply({'ok': False, 'error': 'server busy'})
+                continue
+            try:
+                response = service.handle(request)
+            except Exception as e:
+                service.count('errors')
+                response = {'ok': False, 'error': f'{e.__class__.__name__}: {e}'}
+            finally:
+                service.pending.release()
+            self.reply(response)
+
+    def reply(self, response):
+        self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+        self.wfile.flush()
+
+
+class QuackServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def remove_stale_socket(path):
+    """Remove a socket file left behind by a dead server; refuse to start twice"""
+    if not os.path.exists(path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except OSError:
+        os.unlink(path)
+    else:
+        raise SystemExit(f'quackd is already listening on {path}')
+    finally:
+        probe.close()
+
+
+def cli():
+    cli_parser = argparse.ArgumentParser(description="Quack compile server")
+    cli_parser.add_argument("--socket", default=default_socket_path(),
+                            help="Unix socket path (default: $QUACK_SOCKET, else a per-user path)")
+    cli_parser.add_argument("--max-pending", type=int, default=8,
+                            help="requests allowed in flight before new ones are refused")
+    cli_parser.add_argument("--cache-mb", type=float, default=64,
+                            help="memory budget for recently checked and compiled sources")
+    return cli_parser.parse_args()
+
+
+def main():
+    args = cli()
+    remove_stale_socket(args.socket)
+    service = CompileService(args.max_pending, int(args.cache_mb * 2**20))
+    with QuackServer(args.socket, RequestHandler) as server:
+        server.service = service
+        os.chmod(args.socket, 0o600)
+        print(f'quackd listening on {args.socket}', file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.unlink(args.socket)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,605 @@
+"""Stack VM for the assembly produced by QuackCodeGenerator.
+
+The text assembly is translated once, at load time, into flat buffers:
+opcodes live in a bytearray and operands in a parallel array('i').
+Constants, call targets and user methods are kept in side tables that
+operands index into, and labels are resolved to instruction offsets
+before anything runs.  The dispatch loop therefore never looks at a
+string; it indexes a handler table with the opcode byte.
+
+Programs can also be loaded from the binary object format written by
+quack_parser.py (see quack_object.py), which is mapped with mmap and
+run straight from the mapping.
+
+Usage:
+    python3 qklib/vm.py OBJ/temp.asm
+    python3 qklib/vm.py OBJ/temp.qko
+"""
+
+import argparse
+import ast
+import operator
+import sys
+import time
+from array import array
+from bisect import bisect_right
+
+from quack_builtins import load_table
+from quack_classes import ClassLayout, load_class_table, merge_tables
+from quack_object import is_object_file, read_object, write_object
+
+
+class VMError(Exception):
+    pass
+
+
+# Opcodes.  Every instruction is one opcode byte plus one int operand
+# (0 when the instruction takes none).
+HALT = 0
+ALLOC = 1
+CONST = 2
+LOAD = 3
+STORE = 4
+POP = 5
+JUMP = 6
+JUMP_IF = 7
+JUMP_IFNOT = 8
+CALL = 9
+CALL_USER = 10
+ENTER = 11
+RETURN = 12
+TEE = 13            # store without popping
+
+OPNAMES = ['halt', 'alloc', 'const', 'load', 'store', 'pop', 'jump',
+           'jump_if', 'jump_ifnot', 'call', 'call_user', 'enter', 'return', 'tee']
+
+# Type-specialized binary operators, chosen by the code generator when the
+# checker has proved both operand types.  They pop the right operand and
+# replace the left one without any method lookup.
+SPECIALIZED_OPS = ['iadd', 'isub', 'imul', 'idiv', 'fadd', 'fsub', 'fmul', 'fdiv', 'sconcat',
+                   'ilt', 'igt', 'ile', 'ige', 'ieq', 'ine',
+                   'flt', 'fgt', 'fle', 'fge', 'feq', 'fne', 'seq', 'sne']
+OPNAMES += SPECIALIZED_OPS
+
+# Superinstructions for the hottest sequences (see quack_peephole.FUSION_RULES):
+#   inc_local i          load i; const 1; iadd; store i
+#   load_load_add a b    load a; load b; iadd   (a and b packed as a << 16 | b)
+#   jump_ilt L ...       ilt; jump_if L, and the other Int comparisons
+CMP_JUMP_OPS = ['jump_ilt', 'jump_ile', 'jump_igt', 'jump_ige', 'jump_ieq', 'jump_ine']
+FUSED_OPS = ['inc_local', 'load_load_add'] + CMP_JUMP_OPS
+OPNAMES += FUSED_OPS
+OPCODES = {name: code for code, name in enumerate(OPNAMES)}
+
+JUMPS = frozenset([JUMP, JUMP_IF, JUMP_IFNOT] + [OPCODES[name] for name in CMP_JUMP_OPS])
+NO_OPERAND = frozenset([HALT, POP, ENTER] + [OPCODES[name] for name in SPECIALIZED_OPS])
+PACKED = frozenset([OPCODES['load_load_add']])
+
+# Free functions are compiled as methods of this class
+MAIN_CLASS = '$Main'
+
+
+def quack_str(value):
+    if value is True:
+        return 'true'
+    if value is False:
+        return 'false'
+    if value is None:
+        return 'nothing'
+    return str(value)
+
+
+def quack_print(value):
+    print(quack_str(value))
+    return None
+
+
+def int_divide(left, right):
+    # Quack integer division truncates toward zero
+    quotient = abs(left) // abs(right)
+    return quotient if (left >= 0) == (right >= 0) else -quotient
+
+
+# Builtin classes: name -> (super, {method: (arity, implementation)}).
+# Arity does not count the receiver.
+BUILTIN_CLASSES = {
+    'Obj': ('Obj', {
+        'print': (0, quack_print),
+        'string': (0, quack_str),
+        'equals': (1, operator.eq),
+        'notequals': (1, operator.ne),
+    }),
+    'Int': ('Obj', {
+        'plus': (1, operator.add),
+        'minus': (1, operator.sub),
+        'times': (1, operator.mul),
+        'divide': (1, int_divide),
+        'less': (1, operator.lt),
+        'greater': (1, operator.gt),
+        'atmost': (1, operator.le),
+        'atleast': (1, operator.ge),
+    }),
+    'Float': ('Obj', {
+        'plus': (1, operator.add),
+        'minus': (1, operator.sub),
+        'times': (1, operator.mul),
+        'divide': (1, operator.truediv),
+        'less': (1, operator.lt),
+        'greater': (1, operator.gt),
+        'atmost': (1, operator.le),
+        'atleast': (1, operator.ge),
+    }),
+    'String': ('Obj', {
+        'plus': (1, operator.add),
+        'less': (1, operator.lt),
+        'greater': (1, operator.gt),
+        'atmost': (1, operator.le),
+        'atleast': (1, operator.ge),
+    }),
+    'Bool': ('Obj', {}),
+    'Nothing': ('Obj', {}),
+}
+
+# Implementations of the specialized opcodes; the same functions the
+# generic builtin methods use, so both paths give identical results
+SPECIALIZED_IMPLS = {
+    'iadd': operator.add, 'isub': operator.sub, 'imul': operator.mul, 'idiv': int_divide,
+    'fadd': operator.add, 'fsub': operator.sub, 'fmul': operator.mul, 'fdiv': operator.truediv,
+    'sconcat': operator.add,
+    'ilt': operator.lt, 'igt': operator.gt, 'ile': operator.le, 'ige': operator.ge,
+    'ieq': operator.eq, 'ine': operator.ne,
+    'flt': operator.lt, 'fgt': operator.gt, 'fle': operator.le, 'fge': operator.ge,
+    'feq': operator.eq, 'fne': operator.ne,
+    'seq': operator.eq, 'sne': operator.ne,
+}
+
+# Runtime class of a value, keyed by its exact Python type
+CLASS_OF = {int: 'Int', float: 'Float', str: 'String', bool: 'Bool', type(None): 'Nothing'}
+
+
+def flatten_methods(classes):
+    """Resolve inheritance once: class -> {method: (arity, implementation)}"""
+    flat = {}
+
+    def resolve(name):
+        if name not in flat:
+            super_class, methods = classes[name]
+            merged = dict(resolve(super_class)) if super_class != name else {}
+            merged.update(methods)
+            flat[name] = merged
+        return flat[name]
+
+    for name in classes:
+        resolve(name)
+    return flat
+
+
+METHODS = flatten_methods(BUILTIN_CLASSES)
+
+
+# Class layout: the hierarchy and signatures of builtin_methods.json merged
+# with the classes implemented above.  Calls are compiled to its slots, which
+# for the builtin selectors are the ones precompiled into builtin_table.py.
+LAYOUT = ClassLayout(merge_tables(load_class_table(), BUILTIN_CLASSES),
+                     load_table().SELECTORS)
+
+
+def build_vtables(layout):
+    """Python type of a value -> implementation per slot (None: not understood)"""
+    names = sorted(layout.selectors, key=layout.selectors.get)
+    vtables = {}
+    for py_type, clazz in CLASS_OF.items():
+        vtable = []
+        for slot, owner in enumerate(layout.vtables[clazz]):
+            # The JSON table re-declares inherited methods, so implementations
+            # come from the resolved runtime methods of the class itself
+            entry = METHODS[clazz].get(names[slot]) if owner else None
+            vtable.append(entry[1] if entry else None)
+        vtables[py_type] = vtable
+    return vtables
+
+
+VTABLES = build_vtables(LAYOUT)
+
+
+def builtin_arity(clazz, method):
+    if clazz not in METHODS or method not in METHODS[clazz]:
+        raise VMError(f'unknown method {clazz}: {method}')
+    return METHODS[clazz][method][0]
+
+
+class Program:
+    """Assembled program: parallel opcode/operand buffers plus side tables"""
+    def __init__(self):
+        self.ops = bytearray()
+        self.args = array('i')
+        self.consts = []
+        self.calls = []         # (class, method, arity, slot) per CALL site
+        self.methods = []       # [name, entry offset, arity] for CALL_USER
+        self.method_index = {}
+        self.labels = {}
+        self.lines = []         # (offset, source line) where each .line starts
+
+    def line_at(self, pc):
+        """Source line of the instruction at pc, or None without a line table"""
+        i = bisect_right(self.lines, (pc, sys.maxsize)) - 1
+        return self.lines[i][1] if i >= 0 else None
+
+    def __len__(self):
+        return len(self.ops)
+
+    def emit(self, op, arg=0):
+        self.ops.append(op)
+        self.args.append(arg)
+
+    def disassemble(self):
+        lines = []
+        for pc, op in enumerate(self.ops):
+            arg = self.args[pc]
+            if op == CONST:
+                text = repr(self.consts[arg])
+            elif op == CALL:
+                text = '%s: %s' % self.calls[arg][:2]
+            elif op == CALL_USER:
+                text = self.methods[arg][0]
+            elif op in NO_OPERAND:
+                text = ''
+            elif op in PACKED:
+                text = f'{arg >> 16} {arg & 0xffff}'
+            else:
+                text = str(arg)
+            lines.append(f'{pc:5d}  {OPNAMES[op]} {text}'.rstrip())
+        return '\n'.join(lines)
+
+
+def parse_const(text):
+    if text == 'true':
+        return True
+    if text == 'false':
+        return False
+    if text == 'nothing':
+        return None
+    if text.startswith('"'):
+        return ast.literal_eval(text)
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+
+def assemble(text):
+    """Translate text assembly into a Program.
+
+    Labels and method names are resolved here, in one pass with
+    back-patching, so forward references cost nothing at run time.
+    """
+    prog = Program()
+    const_index = {}
+    fixups = []           # (offset, label, line number)
+
+    def intern_const(value):
+        key = (type(value), value)
+        if key not in const_index:
+            const_index[key] = len(prog.consts)
+            prog.consts.append(value)
+        return const_index[key]
+
+    def user_method(name):
+        if name not in prog.method_index:
+            prog.method_index[name] = len(prog.methods)
+            prog.methods.append([name, -1, 0])
+        return prog.method_index[name]
+
+    current_method = None
+    for lineno, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if line.endswith(':') and ' ' not in line:
+            label = line[:-1]
+            if label in prog.labels:
+                raise VMError(f'line {lineno}: duplicate label {label}')
+            prog.labels[label] = len(prog)
+            continue
+        mnemonic, _, operand = line.partition(' ')
+        operand = operand.strip()
+        if mnemonic == '.method':
+            current_method = prog.methods[user_method(operand)]
+            if current_method[1] >= 0:
+                raise VMError(f'line {lineno}: redefinition of method {operand}')
+            current_method[1] = len(prog)
+        elif mnemonic == '.line':
+            prog.lines.append((len(prog), int(operand)))
+        elif mnemonic == '.args':
+            if current_method is None:
+                raise VMError(f'line {lineno}: .args outside of a method')
+            current_method[2] = len([a for a in operand.split(',') if a.strip()])
+        elif mnemonic == 'const':
+            prog.emit(CONST, intern_const(parse_const(operand)))
+        elif mnemonic == 'call':
+            clazz, _, method = operand.partition(':')
+            clazz, method = clazz.strip(), method.strip()
+            if clazz == MAIN_CLASS:
+                prog.emit(CALL_USER, user_method(method))
+                continue
+            try:
+                arity = builtin_arity(clazz, method)
+            except VMError as e:
+                raise VMError(f'line {lineno}: {e}')
+            # One entry per site, so every site has its own inline cache
+            prog.emit(CALL, len(prog.calls))
+            prog.calls.append((clazz, method, arity, LAYOUT.slot(method)))
+        elif mnemonic in OPCODES:
+            op = OPCODES[mnemonic]
+            if op in JUMPS:
+                fixups.append((len(prog), operand, lineno))
+                prog.emit(op)
+            elif op in NO_OPERAND:
+                prog.emit(op)
+            elif op == RETURN:
+                prog.emit(op, int(operand) if operand else 0)
+            elif op in PACKED:
+                first, second = (int(slot) for slot in operand.split())
+                prog.emit(op, first << 16 | second)
+            else:
+                prog.emit(op, int(operand))
+        else:
+            raise VMError(f'line {lineno}: unknown instruction {line!r}')
+    prog.emit(HALT)
+
+    for offset, label, lineno in fixups:
+        if label not in prog.labels:
+            raise VMError(f'line {lineno}: undefined label {label}')
+        prog.args[offset] = prog.labels[label]
+    for name, entry, _ in prog.methods:
+        if entry < 0:
+            raise VMError(f'call to undefined method {MAIN_CLASS}: {name}')
+    return prog
+
+
+class VM:
+    def __init__(self, program):
+        self.program = program
+        self.stack = []
+        self.locals = []
+        self.frames = []        # (return pc, caller locals)
+        self.pc = 0
+        self.steps = 0
+        self.running = True
+        # Monomorphic inline cache per call site: the receiver type last seen
+        # there and the implementation it resolved to
+        sites = len(program.calls)
+        self.ic_types = [None] * sites
+        self.ic_impls = [None] * sites
+        self.ic_hits = [0] * sites
+        self.ic_misses = [0] * sites
+        # Handler table indexed by opcode
+        self.dispatch = [None] * len(OPNAMES)
+        for code, name in enumerate(OPNAMES):
+            self.dispatch[code] = getattr(self, 'op_' + name)
+
+    def run(self, max_steps=None):
+        """Run until halt, or until max_steps instructions have executed.
+        Returns the number of instructions executed by this call.
+        """
+        ops = self.program.ops
+        args = self.program.args
+        dispatch = self.dispatch
+        limit = -1 if max_steps is None else max_steps
+        steps = 0
+        while self.running and steps != limit:
+            pc = self.pc
+            self.pc = pc + 1
+            dispatch[ops[pc]](args[pc])
+            steps += 1
+        self.steps += steps
+        return steps
+
+    def op_halt(self, arg):
+        self.running = False
+        self.pc -= 1
+
+    def op_alloc(self, arg):
+        self.locals.extend([None] * arg)
+
+    def op_const(self, arg):
+        self.stack.append(self.program.consts[arg])
+
+    def op_load(self, arg):
+        self.stack.append(self.locals[arg])
+
+    def op_store(self, arg):
+        self.locals[arg] = self.stack.pop()
+
+    def op_tee(self, arg):
+        self.locals[arg] = self.stack[-1]
+
+    def op_inc_local(self, arg):
+        self.locals[arg] += 1
+
+    def op_load_load_add(self, arg):
+        local_vars = self.locals
+        self.stack.append(local_vars[arg >> 16] + local_vars[arg & 0xffff])
+
+    def op_pop(self, arg):
+        self.stack.pop()
+
+    def op_jump(self, arg):
+        self.pc = arg
+
+    def op_jump_if(self, arg):
+        if self.stack.pop():
+            self.pc = arg
+
+    def op_jump_ifnot(self, arg):
+        if not self.stack.pop():
+            self.pc = arg
+
+    def op_call(self, arg):
+        clazz, method, arity, slot = self.program.calls[arg]
+        stack = self.stack
+        receiver = stack[-arity - 1]
+        # Virtual dispatch on the receiver's runtime class, through the site's cache
+        receiver_type = type(receiver)
+        if self.ic_types[arg] is receiver_type:
+            impl = self.ic_impls[arg]
+            self.ic_hits[arg] += 1
+        else:
+            impl = VTABLES[receiver_type][slot]
+            if impl is None:
+                raise VMError(f'{quack_str(receiver)} does not understand {clazz}: {method}')
+            self.ic_types[arg] = receiver_type
+            self.ic_impls[arg] = impl
+            self.ic_misses[arg] += 1
+        if arity:
+            call_args = stack[-arity:]
+            del stack[-arity - 1:]
+            stack.append(impl(receiver, *call_args))
+        else:
+            stack[-1] = impl(receiver)
+
+    def op_call_user(self, arg):
+        self.frames.append((self.pc, self.locals))
+        self.pc = self.program.methods[arg][1]
+
+    def op_enter(self, arg):
+        self.locals = []
+
+    def op_return(self, arg):
+        if not self.frames:
+            self.op_halt(arg)
+            return
+        value = self.stack.pop() if arg else None
+        self.pc, self.locals = self.frames.pop()
+        self.stack.append(value)
+
+
+    def cache_stats(self):
+        """Inline cache hits and misses, in total and per call site"""
+        sites = [(clazz, method, hits, misses) for (clazz, method, _, _), hits, misses
+                 in zip(self.program.calls, self.ic_hits, self.ic_misses)]
+        return {'hits': sum(self.ic_hits), 'misses': sum(self.ic_misses), 'sites': sites}
+
+
+def binary_handler(impl):
+    def op(self, arg):
+        stack = self.stack
+        right = stack.pop()
+        stack[-1] = impl(stack[-1], right)
+    return op
+
+
+def cmp_jump_handler(compare):
+    def op(self, arg):
+        stack = self.stack
+        right = stack.pop()
+        if compare(stack.pop(), right):
+            self.pc = arg
+    return op
+
+
+for _name in SPECIALIZED_OPS:
+    setattr(VM, 'op_' + _name, binary_handler(SPECIALIZED_IMPLS[_name]))
+for _name in CMP_JUMP_OPS:
+    setattr(VM, 'op_' + _name, cmp_jump_handler(SPECIALIZED_IMPLS[_name[5:]]))
+
+
+def load_object(path):
+    """Load a .qko file; the code buffers stay views over the mmap"""
+    obj = read_object(path)
+    prog = Program()
+    prog.ops = obj.ops
+    prog.args = obj.args
+    prog.buffer = obj.buffer
+    prog.consts = obj.consts
+    prog.calls = []
+    for clazz, method, slot in obj.calls:
+        if LAYOUT.slot(method) != slot:
+            raise VMError(f'{path} was compiled against a different class layout; recompile it')
+        prog.calls.append((clazz, method, builtin_arity(clazz, method), slot))
+    prog.methods = [list(method) for method in obj.methods]
+    prog.method_index = {method[0]: i for i, method in enumerate(prog.methods)}
+    return prog
+
+
+def save_object(program, path):
+    write_object(path, program.ops, program.args, program.consts,
+                 [(clazz, method, slot) for clazz, method, _, slot in program.calls],
+                 program.methods)
+
+
+def load(path):
+    """Load either a binary object file or text assembly"""
+    if is_object_file(path):
+        return load_object(path)
+    with open(path) as source:
+        return assemble(source.read())
+
+
+def cli():
+    cli_parser = argparse.ArgumentParser(description="Run Quack assembly")
+    cli_parser.add_argument("program", help="assembly (.asm) or object (.qko) file produced by quack_parser.py")
+    cli_parser.add_argument("--max-steps", type=int, default=None,
+                            help="stop after this many instructions")
+    cli_parser.add_argument("--stats", action="store_true",
+                            help="report instruction count and throughput on stderr")
+    cli_parser.add_argument("--profile", action="store_true",
+                            help="count instructions per opcode, method, loop and source line "
+                                 "and report them on stderr")
+    cli_parser.add_argument("--collapsed", metavar="FILE",
+                            help="with --profile, write collapsed stacks for flamegraph.pl")
+    cli_parser.add_argument("--profile-top", type=int, default=15,
+                            help="rows per profile table (default %(default)s)")
+    cli_parser.add_argument("--tier", action="store_true",
+                            help="compile hot methods and loops to Python (see quack_tier.py)")
+    cli_parser.add_argument("--tier-threshold", type=int, default=None, metavar="N",
+                            help="calls or loop iterations before a region is compiled")
+    cli_parser.add_argument("--tier-source", metavar="FILE",
+                            help="with --tier, write the generated Python to FILE")
+    cli_parser.add_argument("--disassemble", action="store_true",
+                            help="print the encoded program instead of running it")
+    return cli_parser.parse_args()
+
+
+def main():
+    args = cli()
+    program = load(args.program)
+    if args.disassemble:
+        print(program.disassemble())
+        return
+    if args.tier and (args.profile or args.collapsed):
+        sys.exit('--tier cannot be combined with --profile')
+    if args.tier:
+        from quack_tier import DEFAULT_THRESHOLD, TieredVM
+        vm = TieredVM(program, args.tier_threshold or DEFAULT_THRESHOLD)
+    else:
+        vm = VM(program)
+    profiler = None
+    if args.profile or args.collapsed:
+        from quack_profile import Profiler
+        profiler = Profiler(program)
+    start = time.perf_counter()
+    if profiler:
+        profiler.run(vm, args.max_steps)
+    else:
+        vm.run(args.max_steps)
+    elapsed = time.perf_counter() - start
+    if args.stats:
+        rate = vm.steps / elapsed if elapsed else float('inf')
+        print(f'{vm.steps} instructions in {elapsed:.4f}s ({rate:,.0f} instr/s)', file=sys.stderr)
+        cache = vm.cache_stats()
+        print(f"inline caches: {cache['hits']} hits, {cache['misses']} misses "
+              f"over {len(cache['sites'])} call sites", file=sys.stderr)
+        if args.tier:
+            print(vm.tier_stats(), file=sys.stderr)
+    if args.tier and args.tier_source:
+        with open(args.tier_source, 'w') as out:
+            out.write('\n'.join(source for _, _, source in vm.compiled))
+    if profiler and args.profile:
+        print(profiler.report(args.profile_top), file=sys.stderr)
+    if profiler and args.collapsed:
+        with open(args.collapsed, 'w') as out:
+            out.write('\n'.join(profiler.collapsed()) + '\n')
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 #!/bin/bash
 # Compile and run a Quack program
-python3 qklib/quack_parser.py "$1" > OBJ/temp.asm
-python3 qklib/vm.py OBJ/temp.asm
\ No newline at end of file
+mkdir -p OBJ
+python3 qklib/quack_client.py compile "$1" -o OBJ/temp.qko
+python3 qklib/vm.py OBJ/temp.qko
@@ -3,10 +3,15 @@
 import argparse
 import json
 import logging
+import os
 import sys
 from typing import Callable, List
 
-from lark import Lark, Transformer
+from lark import Lark
+from lark.visitors import Transformer_NonRecursive
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'qklib'))
+from quack_builtins import SymbolTable  # noqa: E402
 
 logging.basicConfig()
 log = logging.getLogger(__name__)
@@ -29,27 +34,48 @@ def ignore(node: "ASTNode", visit_state):
 def flatten(m: list):
     """Flatten nested lists into a single level of list"""
     flat = []
-    for item in m:
-        if isinstance(item, list):
-            flat += flatten(item)
-        else:
+    pending = [iter(m)]     # explicit stack, so nesting depth is not limited by recursion
+    while pending:
+        for item in pending[-1]:
+            if isinstance(item, list):
+                pending.append(iter(item))
+                break
             flat.append(item)
+        else:
+            pending.pop()
     return flat
 
 
 class ASTNode:
     """Abstract base class"""
+    _children = ()
+
     def __init__(self):
         self.children = []    # Internal nodes should set this to list of child nodes
 
+    # Children are flattened once, when they are set, rather than on every walk
+    @property
+    def children(self) -> List["ASTNode"]:
+        return self._children
+
+    @children.setter
+    def children(self, nodes: list):
+        self._children = flatten(nodes)
+
     # Visitor-like functionality for walking over the AST. Define default methods in ASTNode
     # and specific overrides in node types in which the visitor should do something
     def walk(self, visit_state, pre_visit: Callable =ignore, post_visit: Callable=ignore):
-        pre_visit(self, visit_state)
-        for child in flatten(self.children):
-            log.debug(f"Visiting ASTNode of class {child.__class__.__name__}")
-            child.walk(visit_state, pre_visit, post_visit)
-        post_visit(self, visit_state)
+        """Pre- and post-order traversal with an explicit stack (no recursion)"""
+        stack = [(self, False)]
+        while stack:
+            node, done = stack.pop()
+            if done:
+                post_visit(node, visit_state)
+                continue
+            log.debug("Visiting ASTNode of class %s", node.__class__.__name__)
+            pre_visit(node, visit_state)
+            stack.append((node, True))
+            stack.extend((child, False) for child in reversed(node.children))
 
     # Example walk to gather method signatures
     def method_table_visit(self, visit_state: dict):
@@ -216,8 +242,8 @@ class CondNode(ASTNode):
 
 
 
-class ASTBuilder(Transformer):
-    """Translate Lark tree into my AST structure"""
+class ASTBuilder(Transformer_NonRecursive):
+    """Translate Lark tree into my AST structure (iteratively, so deep trees are fine)"""
 
     def program(self, e):
         log.debug("->program")
@@ -312,11 +338,11 @@ def main():
     ast: ASTNode = ASTBuilder().transform(tree)
     print(ast)
     # Build symbol table, starting with the hard-coded json table
-    # provided by Pranav.  We'll follow that structure for the rest
-    builtins = open("qklib/builtin_methods.json")
-    symtab = json.load(builtins)
+    # provided by Pranav (precompiled by quack_builtins.py).  We'll follow
+    # that structure for the rest; user classes go in a layer on top.
+    symtab = SymbolTable()
     ast.walk(symtab, method_table_walk)
-    print(json.dumps(symtab,indent=4))
+    print(json.dumps(symtab.thaw(),indent=4))
 
 
 if __name__ == "__main__":
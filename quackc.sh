@@ -1,3 +1,10 @@
 #!/bin/bash
-# Compile a Quack program without running it
-python3 qklib/quack_parser.py "$1" > OBJ/temp.asm
+# Compile a Quack program without running it.
+# With several files (or globs), compile them all in parallel into OBJ/.
+# A single file goes through quackd when it is running (see qklib/quackd.py).
+mkdir -p OBJ
+if [ $# -gt 1 ]; then
+    python3 qklib/quack_batch.py "$@" -d OBJ
+else
+    python3 qklib/quack_client.py compile "$1" -o OBJ/temp.qko
+fi